@@ -1,22 +1,21 @@
 import sys
 import os
-from pymatgen.io.vasp import Potcar, Poscar
+import potcar
+import incar
 
 
 def get_zvals_from_potcar(potcar_path):
-    """从POTCAR文件中获取每个元素的ZVAL价电子数。"""
+    """从POTCAR文件中获取每个元素的ZVAL价电子数（只扫描头部行，结果按校验和缓存）。"""
     if not os.path.exists(potcar_path):
         raise FileNotFoundError(f"POTCAR 文件不存在：{potcar_path}")
-    potcar = Potcar.from_file(potcar_path)
-    return [float(pot.keywords['ZVAL']) for pot in potcar]
+    return potcar.read_zvals(potcar_path)
 
 
 def get_atom_counts_from_poscar(poscar_path):
-    """从POSCAR文件获取每种元素的原子数。"""
+    """从POSCAR文件头部读取每种元素的原子数，顺序与POTCAR一致。"""
     if not os.path.exists(poscar_path):
         raise FileNotFoundError(f"POSCAR 文件不存在：{poscar_path}")
-    structure = Poscar.from_file(poscar_path).structure
-    return [structure.composition[el] for el in structure.composition.elements]
+    return potcar.read_species_counts(poscar_path)[1]
 
 
 def calculate_nelect(zvals, atom_counts, net_charge):
@@ -26,24 +25,43 @@ def calculate_nelect(zvals, atom_counts, net_charge):
 
 
 def update_nelect_in_incar(incar_path, nelect):
-    """在INCAR文件中更新或添加NELECT参数。"""
+    """在INCAR文件中更新或添加NELECT参数（原子替换写入）。"""
     if not os.path.exists(incar_path):
         raise FileNotFoundError(f"INCAR 文件不存在：{incar_path}")
-    with open(incar_path, 'r') as file:
-        lines = file.readlines()
+    incar.edit(os.path.dirname(incar_path), [(incar.SET, "NELECT", nelect)])
 
-    updated = False
-    for i, line in enumerate(lines):
-        if line.strip().startswith('NELECT'):
-            lines[i] = f'  NELECT = {nelect}\n'
-            updated = True
-            break
 
-    if not updated:
-        lines.append(f'  NELECT = {nelect}\n')
-
-    with open(incar_path, 'w') as file:
-        file.writelines(lines)
+def compute_nelect(directories, net_charge):
+    """批量计算多个计算目录的 NELECT（不写文件），返回 {目录: NELECT}。"""
+    results = {}
+    for directory in directories:
+        # 获取POTCAR中的ZVAL和POSCAR中的原子数
+        zvals = get_zvals_from_potcar(os.path.join(directory, 'POTCAR'))
+        atom_counts = get_atom_counts_from_poscar(os.path.join(directory, 'POSCAR'))
+        if len(zvals) != len(atom_counts):
+            raise ValueError(f"{directory} 中 POTCAR 赝势数 {len(zvals)} 与 POSCAR 元素数 {len(atom_counts)} 不一致")
+        results[directory] = calculate_nelect(zvals, atom_counts, int(net_charge))
+    return results
+
+
+def update_nelect(MAT, net_charge, adsorbates, base_dir=None):
+    """
+    为每个 adsorbate（MAT 可为单个名称或列表）计算 NELECT 并写入 base_dir/adsorbate/MAT/INCAR，
+    返回 {(adsorbate, MAT): NELECT}。
+    """
+    if base_dir is None:
+        base_dir = os.path.abspath(os.path.dirname(__file__))  # 脚本所在目录
+    mats = [MAT] if isinstance(MAT, str) else list(MAT)
+    targets = {(adsorbate, mat): os.path.join(base_dir, adsorbate, mat) for adsorbate in adsorbates for mat in mats}
+    nelects = compute_nelect(targets.values(), net_charge)
+    results = {}
+    for target, directory in targets.items():
+        # 更新INCAR文件
+        incar_path = os.path.join(directory, 'INCAR')
+        update_nelect_in_incar(incar_path, nelects[directory])
+        print(f"NELECT = {nelects[directory]} has been written to {incar_path}")
+        results[target] = nelects[directory]
+    return results
 
 
 def main():
@@ -55,27 +73,7 @@ def main():
     MAT = sys.argv[1]
     net_charge = int(sys.argv[2])
     adsorbates = sys.argv[3:]
-
-    base_dir = os.path.abspath(os.path.dirname(__file__))  # 脚本所在目录
-
-    for adsorbate in adsorbates:
-        print(f"Processing adsorbate: {adsorbate}")
-
-        # 构造POTCAR、POSCAR和INCAR的路径
-        potcar_path = os.path.join(base_dir, adsorbate, MAT, 'POTCAR')
-        poscar_path = os.path.join(base_dir, adsorbate, MAT, 'POSCAR')
-        incar_path = os.path.join(base_dir, adsorbate, MAT, 'INCAR')
-
-        # 获取POTCAR中的ZVAL和POSCAR中的原子数
-        zvals = get_zvals_from_potcar(potcar_path)
-        atom_counts = get_atom_counts_from_poscar(poscar_path)
-
-        # 计算NELECT
-        nelect = calculate_nelect(zvals, atom_counts, net_charge)
-
-        # 更新INCAR文件
-        update_nelect_in_incar(incar_path, nelect)
-        print(f"NELECT = {nelect} has been written to {incar_path}")
+    update_nelect(MAT, net_charge, adsorbates)
 
 
 if __name__ == "__main__":
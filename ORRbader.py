@@ -1,21 +1,22 @@
 import numpy as np
 import os
 import subprocess
-import time
 import datetime
 import sys
 import glob
 import re
+import argparse
+import sqlite3
 from contextlib import contextmanager
-from pymatgen.analysis.adsorption import AdsorbateSiteFinder
-from pymatgen.io.vasp import Poscar
-from pymatgen.core import Lattice, Molecule, Structure
-from pymatgen.core.surface import generate_all_slabs
-from pymatgen.ext.matproj import MPRester
-from pymatgen.io.vasp.sets import MPRelaxSet
-from pymatgen.io.vasp.sets import MITRelaxSet
-from pymatgen.io.vasp.sets import MPNonSCFSet
-from pymatgen.io.vasp.inputs import Kpoints
+from bader import run_batch
+from slurm import wait_for_jobs, failed_jobs, submit_packed
+from status import check_calculation
+import calccache
+import potcar
+import throttle
+import tracing
+import tune
+import handoff
 import warnings
 
 warnings.simplefilter("ignore")
@@ -34,12 +35,10 @@ TASK_STATUS = {
 
 RCHECK_SCRIPT = "rcheck.sh"
 RELAX2_SCRIPT = "std-subvasp.sh"
+# 命中缓存所需的输出文件
+BADER_OUTPUTS = ("OUTCAR", "CHGCAR", "AECCAR0", "AECCAR2")
 
-MAT = sys.argv[1]  # MAT，例如 Fe, FePc, Fe2O3, Fe-MOF 等
-if len(sys.argv) > 2:
-    DIRS = sys.argv[2:]
-else:
-    DIRS = ["OOH", "OH", "O", "Support"]
+DEFAULT_DIRS = ["OOH", "OH", "O", "Support"]
 
 def log_info(message):
     print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
@@ -60,9 +59,9 @@ def change_directory(destination):
     finally:
         os.chdir(original_dir)
 
-def submit_job(identifier):
+def submit_job(identifier, cwd=None):
     try:
-        job_output = subprocess.check_output([RELAX2_SCRIPT, identifier]).decode()
+        job_output = subprocess.check_output([RELAX2_SCRIPT, identifier], cwd=cwd).decode()
         job_id_match = re.search(r'job (\d+)', job_output)
         if job_id_match:
             job_id = job_id_match.group(1)
@@ -72,71 +71,125 @@ def submit_job(identifier):
             log_error(f"Error: Failed to find job ID in output: {job_output}")
             return
     except subprocess.CalledProcessError as e:
-        error_exit(f"Error: Failed to submit job for {identifier}. Details: {e}")
+        raise RuntimeError(f"Failed to submit job for {identifier}. Details: {e}") from e
 
-def wait_for_job_completion(job_id):
-    log_info(f"Waiting for job {job_id} to complete...")
-    while True:
-        try:
-            job_status = subprocess.check_output(['squeue', '-j', job_id], stderr=subprocess.DEVNULL).decode()
-            if job_id not in job_status:
-                log_info(f"Job {job_id} has completed.")
-                break
-        except subprocess.CalledProcessError:
-            break
-        log_info(f"Job {job_id} is still running...")
-        time.sleep(300)
-
-# 计算 Bader 电荷
-def generate_bader(identifier):  # identifier 例如 "Support", "OOH", "OH", "O"
+# 计算 Bader 电荷：返回输入文件的写出目标 (structure, output_path, incar_set, kpoints_set)
+def prepare_bader(identifier, MAT):  # identifier 例如 "Support", "OOH", "OH", "O"
+    # pymatgen 导入耗时较长，只在生成输入文件时导入
+    from pymatgen.core import Structure
     input_path = os.path.join('..', identifier, MAT, 'CONTCAR')
     structure = Structure.from_file(input_path)
     output_path = os.path.join('..', identifier, '3-bader', MAT)
-    kpoints_set = {'reciprocal_density': 100}
+    # k 网格由晶格与目标 k 点间距确定（真空方向只取 Γ），NCORE/KPAR 由作业核数确定
+    kpoints_set = tune.kpoints(structure)
     incar_set = {
         'IBRION': -1, 'LAECHG': 'True', 'NSW': 0, 'LCHARG': True,
         'ALGO': "Normal", 'EDIFFG': -0.02, 'EDIFF': 0.00001, 'ENCUT': 500,
         'ISMEAR': 0, 'ISPIN': 2, 'ICHARG': 2, 'LWAVE': False, 'PREC': 'Normal',
-        'NCORE': 4, 'ISIF': 1, 'NELM': 200, 'LDAU': False
+        'ISIF': 1, 'NELM': 200, 'LDAU': False, **tune.parallel_settings(kpoints_set)
     }
-    Relax = MITRelaxSet(structure, user_incar_settings=incar_set, user_kpoints_settings=kpoints_set)
-    Relax.write_input(output_path)
+    return structure, output_path, incar_set, kpoints_set
+
+def generate_bader(identifier, MAT):
+    output_path = potcar.write_input(*prepare_bader(identifier, MAT))
     log_info(f"Bader input files written successfully to {output_path}.")
+    # 以结构优化的电荷密度与波函数为起点，减少自洽迭代次数
+    handoff.handoff(os.path.join('..', identifier, MAT), output_path)
 
-if __name__ == "__main__":
-    # 生成 Bader 输入文件
+# 多进程并行生成所有吸附物的 Bader 输入文件，POTCAR 由缓存链接
+def generate_all_bader(DIRS, MAT):
+    written = potcar.write_inputs([prepare_bader(DIR, MAT) for DIR in DIRS])
+    log_info(f"Bader input files written successfully to {len(written)} of {len(DIRS)} directories.")
+    if len(written) != len(DIRS):
+        error_exit("Failed to write Bader input files for some adsorbates.")
     for DIR in DIRS:
-        with change_directory(os.path.join("..", DIR)):
-            generate_bader(DIR)
-    # 提交 Bader 计算任务
-    runjob_ids = []
+        handoff.handoff(os.path.join('..', DIR, MAT), os.path.join('..', DIR, '3-bader', MAT))
+
+def bader_completed(DIR, MAT):
+    calc_dir = os.path.join("..", DIR, "3-bader", MAT)
+    result = check_calculation(calc_dir)
+    if result["errors"]:
+        log_error(f"Error: {calc_dir} reported {', '.join(result['errors'])}.")
+    return result["finished"]
+
+# 是否需要提交：已完成或命中缓存时返回 False
+def bader_pending(DIR, MAT):
+    if bader_completed(DIR, MAT):
+        log_info(f"Calculation for 3-bader {DIR} {MAT} successfully completed.")
+        return False
+    return not calccache.restore(os.path.join("..", DIR, "3-bader", MAT), required=BADER_OUTPUTS)
+
+# 提交单个 Bader 计算任务（受全局节流器的排队上限约束），已完成时返回 None
+def submit_bader(DIR, MAT):
+    if not bader_pending(DIR, MAT):
+        return None
+    log_info(f"Submitting 3-bader {DIR} {MAT}.")
+    return throttle.submit_job(submit_job, MAT, cwd=os.path.join("..", DIR, '3-bader'))
+
+# 将所有待计算的吸附物打包为一个 Slurm 数组作业（pack="array"）或一次分配中依次运行（pack="serial"），
+# 数组作业同时运行的任务数不超过全局节流器的 max_running
+def submit_bader_packed(DIRS, MAT, pack="array"):
+    pending = [os.path.join("..", DIR, "3-bader", MAT) for DIR in DIRS if bader_pending(DIR, MAT)]
+    # 数组作业的每个任务在队列中各占一个名额
+    job_ids = throttle.submit_job(submit_packed, pending, mode=pack, max_parallel=throttle.get_throttle().max_running,
+                                  slots=len(pending) if pack == "array" else 1)
+    return list(dict.fromkeys(job_ids.values()))
+
+# 分析计算结果：参考密度由 AECCAR0 + AECCAR2 在内存中求和，各吸附物并行分析；
+# 有吸附物未算完或分析失败时抛出 RuntimeError（已写出的结果仍会存入缓存）
+def analyze_bader(DIRS, MAT):
+    bader_dirs = []
     for DIR in DIRS:
-        outcar_path = os.path.join("..", DIR, "3-bader", MAT, "OUTCAR")
+        if bader_completed(DIR, MAT):
+            log_info(f"Analyzing 3-bader {DIR} {MAT}.")
+            bader_dirs.append(os.path.join("..", DIR, '3-bader', MAT))
+        else:
+            log_error(f"Error: 3-bader {DIR} {MAT} did not finish.")
+    written = run_batch(bader_dirs)
+    for acf_path in written:
         try:
-            if not os.path.isfile(outcar_path):
-                raise FileNotFoundError(f"File {outcar_path} not found")
-            check_output = subprocess.check_output(["grep", "-q", "Total CPU time", outcar_path],
-                                                   stderr=subprocess.STDOUT).decode()
-            log_info(f"Calculation for 3-bader {DIR} {MAT} successfully completed.")
-        except (subprocess.CalledProcessError, FileNotFoundError) as e:
-            target_directory = os.path.join("..", DIR, '3-bader')
-            with change_directory(target_directory):
-                log_info(f"Submitting 3-bader {DIR} {MAT}.")
-                runjob_id = submit_job(MAT)
+            calccache.store(os.path.dirname(acf_path))
+        except (OSError, sqlite3.Error) as e:
+            log_error(f"Error: Failed to cache {os.path.dirname(acf_path)}. Details: {e}")
+    if len(written) != len(DIRS):
+        raise RuntimeError(f"Bader analysis produced {len(written)} of {len(DIRS)} ACF.dat files for {MAT}.")
+    return written
+
+def main(MAT, DIRS, pack=None, trace=None):
+    tracer = tracing.get_tracer()
+    tracer.name = MAT
+    # 生成 Bader 输入文件
+    with tracing.span("bader:generate"):
+        generate_all_bader(DIRS, MAT)
+    # 提交 Bader 计算任务
+    with tracing.span("bader:submit"):
+        if pack:
+            runjob_ids = submit_bader_packed(DIRS, MAT, pack)
+            tracer.add_jobs(runjob_ids, "bader")
+        else:
+            runjob_ids = []
+            for DIR in DIRS:
+                runjob_id = submit_bader(DIR, MAT)
                 if runjob_id:
                     runjob_ids.append(runjob_id)
-    for runjob_id in runjob_ids:
-        wait_for_job_completion(runjob_id)
-    # 分析计算结果
-    for DIR in DIRS:
-        try:
-            check_output = subprocess.check_output(
-                ["grep", "-q", "Total CPU time", f"../{DIR}/3-bader/{MAT}/OUTCAR"],
-                stderr=subprocess.STDOUT
-            ).decode()
-            log_info(f"Analyzing 3-bader {DIR} {MAT}.")
-            with change_directory(os.path.join("..", DIR, '3-bader', MAT)):
-                subprocess.check_call(["chgsum.pl", "AECCAR0", "AECCAR2"])
-                subprocess.check_call(["bader", "CHGCAR", "-ref", "CHGCAR_sum"])
-        except subprocess.CalledProcessError as e:
-            log_info(f"Error: {e.output.decode()}")
+                    tracer.add_jobs(runjob_id, "bader", DIR)
+    with tracing.span("bader:wait"):
+        states = wait_for_jobs(runjob_ids)
+    failed = failed_jobs(states, [os.path.join("..", DIR, '3-bader', MAT) for DIR in DIRS])
+    if failed:
+        error_exit(f"Error: Bader jobs did not complete: {failed}")
+    with tracing.span("bader:analyze"):
+        analyze_bader(DIRS, MAT)
+    tracing.finish(trace or tracing.trace_path(f"bader_{MAT}"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bader 电荷计算")
+    parser.add_argument('MAT', help="MAT，例如 Fe, FePc, Fe2O3, Fe-MOF 等")
+    parser.add_argument('DIRS', nargs='*', default=DEFAULT_DIRS, help="吸附物目录")
+    parser.add_argument('--pack', choices=["array", "serial"], default=None, help="将单点计算打包为一个 Slurm 作业")
+    parser.add_argument('--trace', default=None, help="各步骤与作业排队/运行时间的 Chrome trace 输出文件（默认 trace_bader_MAT.json）")
+    args = parser.parse_args()
+    try:
+        main(args.MAT, args.DIRS, args.pack, args.trace)
+    except RuntimeError as e:
+        error_exit(f"Error: {e}")
@@ -1,21 +1,24 @@
 import numpy as np
 import os
 import subprocess
-import time
 import datetime
 import sys
 import glob
 import re
+import argparse
+import functools
+import json
+import sqlite3
 from contextlib import contextmanager
-from pymatgen.analysis.adsorption import AdsorbateSiteFinder
-from pymatgen.io.vasp import Poscar
-from pymatgen.core import Lattice, Molecule, Structure
-from pymatgen.core.surface import generate_all_slabs
-from pymatgen.ext.matproj import MPRester
-from pymatgen.io.vasp.sets import MPRelaxSet
-from pymatgen.io.vasp.sets import MITRelaxSet
-from pymatgen.io.vasp.sets import MPNonSCFSet
-from pymatgen.io.vasp.inputs import Kpoints
+from cdd import run_batch
+import badertable
+from slurm import wait_for_jobs, failed_jobs, submit_packed
+from status import check_calculation
+import calccache
+import potcar
+import throttle
+import tune
+import tracing
 import warnings
 
 warnings.simplefilter("ignore")
@@ -35,11 +38,11 @@ TASK_STATUS = {
 RCHECK_SCRIPT = "rcheck.sh"
 RELAX2_SCRIPT = "std-subvasp.sh"
 
-MAT = sys.argv[1]  # MAT，例如 Fe, FePc, Fe2O3, Fe-MOF 等
-if len(sys.argv) > 2:
-    ADS = sys.argv[2:]
-else:
-    ADS = ["OOH", "OH", "O", "Support"]
+DEFAULT_ADS = ["OOH", "OH", "O", "Support"]
+FRAGMENT_DIRS = ["support", "adsorbate"]
+# 命中缓存所需的输出文件
+CDD_OUTPUTS = ("OUTCAR", "CHGCAR")
+SITE_LABELS = "site_labels.json"
 
 def log_info(message):
     print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
@@ -60,9 +63,9 @@ def change_directory(destination):
     finally:
         os.chdir(original_dir)
 
-def submit_job(identifier):
+def submit_job(identifier, cwd=None):
     try:
-        job_output = subprocess.check_output([RELAX2_SCRIPT, identifier]).decode()
+        job_output = subprocess.check_output([RELAX2_SCRIPT, identifier], cwd=cwd).decode()
         job_id_match = re.search(r'job (\d+)', job_output)
         if job_id_match:
             job_id = job_id_match.group(1)
@@ -72,58 +75,54 @@ def submit_job(identifier):
             log_error(f"Error: Failed to find job ID in output: {job_output}")
             return
     except subprocess.CalledProcessError as e:
-        error_exit(f"Error: Failed to submit job for {identifier}. Details: {e}")
-
-def wait_for_job_completion(job_id):
-    log_info(f"Waiting for job {job_id} to complete...")
-    while True:
-        try:
-            job_status = subprocess.check_output(['squeue', '-j', job_id], stderr=subprocess.DEVNULL).decode()
-            if job_id not in job_status:
-                log_info(f"Job {job_id} has completed.")
-                break
-        except subprocess.CalledProcessError:
-            break
-        log_info(f"Job {job_id} is still running...")
-        time.sleep(300)
-
-# 生成差分电荷密度（CDD）输入文件
-def generate_cdd(identifier):
-    # Step 1：读取优化好的催化剂结构
+        raise RuntimeError(f"Failed to submit job for {identifier}. Details: {e}") from e
+
+# 一维排序聚类：按高度排序后在相邻间距大于 eps 处断开，O(n log n)，结果与原子顺序无关。
+# 给定 period 时以最大间隙（真空层）为起点展开坐标，跨越晶胞边界的层不会被拆开。
+# 返回按高度从高到低排列的层（原子序号数组）列表。
+def cluster_layers(z_coords, eps=0.5, period=None):
+    z = np.asarray(z_coords, dtype=float)
+    if period:
+        z = np.mod(z, period)
+    order = np.argsort(z, kind="stable")
+    z_sorted = z[order]
+    if period and len(z_sorted) > 1:
+        gaps = np.diff(np.append(z_sorted, z_sorted[0] + period))
+        start = (int(np.argmax(gaps)) + 1) % len(z_sorted)
+        order = np.roll(order, -start)
+        z_sorted = np.roll(z_sorted, -start)
+        if start:
+            z_sorted[-start:] += period
+    breaks = np.flatnonzero(np.diff(z_sorted) > eps) + 1
+    return np.split(order, breaks)[::-1]
+
+# 每个 MAT 的载体结构与表面层划分只计算一次，供该批次所有吸附物复用
+@functools.lru_cache(maxsize=None)
+def analyze_support(MAT, eps=0.5, num_top_layers=3):
+    from pymatgen.core import Structure
     support_path = os.path.join('..', 'Support', MAT, 'CONTCAR')
     structure = Structure.from_file(support_path)
+    matrix = structure.lattice.matrix
+    height = structure.volume / np.linalg.norm(np.cross(matrix[0], matrix[1]))
+    layers = cluster_layers(structure.frac_coords[:, 2] * height, eps=eps, period=height)
+    surface_properties = ["subsurface"] * len(structure.sites)
+    for layer in layers[:num_top_layers]:
+        for index in layer:
+            surface_properties[index] = "surface"
+    return structure, tuple(surface_properties)
+
+# 准备差分电荷密度（CDD）输入：写出位点标签，返回 support 与 adsorbate 两个片段的写出目标
+def prepare_cdd(identifier, MAT):
+    # pymatgen 导入耗时较长，只在生成输入文件时导入
+    from pymatgen.core import Molecule, Structure
+    # Step 1：读取优化好的催化剂结构及其表面层划分（按 MAT 缓存）
+    support_structure, surface_properties = analyze_support(MAT)
+    structure = support_structure.copy()
     # Step 2：读取吸附物结构（从 xyz 文件读取）
     ads_path = os.path.expanduser(os.path.join('..', 'Support', identifier + '.xyz'))
     ads_name = Molecule.from_file(ads_path)
     # Step 3：将吸附物平移到合适位置并添加到结构中
-    cart_coords = structure.cart_coords
-    z_coords = cart_coords[:, 2]
-    eps = 0.5
-    labels = np.full(len(z_coords), -1, dtype=int)
-    current_label = 0
-    for i in range(len(z_coords)):
-        if labels[i] == -1:
-            labels[i] = current_label
-            for j in range(i + 1, len(z_coords)):
-                if labels[j] == -1 and abs(z_coords[i] - z_coords[j]) <= eps:
-                    labels[j] = current_label
-            current_label += 1
-    layers = []
-    for label in np.unique(labels):
-        layer_indices = np.where(labels == label)[0]
-        layers.append(layer_indices)
-    layers = sorted(layers, key=lambda layer: np.mean(z_coords[layer]), reverse=True)
-    num_layers = len(layers)
-    num_top_layers = 3
-    if num_layers <= num_top_layers:
-        top_layers = layers[:num_layers]
-    else:
-        top_layers = layers[:num_top_layers]
-    surface_properties = ["subsurface"] * len(structure.sites)
-    for layer in top_layers:
-        for index in layer:
-            surface_properties[index] = "surface"
-    structure.add_site_property("surface_properties", surface_properties)
+    structure.add_site_property("surface_properties", list(surface_properties))
     site_index = 0
     site_coords = structure[site_index].coords
     ads_position = ads_name[0].coords
@@ -151,54 +150,132 @@ def generate_cdd(identifier):
             support_index.append(i)
         elif prop == "adsorbate":
             adsorbate_index.append(i)
+    # 保存各原子的位点标签（surface/subsurface/adsorbate），供 Bader 结果汇总使用
+    with open(os.path.join('..', identifier, '3-bader', MAT, SITE_LABELS), 'w') as file:
+        json.dump(group, file)
     support_sites = [bader_structure[i] for i in support_index]
     support_structure = Structure.from_sites(support_sites)
     adsorbate_sites = [bader_structure[i] for i in adsorbate_index]
     adsorbate_structure = Structure.from_sites(adsorbate_sites)
-    kpoints_set = {'reciprocal_density': 100}
+    # 两个片段使用与复合结构相同的 k 网格，差分时 k 点采样误差相互抵消
+    kpoints_set = tune.kpoints(bader_structure)
     incar_set = {
         'IBRION': -1, 'LAECHG': 'True', 'NSW': 0, 'LCHARG': True,
         'ALGO': "Normal", 'EDIFFG': -0.02, 'EDIFF': 0.00001, 'ENCUT': 500,
         'ISMEAR': 0, 'ISPIN': 2, 'ICHARG': 2, 'LWAVE': False, 'PREC': 'Normal',
-        'NCORE': 4, 'ISIF': 1, 'NELM': 200, 'LDAU': False
+        'ISIF': 1, 'NELM': 200, 'LDAU': False, **tune.parallel_settings(kpoints_set)
     }
     support_bader_path = os.path.join('..', identifier, '3-bader', MAT, 'support')
-    support_Relax = MITRelaxSet(support_structure, user_incar_settings=incar_set, user_kpoints_settings=kpoints_set)
-    support_Relax.write_input(support_bader_path)
     adsorbate_bader_path = os.path.join('..', identifier, '3-bader', MAT, 'adsorbate')
-    adsorbate_Relax = MITRelaxSet(adsorbate_structure, user_incar_settings=incar_set, user_kpoints_settings=kpoints_set)
-    adsorbate_Relax.write_input(adsorbate_bader_path)
+    return [(support_structure, support_bader_path, incar_set, kpoints_set),
+            (adsorbate_structure, adsorbate_bader_path, incar_set, kpoints_set)]
+
+# 生成单个吸附物的 CDD 输入文件
+def generate_cdd(identifier, MAT):
+    for target in prepare_cdd(identifier, MAT):
+        potcar.write_input(*target)
     log_info("Charge input files have been written successfully.")
 
-if __name__ == "__main__":
-    # 生成差分电荷密度输入文件
-    for ads in ADS:
-        with change_directory(os.path.join("..", ads)):
-            generate_cdd(ads)
-    # 提交差分电荷密度计算任务
+# 多进程并行生成所有吸附物 × 片段的 CDD 输入文件，POTCAR 由缓存链接
+def generate_all_cdd(ADS, MAT):
+    targets = [target for ads in ADS for target in prepare_cdd(ads, MAT)]
+    written = potcar.write_inputs(targets)
+    log_info(f"Charge input files written successfully to {len(written)} of {len(targets)} directories.")
+    if len(written) != len(targets):
+        error_exit("Failed to write charge input files for some adsorbates.")
+
+def cdd_completed(ads, MAT, dir):
+    calc_dir = os.path.join("..", ads, "3-bader", MAT, dir)
+    result = check_calculation(calc_dir)
+    if result["errors"]:
+        log_error(f"Error: {calc_dir} reported {', '.join(result['errors'])}.")
+    return result["finished"]
+
+# 是否需要提交：已完成或命中缓存时返回 False
+def cdd_pending(ads, MAT, dir):
+    if cdd_completed(ads, MAT, dir):
+        log_info(f"Calculation for charge density difference {ads} {dir} successfully completed.")
+        return False
+    return not calccache.restore(os.path.join("..", ads, '3-bader', MAT, dir), required=CDD_OUTPUTS)
+
+# 将多个吸附物的所有待计算片段打包为一个 Slurm 作业，返回作业号列表；
+# 数组作业同时运行的任务数不超过全局节流器的 max_running
+def submit_cdd_packed(ADS, MAT, pack="array"):
+    pending = [os.path.join("..", ads, '3-bader', MAT, dir) for ads in ADS for dir in FRAGMENT_DIRS
+               if cdd_pending(ads, MAT, dir)]
+    # 数组作业的每个任务在队列中各占一个名额
+    job_ids = throttle.submit_job(submit_packed, pending, mode=pack, max_parallel=throttle.get_throttle().max_running,
+                                  slots=len(pending) if pack == "array" else 1)
+    return list(dict.fromkeys(job_ids.values()))
+
+# 提交单个吸附物的 support 与 adsorbate 计算任务，返回新提交的作业号列表；
+# 给出 pack 时两个片段合并为一个打包作业
+def submit_cdd(ads, MAT, pack=None):
+    if pack:
+        return submit_cdd_packed([ads], MAT, pack)
     runjob_ids = []
-    DIRS = ["support", "adsorbate"]
-    for ads in ADS:
-        for dir in DIRS:
-            outcar_path = os.path.join("..", ads, "3-bader", MAT, dir, "OUTCAR")
-            try:
-                if not os.path.isfile(outcar_path):
-                    raise FileNotFoundError(f"File {outcar_path} not found")
-                check_output = subprocess.check_output(["grep", "-q", "Total CPU time", outcar_path],
-                                                       stderr=subprocess.STDOUT).decode()
-                log_info("Calculation for charge density difference successfully completed.")
-            except (subprocess.CalledProcessError, FileNotFoundError) as e:
-                target_directory = os.path.join("..", ads, '3-bader', MAT)
-                with change_directory(target_directory):
-                    log_info("Submitting support.")
-                    runjob_id = submit_job(dir)
-                    if runjob_id:
-                        runjob_ids.append(runjob_id)
-    for runjob_id in runjob_ids:
-        wait_for_job_completion(runjob_id)
-    # 分析计算结果
+    for dir in FRAGMENT_DIRS:
+        if not cdd_pending(ads, MAT, dir):
+            continue
+        log_info(f"Submitting {ads} {dir}.")
+        runjob_id = throttle.submit_job(submit_job, dir, cwd=os.path.join("..", ads, '3-bader', MAT))
+        if runjob_id:
+            runjob_ids.append(runjob_id)
+    return runjob_ids
+
+# 分析计算结果：多进程并行计算各吸附物的差分电荷密度
+def analyze_cdd(ADS, MAT):
+    log_info("Analyzing charge density difference.")
+    cdd_dirs = [os.path.join("..", ads, '3-bader', MAT) for ads in ADS]
+    # 将已完成的片段计算存入缓存
     for ads in ADS:
-        log_info("Analyzing charge density difference.")
-        with change_directory(os.path.join("..", ads, '3-bader', MAT)):
-            command = 'echo -e "314\nCHGCAR support/CHGCAR adsorbate/CHGCAR\n" | vaspkit'
-            subprocess.check_call(command, shell=True)
+        for dir in FRAGMENT_DIRS:
+            if cdd_completed(ads, MAT, dir):
+                fragment_dir = os.path.join("..", ads, '3-bader', MAT, dir)
+                try:
+                    calccache.store(fragment_dir)
+                except (OSError, sqlite3.Error) as e:
+                    log_error(f"Error: Failed to cache {fragment_dir}. Details: {e}")
+    if len(run_batch(cdd_dirs)) != len(cdd_dirs):
+        raise RuntimeError("Charge density difference analysis failed for some adsorbates.")
+
+def main(MAT, ADS, pack=None, trace=None):
+    tracer = tracing.get_tracer()
+    tracer.name = MAT
+    # 生成差分电荷密度输入文件
+    with tracing.span("cdd:generate"):
+        generate_all_cdd(ADS, MAT)
+    # 提交差分电荷密度计算任务
+    with tracing.span("cdd:submit"):
+        if pack:
+            runjob_ids = submit_cdd_packed(ADS, MAT, pack)
+            tracer.add_jobs(runjob_ids, "cdd")
+        else:
+            runjob_ids = []
+            for ads in ADS:
+                ads_job_ids = submit_cdd(ads, MAT)
+                tracer.add_jobs(ads_job_ids, "cdd", ads)
+                runjob_ids.extend(ads_job_ids)
+    with tracing.span("cdd:wait"):
+        states = wait_for_jobs(runjob_ids)
+    failed = failed_jobs(states, [os.path.join("..", ads, '3-bader', MAT, dir) for ads in ADS for dir in FRAGMENT_DIRS])
+    if failed:
+        error_exit(f"Error: CDD jobs did not complete: {failed}")
+    with tracing.span("cdd:analyze"):
+        analyze_cdd(ADS, MAT)
+    # 汇总 Bader 电荷与位点标签
+    with tracing.span("bader:table"):
+        badertable.update([os.path.join("..", ads, '3-bader', MAT) for ads in ADS])
+    tracing.finish(trace or tracing.trace_path(f"cdd_{MAT}"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="差分电荷密度计算")
+    parser.add_argument('MAT', help="MAT，例如 Fe, FePc, Fe2O3, Fe-MOF 等")
+    parser.add_argument('ADS', nargs='*', default=DEFAULT_ADS, help="吸附物目录")
+    parser.add_argument('--pack', choices=["array", "serial"], default=None, help="将片段单点计算打包为一个 Slurm 作业")
+    parser.add_argument('--trace', default=None, help="各步骤与作业排队/运行时间的 Chrome trace 输出文件（默认 trace_cdd_MAT.json）")
+    args = parser.parse_args()
+    try:
+        main(args.MAT, args.ADS, args.pack, args.trace)
+    except RuntimeError as e:
+        error_exit(f"Error: {e}")
@@ -0,0 +1,167 @@
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import datetime
+import argparse
+import fsutil
+
+STORE_DIR = ".efbackup"
+INDEX_FILE = "index.json"
+BACKUP_FILES = ("POSCAR", "CONTCAR", "OUTCAR")
+# 以 gzip 压缩保存的大文本输出
+COMPRESS_FILES = {"OUTCAR", "OSZICAR", "vasprun.xml", "DOSCAR", "PROCAR", "EIGENVAL"}
+PREFIX = "old"
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_index(store):
+    try:
+        with open(os.path.join(store, INDEX_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+
+def _save_index(store, index):
+    path = os.path.join(store, INDEX_FILE)
+    with open(path + ".tmp", 'w') as file:
+        json.dump(index, file, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _legacy_max(directory, name):
+    # 索引中没有记录时，沿用 backup.sh 留下的 NAME-oldN 编号（仅首次扫描一次）
+    numbers = [0]
+    for path in glob.glob(os.path.join(directory, f"{name}-{PREFIX}*")):
+        suffix = os.path.basename(path)[len(name) + len(PREFIX) + 1:]
+        if suffix.endswith(".gz"):
+            suffix = suffix[:-3]
+        if suffix.isdigit():
+            numbers.append(int(suffix))
+    return max(numbers)
+
+
+def _store_object(store, path, compress):
+    """按内容寻址保存文件，已存在的内容直接复用，返回 (对象路径, sha256)。"""
+    sha = _sha256(path)
+    obj = os.path.join(store, "objects", sha[:2], sha + (".gz" if compress else ""))
+    if not os.path.exists(obj):
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        tmp = obj + ".tmp"
+        if compress:
+            with open(path, 'rb') as src, gzip.open(tmp, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        else:
+            shutil.copyfile(path, tmp)
+        # 对象被多个备份硬链接共享，设为只读防止被原地修改
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, obj)
+    return obj, sha
+
+
+def snapshot(directory, names=BACKUP_FILES):
+    """
+    备份 directory 中的文件：内容相同的文件只保存一份，大文本输出以 gzip 压缩，
+    并以硬链接在目录中生成 NAME-oldN（压缩文件为 NAME-oldN.gz）。
+    编号来自 .efbackup/index.json，不扫描目录。返回 {文件名: 编号}。
+    """
+    store = os.path.join(directory, STORE_DIR)
+    index = _load_index(store)
+    numbers = {}
+    for name in names:
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            log_error(f"{path} does not exist, skipped.")
+            continue
+        if os.path.getsize(path) == 0:
+            log_error(f"{path} is empty, skipped.")
+            continue
+        compress = name in COMPRESS_FILES
+        obj, sha = _store_object(store, path, compress)
+        entries = index["files"].setdefault(name, [])
+        n = (entries[-1]["n"] if entries else _legacy_max(directory, name)) + 1
+        backup_name = f"{name}-{PREFIX}{n}" + (".gz" if compress else "")
+        fsutil.place(obj, os.path.join(directory, backup_name))
+        entries.append({"n": n, "sha256": sha, "size": os.path.getsize(path), "compressed": compress,
+                        "time": time.time()})
+        numbers[name] = n
+        log_info(f"Backed up {path} as {backup_name}.")
+    _save_index(store, index)
+    return numbers
+
+
+def restart(directory):
+    """与 backup.sh 相同：备份 POSCAR、CONTCAR、OUTCAR，再以 CONTCAR 覆盖 POSCAR。返回是否已更新 POSCAR。"""
+    snapshot(directory)
+    contcar = os.path.join(directory, "CONTCAR")
+    if not os.path.isfile(contcar) or os.path.getsize(contcar) == 0:
+        log_error(f"{contcar} is missing or empty, POSCAR left unchanged.")
+        return False
+    # VASP 会原地改写 CONTCAR，因此 POSCAR 必须是独立的副本而不是硬链接
+    shutil.copyfile(contcar, os.path.join(directory, "POSCAR"))
+    log_info(f"Copied CONTCAR to POSCAR in {directory}.")
+    return True
+
+
+def list_backups(directory):
+    """返回 {文件名: [索引记录, ...]}。"""
+    return _load_index(os.path.join(directory, STORE_DIR))["files"]
+
+
+def restore(directory, name, n, output=None):
+    """将第 n 个备份解压（或复制）为 output，缺省覆盖 directory/name。"""
+    store = os.path.join(directory, STORE_DIR)
+    entries = [entry for entry in list_backups(directory).get(name, []) if entry["n"] == n]
+    if not entries:
+        raise FileNotFoundError(f"{directory} 中没有 {name} 的第 {n} 个备份")
+    entry = entries[0]
+    obj = os.path.join(store, "objects", entry["sha256"][:2], entry["sha256"] + (".gz" if entry["compressed"] else ""))
+    output = output or os.path.join(directory, name)
+    tmp = output + ".tmp"
+    with (gzip.open(obj, 'rb') if entry["compressed"] else open(obj, 'rb')) as src, open(tmp, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp, output)
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="去重、硬链接的计算目录备份（代替 backup.sh）")
+    parser.add_argument('directory', help="计算目录")
+    parser.add_argument('--no-restart', action='store_true', help="只备份，不以 CONTCAR 覆盖 POSCAR")
+    parser.add_argument('--list', action='store_true', help="列出备份记录")
+    parser.add_argument('--restore', nargs=2, metavar=("NAME", "N"), help="恢复 NAME 的第 N 个备份")
+    args = parser.parse_args()
+    if not os.path.isdir(args.directory):
+        log_error(f"No such directory: {args.directory}")
+        sys.exit(1)
+    if args.list:
+        for name, entries in list_backups(args.directory).items():
+            for entry in entries:
+                stamp = datetime.datetime.fromtimestamp(entry["time"]).strftime('%Y-%m-%d %H:%M:%S')
+                print(f"{name}-{PREFIX}{entry['n']:<6}{entry['size']:>14}  {stamp}  {entry['sha256'][:12]}")
+    elif args.restore:
+        print(restore(args.directory, args.restore[0], int(args.restore[1])))
+    elif args.no_restart:
+        snapshot(args.directory)
+    else:
+        restart(args.directory)
@@ -0,0 +1,175 @@
+import os
+import sys
+import datetime
+import argparse
+import itertools
+import concurrent.futures
+import numpy as np
+from chgcar import index_chgcar, read_grid, read_positions, check_compatible
+import throttle
+
+ACF_FILE = "ACF.dat"
+# 真空判据（e/Å^3），与 bader 程序的默认值一致
+VACUUM_TOL = 1e-3
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def _minimum_image(frac_delta, lattice):
+    frac_delta = frac_delta - np.round(frac_delta)
+    return np.linalg.norm(frac_delta @ lattice, axis=-1)
+
+
+def ascent_targets(ref, lattice):
+    """
+    on-grid 最速上升：每个格点指向 26 个近邻中 (ρ_nb − ρ)/|Δr| 最大的点，
+    再通过指针倍增一次性求得每个格点最终到达的极大值点（展平索引）。
+    """
+    shape = ref.shape
+    offsets = [o for o in itertools.product((-1, 0, 1), repeat=3) if o != (0, 0, 0)]
+    best = np.zeros(shape)
+    choice = np.full(shape, -1, dtype=np.int8)
+    for k, offset in enumerate(offsets):
+        distance = np.linalg.norm((np.array(offset) / shape) @ lattice)
+        neighbor = np.roll(ref, tuple(-o for o in offset), axis=(0, 1, 2))
+        gradient = (neighbor - ref) / distance
+        mask = gradient > best
+        best[mask] = gradient[mask]
+        choice[mask] = k
+    del best
+
+    steps = np.array(offsets + [(0, 0, 0)], dtype=np.int64)
+    index = np.indices(shape, dtype=np.int64)
+    target = np.zeros(shape, dtype=np.int64)
+    for axis in range(3):
+        coord = (index[axis] + steps[choice, axis]) % shape[axis]
+        target = target * shape[axis] + coord
+    del index, choice
+    target = target.ravel()
+    while True:
+        jumped = target[target]
+        if np.array_equal(jumped, target):
+            return target
+        target = jumped
+
+
+def bader_partition(chg, ref, lattice, positions, vacuum_tol=VACUUM_TOL):
+    """
+    以参考密度 ref 划分 Bader 区域，并对电荷密度 chg 积分。
+    chg 与 ref 均为 CHGCAR 格式的 ρ·V 数据，positions 为分数坐标。
+    返回每个原子的电荷、体积、最小表面距离以及真空电荷与体积。
+    """
+    shape = chg.shape
+    npoints = chg.size
+    volume = abs(np.linalg.det(lattice))
+    natoms = len(positions)
+
+    target = ascent_targets(ref, lattice)
+    maxima = np.unique(target)
+    maxima_frac = np.stack(np.unravel_index(maxima, shape), axis=1) / shape
+    distances = _minimum_image(maxima_frac[:, None, :] - positions[None, :, :], lattice)
+    owner = np.full(npoints, -1, dtype=np.int64)
+    owner[maxima] = np.argmin(distances, axis=1)
+    region = owner[target]
+    del target, owner
+
+    flat_chg = chg.ravel()
+    vacuum = flat_chg / volume < vacuum_tol
+    region[vacuum] = natoms
+    charges = np.bincount(region, weights=flat_chg, minlength=natoms + 1) / npoints
+    volumes = np.bincount(region, minlength=natoms + 1) * volume / npoints
+
+    # 最小表面距离：区域边界格点到所属原子的最短距离
+    region = region.reshape(shape)
+    boundary = np.zeros(shape, dtype=bool)
+    for axis in range(3):
+        for shift in (1, -1):
+            boundary |= region != np.roll(region, shift, axis=axis)
+    points = np.flatnonzero(boundary & (region < natoms))
+    atoms = region.ravel()[points]
+    points_frac = np.stack(np.unravel_index(points, shape), axis=1) / shape
+    min_dist = np.full(natoms, np.inf)
+    np.minimum.at(min_dist, atoms, _minimum_image(points_frac - positions[atoms], lattice))
+    min_dist[np.isinf(min_dist)] = 0.0
+
+    return {
+        "positions": positions @ lattice,
+        "charges": charges[:natoms],
+        "volumes": volumes[:natoms],
+        "min_dist": min_dist,
+        "vacuum_charge": charges[natoms],
+        "vacuum_volume": volumes[natoms],
+        "nelect": charges.sum(),
+    }
+
+
+def write_acf(path, result):
+    """按 bader 程序的 ACF.dat 格式写出结果。"""
+    rule = " " + "-" * 80 + "\n"
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        file.write("    #         X           Y           Z       CHARGE      MIN DIST   ATOMIC VOL\n")
+        file.write(rule)
+        rows = zip(result["positions"], result["charges"], result["min_dist"], result["volumes"])
+        for i, (pos, charge, dist, vol) in enumerate(rows, start=1):
+            file.write(f"{i:5d}{pos[0]:12.6f}{pos[1]:12.6f}{pos[2]:12.6f}{charge:12.6f}{dist:12.6f}{vol:13.6f}\n")
+        file.write(rule)
+        file.write(f"    VACUUM CHARGE:{result['vacuum_charge']:21.4f}\n")
+        file.write(f"    VACUUM VOLUME:{result['vacuum_volume']:21.4f}\n")
+        file.write(f"    NUMBER OF ELECTRONS:{result['nelect']:15.4f}\n")
+    os.replace(tmp_path, path)
+
+
+def bader_directory(directory, reference=None):
+    """
+    对目录中的 CHGCAR 做 Bader 分析并写出 ACF.dat。
+    reference 为参考密度数组；为 None 时若存在 AECCAR0/AECCAR2，
+    则在内存中求和作为参考密度（不写 CHGCAR_sum），否则使用 CHGCAR 本身。
+    """
+    index = index_chgcar(os.path.join(directory, "CHGCAR"))
+    chg = read_grid(index)
+    if reference is None:
+        aeccars = [os.path.join(directory, name) for name in ("AECCAR0", "AECCAR2")]
+        if all(os.path.isfile(path) for path in aeccars):
+            core, valence = [index_chgcar(path) for path in aeccars]
+            check_compatible(index, core, valence)
+            reference = read_grid(core)
+            reference += read_grid(valence)
+        else:
+            reference = chg
+    elif reference.shape != chg.shape:
+        raise ValueError(f"参考密度格点 {reference.shape} 与 CHGCAR {chg.shape} 不一致")
+    result = bader_partition(chg, reference, index["lattice"], read_positions(index))
+    acf_path = os.path.join(directory, ACF_FILE)
+    write_acf(acf_path, result)
+    return acf_path
+
+
+def run_batch(directories):
+    """在全局节流器的共享进程池中并行对多个目录做 Bader 分析，返回成功写出的 ACF.dat 列表。"""
+    written = []
+    futures = {throttle.submit_local(bader_directory, directory): directory for directory in directories}
+    for future in concurrent.futures.as_completed(futures):
+        directory = futures[future]
+        try:
+            written.append(future.result())
+            log_info(f"Bader charges written to {written[-1]}.")
+        except (OSError, ValueError, MemoryError) as e:
+            log_error(f"Bader analysis failed in {directory}. Details: {e}")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="基于格点的 Bader 电荷分析（替代 bader CHGCAR -ref CHGCAR_sum）")
+    parser.add_argument('directories', nargs='+', help="一个或多个含 CHGCAR 的目录")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="并行进程数")
+    args = parser.parse_args()
+    throttle.configure(max_workers=args.jobs)
+    if len(run_batch(args.directories)) != len(args.directories):
+        sys.exit(1)
@@ -0,0 +1,170 @@
+import os
+import csv
+import sys
+import glob
+import json
+import datetime
+import argparse
+import concurrent.futures
+import throttle
+import potcar
+
+BADER_TABLE = "bader_charges.csv"
+SITE_LABELS = "site_labels.json"
+ATOM_FIELDS = ["mat", "adsorbate", "directory", "atom", "element", "label", "zval",
+               "bader_charge", "net_charge", "volume", "min_dist"]
+SUMMARY_FIELDS = ["mat", "adsorbate", "directory", "adsorbate_net_charge", "support_net_charge",
+                  "surface_net_charge"]
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def read_acf(path):
+    """解析 ACF.dat，返回每个原子的 (Bader 电荷, 最小距离, 体积)。"""
+    atoms = []
+    with open(path) as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) == 7 and fields[0].isdigit():
+                atoms.append((float(fields[4]), float(fields[5]), float(fields[6])))
+    return atoms
+
+
+def _signature(directory):
+    signature = []
+    for name in ("ACF.dat", SITE_LABELS):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            signature.append([name, st.st_size, st.st_mtime_ns])
+    return signature
+
+
+def parse_directory(directory):
+    """解析 <ads>/3-bader/<MAT> 目录，返回逐原子的结果行。"""
+    mat = os.path.basename(os.path.normpath(directory))
+    adsorbate = os.path.basename(os.path.dirname(os.path.dirname(os.path.normpath(directory))))
+    charges = read_acf(os.path.join(directory, "ACF.dat"))
+    potcar_path = os.path.join(directory, "POTCAR")
+    zvals = potcar.read_zvals(potcar_path)
+    species, counts = potcar.read_species_counts(os.path.join(directory, "POSCAR"))
+    if not species:
+        # VASP 4 格式的 POSCAR 没有元素行，元素取自 POTCAR 的 TITEL（如 "PAW_PBE Fe_pv 06Sep2000"）
+        species = [title.split()[1].split("_")[0] for title, _ in potcar.read_headers(potcar_path)]
+    elements = [el for el, n in zip(species, counts) for _ in range(n)]
+    zvals = [z for z, n in zip(zvals, counts) for _ in range(n)]
+    labels = []
+    labels_path = os.path.join(directory, SITE_LABELS)
+    if os.path.isfile(labels_path):
+        with open(labels_path) as file:
+            labels = json.load(file)
+    if len(zvals) != len(charges):
+        raise ValueError(f"{directory} 中 ACF.dat 原子数 {len(charges)} 与 POSCAR {len(zvals)} 不一致")
+    rows = []
+    for i, (charge, min_dist, volume) in enumerate(charges):
+        rows.append({
+            "mat": mat, "adsorbate": adsorbate, "directory": directory, "atom": i + 1,
+            "element": elements[i], "label": labels[i] if i < len(labels) else "",
+            "zval": zvals[i], "bader_charge": charge, "net_charge": zvals[i] - charge,
+            "volume": volume, "min_dist": min_dist,
+        })
+    return rows
+
+
+def summarize(rows):
+    """按目录汇总吸附物、载体及表面层的净电荷（正值表示失去电子）。"""
+    summary = {}
+    for row in rows:
+        entry = summary.setdefault(row["directory"], {
+            "mat": row["mat"], "adsorbate": row["adsorbate"], "directory": row["directory"],
+            "adsorbate_net_charge": 0.0, "support_net_charge": 0.0, "surface_net_charge": 0.0})
+        net_charge = float(row["net_charge"])
+        if row["label"] == "adsorbate":
+            entry["adsorbate_net_charge"] += net_charge
+        elif row["label"] in ("surface", "subsurface"):
+            entry["support_net_charge"] += net_charge
+            if row["label"] == "surface":
+                entry["surface_net_charge"] += net_charge
+    return list(summary.values())
+
+
+def _write_csv(path, fields, rows):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: f"{value:.6f}" if isinstance(value, float) else value for key, value in row.items()})
+    os.replace(tmp_path, path)
+
+
+def _read_rows(path):
+    if path.endswith(".parquet"):
+        import pandas as pd
+        return pd.read_parquet(path).to_dict("records")
+    with open(path, newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def update(directories, output=BADER_TABLE):
+    """
+    增量更新 Bader 电荷数据集：只重新解析 ACF.dat 或位点标签有变化的目录，
+    其余目录（包括本次未列出的目录）沿用已有表格中的行。
+    同时写出按目录汇总的 *_summary.csv。
+    """
+    manifest_path = output + ".manifest.json"
+    manifest, rows = {}, []
+    if os.path.isfile(manifest_path) and os.path.isfile(output):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        rows = _read_rows(output)
+    directories = [d for d in directories if os.path.isfile(os.path.join(d, "ACF.dat"))]
+    signatures = {d: _signature(d) for d in directories}
+    changed = [d for d in directories if manifest.get(d) != signatures[d]]
+    # 未列出的目录保留原有结果，有变化的目录重新解析
+    rows = [row for row in rows if row["directory"] not in changed]
+    for directory in changed:
+        manifest.pop(directory, None)
+
+    if changed:
+        futures = {throttle.submit_local(parse_directory, d): d for d in changed}
+        for future in concurrent.futures.as_completed(futures):
+            directory = futures[future]
+            try:
+                rows.extend(future.result())
+                manifest[directory] = signatures[directory]
+            except (OSError, ValueError, StopIteration) as e:
+                log_error(f"Failed to parse Bader results in {directory}. Details: {e}")
+    rows.sort(key=lambda row: (row["mat"], row["adsorbate"], int(row["atom"])))
+
+    if output.endswith(".parquet"):
+        import pandas as pd
+        pd.DataFrame(rows, columns=ATOM_FIELDS).astype({field: float for field in ATOM_FIELDS[6:]}).to_parquet(output)
+    else:
+        _write_csv(output, ATOM_FIELDS, rows)
+    _write_csv(os.path.splitext(output)[0] + "_summary.csv", SUMMARY_FIELDS, summarize(rows))
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file)
+    log_info(f"Bader dataset {output} updated: {len(changed)} of {len(directories)} directories parsed.")
+    return len(changed)
+
+
+def find_directories(root=".."):
+    """查找 <root>/<ads>/3-bader/<MAT> 形式的目录。"""
+    return sorted(os.path.dirname(path) for path in glob.glob(os.path.join(root, "*", "3-bader", "*", "ACF.dat")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="汇总 Bader 电荷与电荷转移数据")
+    parser.add_argument('directories', nargs='*', help="3-bader/MAT 目录，缺省时搜索 ../*/3-bader/*")
+    parser.add_argument('-o', '--output', default=BADER_TABLE, help="输出 CSV（或 .parquet）文件")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="并行进程数")
+    args = parser.parse_args()
+    throttle.configure(max_workers=args.jobs)
+    update(args.directories or find_directories(), args.output)
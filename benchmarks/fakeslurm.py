@@ -0,0 +1,145 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# 本地假调度器：sbatch 以子进程在本机运行作业脚本，squeue/sacct 读取作业状态文件。
+# 用法：python fakeslurm.py install DIR 后将 DIR 加入 PATH。
+STATE_DIR = os.environ.get("FAKE_SLURM_DIR", os.path.join("/tmp", f"fakeslurm-{os.getuid()}"))
+COMMANDS = ("sbatch", "squeue", "sacct")
+
+
+def _job_path(job_id):
+    return os.path.join(STATE_DIR, "jobs", f"{job_id}.json")
+
+
+def _save(job_id, job):
+    path = _job_path(job_id)
+    with open(path + ".tmp", 'w') as file:
+        json.dump(job, file)
+    os.replace(path + ".tmp", path)
+
+
+def _load(job_id):
+    try:
+        with open(_job_path(job_id)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _next_id():
+    # 以独占创建文件分配作业号，多个 sbatch 并发调用时不会重复
+    os.makedirs(os.path.join(STATE_DIR, "jobs"), exist_ok=True)
+    job_id = 1000
+    while True:
+        try:
+            os.close(os.open(_job_path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return job_id
+        except FileExistsError:
+            job_id += 1
+
+
+def sbatch(args):
+    script = os.path.abspath(args[-1])
+    tasks = [None]
+    with open(script) as file:
+        for line in file:
+            m = re.match(r"#SBATCH\s+(?:--array=|-a\s*)(\d+)-(\d+)", line)
+            if m:
+                tasks = list(range(int(m.group(1)), int(m.group(2)) + 1))
+    job_id = _next_id()
+    _save(job_id, {"tasks": {str(task): "PENDING" for task in tasks}, "array": tasks != [None],
+                   "submit": time.time(), "times": {}})
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "_run", str(job_id), script], cwd=os.getcwd(),
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    print(f"Submitted batch job {job_id}")
+
+
+def run(job_id, script):
+    job = _load(job_id)
+    for task in list(job["tasks"]):
+        job["tasks"][task] = "RUNNING"
+        job["times"][task] = {"start": time.time()}
+        _save(job_id, job)
+        env = dict(os.environ, SLURM_JOB_ID=str(job_id))
+        if job["array"]:
+            env.update(SLURM_ARRAY_JOB_ID=str(job_id), SLURM_ARRAY_TASK_ID=task)
+        code = subprocess.call(["bash", script], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        job["tasks"][task] = "COMPLETED" if code == 0 else "FAILED"
+        job["times"][task]["end"] = time.time()
+        _save(job_id, job)
+
+
+def _states(job_ids):
+    """展开为 (作业号, 状态, 作业记录, 任务号)，数组任务记为 作业号_任务号。"""
+    for job_id in job_ids:
+        base = job_id.split("_")[0]
+        job = _load(base)
+        if job is None:
+            continue
+        for task, state in job["tasks"].items():
+            name = f"{base}_{task}" if job["array"] else base
+            if job_id in (base, name):
+                yield name, state, job, task
+
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(timestamp)) if timestamp else "Unknown"
+
+
+def _option(args, short, long, default=None):
+    for i, arg in enumerate(args):
+        if arg in (short, long) and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith(long + "="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def _job_ids(args):
+    return _option(args, "-j", "--jobs", "").split(",")
+
+
+def squeue(args):
+    for name, state, _, _ in _states(_job_ids(args)):
+        if state in ("PENDING", "RUNNING"):
+            print(f"{name} {state}")
+
+
+def sacct(args):
+    # 支持 -o 中的 JobID、State、Submit、Start、End 字段
+    fields = _option(args, "-o", "--format", "JobID,State").split(",")
+    for name, state, job, task in _states(_job_ids(args)):
+        times = job.get("times", {}).get(task, {})
+        values = {"JOBID": name, "STATE": state, "SUBMIT": _format_time(job.get("submit")),
+                  "START": _format_time(times.get("start")), "END": _format_time(times.get("end"))}
+        print("|".join(values.get(field.upper(), "") for field in fields))
+
+
+def install(directory):
+    """在 directory 中生成 sbatch/squeue/sacct 可执行脚本。"""
+    os.makedirs(directory, exist_ok=True)
+    for command in COMMANDS:
+        path = os.path.join(directory, command)
+        with open(path, 'w') as file:
+            file.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" {command} "$@"\n')
+        os.chmod(path, 0o755)
+    return directory
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] in COMMANDS:
+        {"sbatch": sbatch, "squeue": squeue, "sacct": sacct}[sys.argv[1]](sys.argv[2:])
+    elif len(sys.argv) == 4 and sys.argv[1] == "_run":
+        run(sys.argv[2], sys.argv[3])
+    else:
+        parser = argparse.ArgumentParser(description="本地假 Slurm 调度器")
+        parser.add_argument('action', choices=["install"], help="生成 sbatch/squeue/sacct 脚本")
+        parser.add_argument('directory', help="脚本目录（加入 PATH）")
+        args = parser.parse_args()
+        print(install(args.directory))
@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 原先每一步都以 "python X.py" 启动新进程执行的模块
+STEP_MODULES = ["ORRbader", "ORRcdd", "NELECT", "upik0", "upik"]
+# 旧版 ORRbader.py/ORRcdd.py 在模块顶层导入的 pymatgen 模块
+LEGACY_IMPORTS = [
+    "pymatgen.analysis.adsorption", "pymatgen.io.vasp", "pymatgen.core", "pymatgen.core.surface",
+    "pymatgen.ext.matproj", "pymatgen.io.vasp.sets", "pymatgen.io.vasp.inputs",
+]
+
+
+def time_subprocess(code, repeat):
+    """在新解释器中执行 code，返回 repeat 次中的最短耗时（秒）。"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_in_process(module):
+    """在已运行的编排进程中获取模块的耗时（首次导入之后）。"""
+    importlib.import_module(module)
+    start = time.perf_counter()
+    importlib.import_module(module)
+    return time.perf_counter() - start
+
+
+def run(repeat=3):
+    sys.path.insert(0, ROOT)
+    results = {"interpreter": time_subprocess("pass", repeat)}
+    results["legacy_pymatgen_imports"] = time_subprocess("; ".join(f"import {m}" for m in LEGACY_IMPORTS), repeat)
+    for module in STEP_MODULES:
+        results[f"spawn:{module}"] = time_subprocess(f"import {module}", repeat)
+        results[f"in_process:{module}"] = time_in_process(module)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比较每步启动新进程与进程内调用的启动开销")
+    parser.add_argument('-n', '--repeat', type=int, default=3, help="每项重复次数（取最短）")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出")
+    args = parser.parse_args()
+    results = run(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, seconds in results.items():
+            print(f"{name:<40}{seconds * 1000:>10.1f} ms")
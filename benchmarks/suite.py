@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import importlib.util
+import platform
+import tempfile
+import contextlib
+import subprocess
+
+import synthetic
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+
+def best_of(func, repeat, setup=None):
+    """重复执行 func，返回最短耗时（秒）；setup 在每次计时前执行，不计入耗时。"""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+@contextlib.contextmanager
+def _chdir(path):
+    original = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(original)
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(text)
+
+
+def make_calc_dirs(root, count, natoms, nedos):
+    """生成 count 个含 POSCAR/POTCAR/INCAR/KPOINTS/OUTCAR/DOSCAR/ACF.dat 的合成计算目录。"""
+    poscar = synthetic.slab_poscar(natoms)
+    species = poscar.splitlines()[5].split()
+    outcar = synthetic.outcar_text(natoms)
+    doscar = synthetic.doscar_text(natoms, nedos)
+    acf = synthetic.acf_text(natoms)
+    directories = []
+    for i in range(count):
+        directory = os.path.join(root, f"calc{i:04d}")
+        _write(os.path.join(directory, "POSCAR"), poscar)
+        _write(os.path.join(directory, "CONTCAR"), poscar)
+        _write(os.path.join(directory, "POTCAR"), synthetic.potcar_text(species))
+        _write(os.path.join(directory, "INCAR"), synthetic.incar_text({"NELECT": str(8 * natoms)}))
+        _write(os.path.join(directory, "KPOINTS"), synthetic.kpoints_text())
+        _write(os.path.join(directory, "OUTCAR"), outcar)
+        _write(os.path.join(directory, "DOSCAR"), doscar)
+        _write(os.path.join(directory, "ACF.dat"), acf)
+        directories.append(directory)
+    return directories
+
+
+def require(module):
+    """需要可选依赖（如 pymatgen）的测量组在开始前检查，缺少时抛出 ImportError 以跳过该组。"""
+    if importlib.util.find_spec(module) is None:
+        raise ImportError(f"No module named '{module}'", name=module)
+
+
+def bench_layers(natoms, repeat):
+    """generate_cdd 的表面层划分 cluster_layers。"""
+    import numpy as np
+    import ORRcdd
+    results = {}
+    for n in natoms:
+        lines = synthetic.slab_poscar(n).splitlines()
+        height = float(lines[4].split()[2])
+        z = np.array([float(line.split()[2]) for line in lines[8:]]) * height
+        results[f"layers:cluster_layers[{n}]"] = best_of(lambda: ORRcdd.cluster_layers(z, period=height), repeat)
+    return results
+
+
+def bench_support(work, natoms, repeat):
+    """含读取 CONTCAR 的 analyze_support，需要 pymatgen。"""
+    import ORRcdd
+    require("pymatgen")
+    results = {}
+    for n in natoms:
+        poscar = synthetic.slab_poscar(n)
+        support = os.path.join(work, f"layers{n}", "Support")
+        _write(os.path.join(support, "Fe", "CONTCAR"), poscar)
+        with _chdir(support):
+            # 首次调用会导入 pymatgen 的读写模块，这部分耗时由 startup.py 单独测量
+            ORRcdd.analyze_support("Fe")
+            results[f"layers:analyze_support[{n}]"] = best_of(lambda: ORRcdd.analyze_support("Fe"), repeat,
+                                                             setup=ORRcdd.analyze_support.cache_clear)
+    return results
+
+
+def bench_nelect(directories, repeat):
+    import potcar
+    import NELECT
+    cache = os.path.join(potcar.POTCAR_CACHE_DIR, "headers.sqlite")
+
+    def clear():
+        if os.path.exists(cache):
+            os.remove(cache)
+    return {
+        "nelect:compute_nelect[cold]": best_of(lambda: NELECT.compute_nelect(directories, 0), repeat, setup=clear),
+        "nelect:compute_nelect[warm]": best_of(lambda: NELECT.compute_nelect(directories, 0), repeat),
+    }
+
+
+def bench_incar(directories, repeat):
+    import incar
+    import upik
+    originals = {}
+    for directory in directories:
+        for name in ("INCAR", "KPOINTS"):
+            with open(os.path.join(directory, name)) as file:
+                originals[os.path.join(directory, name)] = file.read()
+
+    def restore():
+        for path, text in originals.items():
+            with open(path, 'w') as file:
+                file.write(text)
+    return {"incar:edit_batch": best_of(lambda: incar.edit_batch(directories, upik.INCAR_MUTATIONS,
+                                                                 upik.KPOINTS_MESH), repeat, setup=restore)}
+
+
+def bench_status(directories, repeat):
+    import status
+    return {
+        "status:check_calculation[cold]": best_of(
+            lambda: [status.check_calculation(d, use_cache=False) for d in directories], repeat),
+        "status:check_calculation[cached]": best_of(lambda: status.scan(directories), repeat),
+    }
+
+
+def bench_outputs(directories, repeat):
+    import dos
+    import badertable
+    return {
+        "dos:read_doscar": best_of(lambda: dos.read_doscar(os.path.join(directories[0], "DOSCAR")), repeat),
+        "bader:read_acf": best_of(lambda: badertable.read_acf(os.path.join(directories[0], "ACF.dat")), repeat),
+    }
+
+
+def bench_volumetric(work, natoms, grid, repeat):
+    import chgcar
+    _write(os.path.join(work, "POSCAR"), synthetic.slab_poscar(natoms))
+    poscar, lattice, _, _ = synthetic.read_poscar(os.path.join(work, "POSCAR"))
+    path = synthetic.write_volumetric(os.path.join(work, "CHGCAR"), poscar, lattice, natoms, grid, nspin=2)
+    index = chgcar.index_chgcar(path)
+    return {
+        "volumetric:index_chgcar": best_of(lambda: chgcar.index_chgcar(path), repeat),
+        "volumetric:read_grid": best_of(lambda: chgcar.read_grid(index), repeat),
+        "volumetric:read_magnetization": best_of(lambda: chgcar.read_grid(index, spin=1), repeat),
+        "volumetric:size_mb": os.path.getsize(path) / 1024 ** 2,
+    }
+
+
+def bench_flow(work, natoms, grid, nedos, adsorbates, poll_interval, timeout=1800):
+    """
+    在合成目录中以假调度器完整运行一次 flow-Electronic.py，作业瞬间完成，
+    所测时间即流程自身的开销。各步骤耗时取自运行日志，同名步骤取各吸附物中的最大值。
+    """
+    import journal
+    # 流程在子进程中运行，缺少 pymatgen 时只会以失败告终，因此预先检查
+    require("pymatgen")
+    root = os.path.join(work, "flow")
+    support = synthetic.make_tree(root, "Fe", adsorbates, natoms)
+    bin_dir = os.path.join(work, "fakeslurm-bin")
+    subprocess.run([sys.executable, os.path.join(BENCH_DIR, "fakeslurm.py"), "install", bin_dir],
+                   check=True, stdout=subprocess.DEVNULL)
+    env = dict(os.environ, HOME=root, PATH=os.pathsep.join([bin_dir, os.path.join(root, "bin"), os.environ["PATH"]]),
+               FAKE_SLURM_DIR=os.path.join(work, "fakeslurm-state"),
+               ELECTRONICFLOW_POTCAR_CACHE=os.path.join(root, "potcar-cache"),
+               ELECTRONICFLOW_CACHE=os.path.join(work, "calccache"),
+               ELECTRONICFLOW_POLL_INTERVAL=str(poll_interval),
+               **{synthetic.GRID_ENV: " ".join(map(str, grid)), synthetic.NEDOS_ENV: str(nedos)})
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, os.path.join(root, "flow-Electronic.py"), "Fe", "0", *adsorbates],
+                               cwd=support, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               timeout=timeout)
+    results = {"flow:wall": time.perf_counter() - start, "flow:success": completed.returncode == 0}
+    starts = {}
+    with open(os.path.join(support, journal.journal_path("Fe", "electronic"))) as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get("event") == journal.START:
+                starts[record["stage"]] = record["time"]
+            elif record.get("event") == journal.DONE and record["stage"] in starts:
+                parts = record["stage"].split(":")
+                key = "flow:" + (f"{parts[0]}:{parts[2]}" if len(parts) == 3 else record["stage"])
+                results[key] = max(results.get(key, 0.0), record["time"] - starts[record["stage"]])
+    return results
+
+
+def run(natoms=(100, 500, 2000), grid=synthetic.DEFAULT_GRID, dirs=20, nedos=synthetic.DEFAULT_NEDOS, repeat=3,
+        flow=True, adsorbates=("OOH", "OH", "O"), poll_interval=0.5, work=None):
+    work = work or tempfile.mkdtemp(prefix="efbench-")
+    # POTCAR 头部缓存与计算缓存写入临时目录，不影响用户目录
+    os.environ["ELECTRONICFLOW_POTCAR_CACHE"] = os.path.join(work, "potcar-cache")
+    os.environ["ELECTRONICFLOW_CACHE"] = os.path.join(work, "calccache")
+    sys.path.insert(0, ROOT)
+    results = {}
+    skipped = {}
+
+    def section(name, func, *args):
+        # 缺少可选依赖的测量组记为跳过，不影响其余各组
+        try:
+            results.update(func(*args))
+        except ImportError as e:
+            skipped[name] = str(e)
+
+    try:
+        section("layers", bench_layers, natoms, repeat)
+        section("support", bench_support, work, natoms, repeat)
+        directories = make_calc_dirs(os.path.join(work, "calc"), dirs, max(natoms), nedos)
+        section("nelect", bench_nelect, directories, repeat)
+        section("incar", bench_incar, directories, repeat)
+        section("status", bench_status, directories, repeat)
+        section("outputs", bench_outputs, directories, repeat)
+        section("volumetric", bench_volumetric, work, max(natoms), grid, repeat)
+        if flow:
+            section("flow", bench_flow, work, min(natoms), [n // 2 for n in grid], min(nedos, 501), adsorbates,
+                    poll_interval)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    meta = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+        "machine": platform.machine(), "cpus": os.cpu_count(), "natoms": list(natoms), "grid": list(grid),
+        "dirs": dirs, "nedos": nedos, "repeat": repeat, "skipped": skipped,
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare(results, baseline, tolerance):
+    """与基线结果比较耗时，返回变慢超过 tolerance（比例）的项目 {名称: 倍数}。"""
+    regressions = {}
+    for name, value in results.items():
+        base = baseline.get(name)
+        if isinstance(value, bool) or not isinstance(base, (int, float)) or name.endswith("_mb") or base <= 0:
+            continue
+        if value / base > 1 + tolerance:
+            regressions[name] = value / base
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以合成数据与假调度器测量 ElectronicFlow 各热点路径的耗时")
+    parser.add_argument('--atoms', type=int, nargs='+', default=[100, 500, 2000], help="slab 原子数")
+    parser.add_argument('--grid', type=int, nargs=3, default=list(synthetic.DEFAULT_GRID), help="体数据格点")
+    parser.add_argument('--dirs', type=int, default=20, help="批量操作的计算目录数")
+    parser.add_argument('--nedos', type=int, default=synthetic.DEFAULT_NEDOS, help="DOSCAR 能量点数")
+    parser.add_argument('-n', '--repeat', type=int, default=3, help="每项重复次数（取最短）")
+    parser.add_argument('--no-flow', action='store_true', help="不运行完整的 flow-Electronic 流程")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="流程中作业监视器的轮询间隔（秒）")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出")
+    parser.add_argument('-o', '--output', default=None, help="将 JSON 结果写入文件")
+    parser.add_argument('--baseline', default=None, help="与之前保存的 JSON 结果比较")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="允许的变慢比例")
+    args = parser.parse_args()
+    report = run(args.atoms, tuple(args.grid), args.dirs, args.nedos, args.repeat, not args.no_flow,
+                 poll_interval=args.poll_interval)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name, value in report["results"].items():
+            if isinstance(value, bool) or name.endswith("_mb"):
+                print(f"{name:<45}{value!s:>12}")
+            else:
+                print(f"{name:<45}{value * 1000:>10.1f} ms")
+        for name, reason in report["meta"]["skipped"].items():
+            print(f"{name:<45}{'skipped':>12}  ({reason})")
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(report["results"], baseline, args.tolerance)
+        for name, ratio in regressions.items():
+            print(f"REGRESSION {name}: {ratio:.2f}x baseline", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
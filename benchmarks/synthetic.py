@@ -0,0 +1,299 @@
+import os
+import sys
+import math
+import shutil
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 合成 POTCAR 使用的价电子数
+ZVALS = {"Fe": 8.0, "Co": 9.0, "Ni": 10.0, "C": 4.0, "N": 5.0, "O": 6.0, "H": 1.0}
+# 合成吸附物（首个原子为与表面成键的原子）
+ADSORBATES = {
+    "OOH": [("O", 0.0, 0.0, 0.0), ("O", 1.2, 0.0, 0.7), ("H", 1.5, 0.0, 1.6)],
+    "OH": [("O", 0.0, 0.0, 0.0), ("H", 0.0, 0.0, 0.97)],
+    "O": [("O", 0.0, 0.0, 0.0)],
+}
+# 伪造的 VASP 计算输出的格点与 DOS 点数，由作业环境变量传给 fake VASP
+GRID_ENV = "EF_BENCH_GRID"
+NEDOS_ENV = "EF_BENCH_NEDOS"
+DEFAULT_GRID = (48, 48, 120)
+DEFAULT_NEDOS = 2001
+
+
+def slab_poscar(natoms, species=("Fe", "C", "N"), spacing=2.5, layer_gap=2.0, vacuum=15.0, seed=0):
+    """
+    生成 natoms 个原子的层状 slab（VASP 5 格式 POSCAR 文本）。每层为正方网格，
+    z 坐标带少量扰动以模拟弛豫后的表面；第一种元素只有一个原子，位于顶层（活性位点）。
+    """
+    rng = np.random.default_rng(seed)
+    side = max(3, round(math.sqrt(natoms / 4)))
+    nlayers = -(-natoms // (side * side))
+    a = side * spacing
+    c = (nlayers - 1) * layer_gap + vacuum
+    positions = []
+    for layer in range(nlayers - 1, -1, -1):
+        for i in range(side):
+            for j in range(side):
+                if len(positions) < natoms:
+                    z = layer * layer_gap + rng.normal(0, 0.05)
+                    positions.append(((i + 0.5) / side, (j + 0.5) / side, z / c + 0.05))
+    counts = [1, (natoms - 1) - (natoms - 1) // 5, (natoms - 1) // 5]
+    species, counts = zip(*[(el, n) for el, n in zip(species, counts) if n])
+    lines = ["synthetic slab", "1.0", f"{a:.6f} 0.000000 0.000000", f"0.000000 {a:.6f} 0.000000",
+             f"0.000000 0.000000 {c:.6f}", " ".join(species), " ".join(str(n) for n in counts), "Direct"]
+    lines += [f"{x:.8f} {y:.8f} {z:.8f}" for x, y, z in positions]
+    return "\n".join(lines) + "\n"
+
+
+def read_poscar(path):
+    """返回 (POSCAR 文本, 晶格, 元素, 原子数)。"""
+    with open(path) as file:
+        text = file.read()
+    lines = text.splitlines()
+    scale = float(lines[1].split()[0])
+    lattice = np.array([[float(x) for x in line.split()[:3]] for line in lines[2:5]]) * scale
+    return text, lattice, lines[5].split(), [int(x) for x in lines[6].split()]
+
+
+def density_slabs(lattice, grid, natoms, magnetization=False, nz_chunk=16):
+    """按 z 分块产出平滑的正值密度场（或小幅的磁化密度），总电荷约为 8 * natoms。"""
+    nx, ny, nz = grid
+    x = np.arange(nx)[:, None, None] / nx
+    y = np.arange(ny)[None, :, None] / ny
+    volume = abs(np.linalg.det(lattice))
+    scale = 8.0 * natoms / (nx * ny * nz) * volume
+    for z0 in range(0, nz, nz_chunk):
+        z = np.arange(z0, min(z0 + nz_chunk, nz))[None, None, :] / nz
+        wave = np.cos(2 * np.pi * 3 * x) * np.cos(2 * np.pi * 3 * y) * np.cos(2 * np.pi * 5 * z)
+        if magnetization:
+            yield 0.05 * scale * wave
+        else:
+            yield scale * (1.0 + 0.5 * wave)
+
+
+def write_volumetric(path, poscar_text, lattice, natoms, grid, nspin=1):
+    """写出 CHGCAR 格式的合成体数据文件；nspin 为 2 时附带磁化密度块。"""
+    from chgcar import write_chgcar
+    header = poscar_text.rstrip("\n") + "\n\n" + "".join(f"{n:5d}" for n in grid) + "\n"
+    blocks = [density_slabs(lattice, grid, natoms)]
+    if nspin == 2:
+        blocks.append(density_slabs(lattice, grid, natoms, magnetization=True))
+    write_chgcar(path, header, *blocks)
+    return path
+
+
+def outcar_text(natoms, nionic=3, nscf=15):
+    """合成 OUTCAR：每个离子步含 SCF 迭代、力与收敛信息，末尾为 Total CPU time。"""
+    lines = [" vasp.6.3.0 synthetic", f"   number of ions     NIONS = {natoms:8d}"]
+    for step in range(1, nionic + 1):
+        for it in range(1, nscf + 1):
+            lines.append(f"--------------------------------------- Iteration {step:6d}({it:4d})  "
+                         "---------------------------------------")
+            lines.append(f"  free energy    TOTEN  = {-7.0 * natoms - it * 1e-3:20.8f} eV")
+        lines.append("------------------------ aborting loop because EDIFF is reached "
+                     "----------------------------------------")
+        lines.append(" POSITION                                       TOTAL-FORCE (eV/Angst)")
+        lines += ["      0.00000      0.00000      0.00000         0.000000      0.000000      0.000000"
+                  for _ in range(natoms)]
+        lines.append(f"  free  energy   TOTEN  = {-7.0 * natoms:20.8f} eV")
+    lines.append(" General timing and accounting informations for this job:")
+    lines.append("                  Total CPU time used (sec):       12.345")
+    return "\n".join(lines) + "\n"
+
+
+def doscar_text(natoms, nedos=DEFAULT_NEDOS, ispin=2, nproj=9, efermi=-2.0):
+    """合成 DOSCAR（LORBIT = 11）：总态密度与逐原子 lm 分解的投影态密度。"""
+    energies = np.linspace(-20.0, 10.0, nedos) + efermi
+    shape = np.exp(-((energies - efermi + 1.5) / 2.0) ** 2)
+    head = [f"{natoms:4d}{natoms:4d}    1    0", "  0.1E+02  0.1E-09  0.1E-09  0.1E-09  0.5E-15",
+            "  1.0E-004", "  CAR ", " synthetic",
+            f"{energies[-1]:15.8f}{energies[0]:15.8f}{nedos:6d}{efermi:15.8f}    1.00000000"]
+    total = np.column_stack([energies] + [shape] * ispin + [np.cumsum(shape)] * ispin)
+    body = ["".join(f"{v:12.4E}" for v in row) for row in total]
+    columns = np.column_stack([energies] + [shape * (0.1 + 0.02 * k) for k in range(nproj * ispin)])
+    atom_block = ["".join(f"{v:12.4E}" for v in row) for row in columns]
+    lines = head + body
+    for _ in range(natoms):
+        lines.append(head[5])
+        lines += atom_block
+    return "\n".join(lines) + "\n"
+
+
+def acf_text(natoms, seed=0):
+    """合成 ACF.dat（与 bader 程序输出格式相同）。"""
+    rng = np.random.default_rng(seed)
+    lines = ["    #         X           Y           Z       CHARGE      MIN DIST   ATOMIC VOL",
+             " " + "-" * 80]
+    for i in range(natoms):
+        x, y, z = rng.random(3) * 10
+        lines.append(f"{i + 1:5d}{x:12.4f}{y:12.4f}{z:12.4f}{rng.uniform(3, 9):12.4f}"
+                     f"{rng.uniform(0.5, 1.5):12.4f}{rng.uniform(5, 15):12.4f}")
+    lines += [" " + "-" * 80, "    VACUUM CHARGE:               0.0000"]
+    return "\n".join(lines) + "\n"
+
+
+def potcar_text(symbols, body_lines=2000):
+    """合成拼接 POTCAR：每个赝势含 TITEL/ZVAL 头部与 body_lines 行数值（接近真实文件大小）。"""
+    body = "\n".join(f"  {0.1 * i:.10E}  {0.2 * i:.10E}  {0.3 * i:.10E}" for i in range(body_lines))
+    parts = []
+    for symbol in symbols:
+        element = symbol.split("_")[0]
+        parts.append(f"  PAW_PBE {symbol} 06Sep2000\n {ZVALS.get(element, 4.0):.10f}\n parameters from PSCTR are:\n"
+                     f"   VRHFIN ={element}: synthetic\n   TITEL  = PAW_PBE {symbol} 06Sep2000\n"
+                     f"   POMASS =   10.000; ZVAL   =   {ZVALS.get(element, 4.0):.3f}    mass and valenz\n"
+                     f"{body}\n End of Dataset\n")
+    return "".join(parts)
+
+
+def incar_text(extra=None):
+    params = {"SYSTEM": "synthetic", "PREC": "Normal", "ENCUT": "500", "ISMEAR": "0", "SIGMA": "0.05",
+              "IBRION": "2", "NSW": "200", "ISIF": "2", "EDIFF": "1E-05", "EDIFFG": "-0.02",
+              "ISPIN": "2", "LCHARG": ".FALSE.", "LWAVE": ".FALSE.", "NCORE": "4", "NELM": "200"}
+    params.update(extra or {})
+    return "".join(f"{key} = {value}\n" for key, value in params.items())
+
+
+def kpoints_text(mesh=(3, 3, 1)):
+    return "Automatic mesh\n0\nGamma\n" + " ".join(str(n) for n in mesh) + "\n0 0 0\n"
+
+
+def _flag(incar, key):
+    return (incar.get(key) or "").upper().strip(".") in ("TRUE", "T")
+
+
+def fake_vasp(directory, grid=None, nedos=None):
+    """
+    在计算目录中瞬间生成 VASP 输出：CONTCAR、收敛的 OUTCAR，以及按 INCAR 中
+    LCHARG、LAECHG、LORBIT 决定的 CHGCAR、AECCAR0/AECCAR2 与 DOSCAR。
+    """
+    from incar import Incar
+    grid = grid or tuple(int(n) for n in os.environ.get(GRID_ENV, " ".join(map(str, DEFAULT_GRID))).split())
+    nedos = nedos or int(os.environ.get(NEDOS_ENV, DEFAULT_NEDOS))
+    poscar, lattice, species, counts = read_poscar(os.path.join(directory, "POSCAR"))
+    natoms = sum(counts)
+    incar = Incar.from_file(os.path.join(directory, "INCAR"))
+    nspin = 2 if incar.get("ISPIN") == "2" else 1
+    shutil.copyfile(os.path.join(directory, "POSCAR"), os.path.join(directory, "CONTCAR"))
+    if _flag(incar, "LCHARG"):
+        write_volumetric(os.path.join(directory, "CHGCAR"), poscar, lattice, natoms, grid, nspin)
+    if _flag(incar, "LAECHG"):
+        for name in ("AECCAR0", "AECCAR2"):
+            write_volumetric(os.path.join(directory, name), poscar, lattice, natoms, grid)
+    if incar.get("LORBIT"):
+        with open(os.path.join(directory, "DOSCAR"), 'w') as file:
+            file.write(doscar_text(natoms, nedos, nspin))
+    with open(os.path.join(directory, "OUTCAR"), 'w') as file:
+        file.write(outcar_text(natoms, nionic=1 if incar.get("NSW") in ("0", None) else 3))
+
+
+SUBVASP_SCRIPT = """#!/bin/sh
+# 合成基准用的 {name}：在目录中写出作业脚本（运行 fake VASP）后用 sbatch 提交
+dir="$1"
+if [ -d "$dir" ]; then
+cd "$dir"
+printf '#!/bin/bash\\n#SBATCH --nodes=1\\nexec "{python}" "{synthetic}" vasp .\\n' > {script}
+sbatch {script}
+cd - > /dev/null
+else
+echo "No such files: $dir"
+fi
+"""
+
+
+def install_subvasp(directory):
+    """在 directory 中生成合成的 std-subvasp.sh 与 gam-subvasp.sh。"""
+    os.makedirs(directory, exist_ok=True)
+    for name, script in (("std-subvasp.sh", "std-vasp.slurm"), ("gam-subvasp.sh", "gam-vasp.slurm")):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as file:
+            file.write(SUBVASP_SCRIPT.format(name=name, python=sys.executable,
+                                             synthetic=os.path.abspath(__file__), script=script))
+        os.chmod(path, 0o755)
+    return directory
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(text)
+
+
+def _seed_potcar(structure, cache_dir):
+    # 与 potcar.assemble 使用相同的键，使流程直接命中缓存，无需真实的赝势库
+    import potcar
+    from pymatgen.io.vasp.sets import MITRelaxSet
+    input_set = MITRelaxSet(structure)
+    symbols = input_set.potcar_symbols
+    key = potcar.signature(input_set.user_potcar_functional, symbols)
+    _write(os.path.join(cache_dir, key[:2], f"{key}.POTCAR"), potcar_text(symbols))
+
+
+def _relaxed_dir(directory, structure):
+    from pymatgen.io.vasp import Poscar
+    poscar = Poscar(structure)
+    text = poscar.get_str()
+    _write(os.path.join(directory, "POSCAR"), text)
+    _write(os.path.join(directory, "CONTCAR"), text)
+    _write(os.path.join(directory, "INCAR"), incar_text())
+    _write(os.path.join(directory, "KPOINTS"), kpoints_text())
+    _write(os.path.join(directory, "POTCAR"), potcar_text(poscar.site_symbols))
+    _write(os.path.join(directory, "OUTCAR"), outcar_text(len(structure)))
+
+
+def make_tree(root, MAT="Fe", adsorbates=("OOH", "OH", "O"), natoms=200, cache_dir=None):
+    """
+    生成完整的合成流程目录：root/Support/MAT 与 root/<ads>/MAT 为已完成的结构优化，
+    root/Support/<ads>.xyz 为吸附物结构，仓库中的脚本复制到 root（NELECT.py 以脚本所在目录为根目录），
+    合成的 std/gam-subvasp.sh
+    写入 root/bin。cache_dir 中预置流程所需的拼接 POTCAR。返回 Support 目录。
+    """
+    from pymatgen.core import Structure, Molecule
+    os.makedirs(root, exist_ok=True)
+    cache_dir = cache_dir or os.path.join(root, "potcar-cache")
+    support = Structure.from_str(slab_poscar(natoms), fmt="poscar")
+    support_dir = os.path.join(root, "Support")
+    _relaxed_dir(os.path.join(support_dir, MAT), support)
+    _seed_potcar(support, cache_dir)
+    for ads in adsorbates:
+        atoms = ADSORBATES[ads]
+        xyz = f"{len(atoms)}\n{ads}\n" + "".join(f"{el} {x:.4f} {y:.4f} {z:.4f}\n" for el, x, y, z in atoms)
+        _write(os.path.join(support_dir, f"{ads}.xyz"), xyz)
+        # 与 ORRcdd.prepare_cdd 相同的拼接方式：吸附物置于 0 号原子上方 2.4 Å
+        molecule = Molecule.from_str(xyz, fmt="xyz")
+        structure = support.copy()
+        structure.add_site_property("label", ["support"] * len(structure))
+        anchor = structure[0].coords + np.array([0.0, 0.0, 2.4]) - molecule[0].coords
+        for site in molecule:
+            structure.append(site.specie, site.coords + anchor, coords_are_cartesian=True,
+                             properties={"label": "adsorbate"})
+        structure = structure.get_sorted_structure()
+        _relaxed_dir(os.path.join(root, ads, MAT), structure)
+        _seed_potcar(structure, cache_dir)
+        for label in ("support", "adsorbate"):
+            _seed_potcar(Structure.from_sites([site for site in structure if site.properties["label"] == label]),
+                         cache_dir)
+    for name in os.listdir(ROOT):
+        if name.endswith(".py"):
+            shutil.copy(os.path.join(ROOT, name), os.path.join(root, name))
+    install_subvasp(os.path.join(root, "bin"))
+    return support_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成合成的 VASP 输入输出与流程目录")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    p = subparsers.add_parser("tree", help="生成完整的合成流程目录")
+    p.add_argument('root', help="输出目录")
+    p.add_argument('--mat', default="Fe", help="MAT 名称")
+    p.add_argument('--atoms', type=int, default=200, help="slab 原子数")
+    p.add_argument('--adsorbates', nargs='+', default=list(ADSORBATES), help="吸附物")
+    p = subparsers.add_parser("vasp", help="在计算目录中生成合成的 VASP 输出（供假作业脚本调用）")
+    p.add_argument('directory', help="计算目录")
+    args = parser.parse_args()
+    if args.action == "tree":
+        print(make_tree(args.root, args.mat, args.adsorbates, args.atoms))
+    else:
+        fake_vasp(args.directory)
@@ -0,0 +1,267 @@
+import os
+import re
+import sys
+import stat
+import time
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import numpy as np
+import fsutil
+
+CACHE_DIR = os.environ.get("ELECTRONICFLOW_CACHE", os.path.expanduser("~/.electronicflow/calccache"))
+# 体数据文件的总容量上限（字节），超出时按最近最少使用淘汰
+MAX_VOLUMETRIC_BYTES = 200 * 1024 ** 3
+
+OUTPUT_FILES = ["OUTCAR", "CONTCAR", "OSZICAR", "vasprun.xml", "ACF.dat", "BCF.dat", "AVF.dat",
+                "CHGCAR", "AECCAR0", "AECCAR1", "AECCAR2", "CHGCAR_sum", "CHGCAR_diff", "LOCPOT", "DOSCAR"]
+VOLUMETRIC_FILES = {"CHGCAR", "AECCAR0", "AECCAR1", "AECCAR2", "CHGCAR_sum", "CHGCAR_diff", "LOCPOT", "WAVECAR"}
+# 只由本仓库的写出函数以临时文件加 os.replace 整体替换、从不原地改写的文件，可与缓存共享硬链接；
+# 其余文件（VASP 输出、外部 bader 程序的 BCF.dat/AVF.dat）重算时会被原地截断改写，只用 reflink 或复制
+LINKABLE_FILES = {"ACF.dat", "CHGCAR_sum", "CHGCAR_diff"}
+# 本进程中由 restore 放入的文件 -> 放入后的 (大小, 修改时间)，store 时不再重复存入
+_restored = {}
+# 只影响并行方式、不影响结果的 INCAR 参数，不参与计算哈希
+IGNORED_INCAR_KEYS = {"NCORE", "NPAR", "KPAR", "NSIM", "LPLANE", "SYSTEM"}
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def _normalize_value(value):
+    tokens = []
+    for token in value.split():
+        upper = token.upper().strip(".")
+        if upper in ("TRUE", "T"):
+            tokens.append("T")
+        elif upper in ("FALSE", "F"):
+            tokens.append("F")
+        else:
+            try:
+                tokens.append(repr(float(token)))
+            except ValueError:
+                tokens.append(token.upper())
+    return " ".join(tokens)
+
+
+def normalize_incar(path):
+    """解析 INCAR 为排序后的 KEY = value 文本，忽略注释、大小写与数值写法差异。"""
+    params = {}
+    with open(path) as file:
+        for line in file:
+            line = re.split(r"[#!]", line)[0]
+            for statement in line.split(";"):
+                if "=" not in statement:
+                    continue
+                key, value = statement.split("=", 1)
+                key = key.strip().upper()
+                if key and key not in IGNORED_INCAR_KEYS:
+                    params[key] = _normalize_value(value)
+    return "\n".join(f"{key} = {params[key]}" for key in sorted(params))
+
+
+def normalize_kpoints(path):
+    with open(path) as file:
+        lines = [" ".join(line.split()) for line in file]
+    # 第一行为注释
+    return "\n".join(lines[1:]).strip()
+
+
+def normalize_poscar(path, digits=5):
+    """晶格（已乘缩放因子）、元素、原子数与分数坐标，按 digits 位小数取整。"""
+    with open(path) as file:
+        lines = file.read().splitlines()
+    scale = float(lines[1].split()[0])
+    lattice = [[float(x) * scale for x in line.split()[:3]] for line in lines[2:5]]
+    if lines[5].split()[0].isdigit():
+        species, counts_line, pos = "", lines[5], 6
+    else:
+        species, counts_line, pos = " ".join(lines[5].split()), lines[6], 7
+    counts = [int(x) for x in counts_line.split()]
+    if lines[pos].strip()[:1] in ("S", "s"):
+        pos += 1
+    cartesian = lines[pos].strip()[:1] in ("C", "c", "K", "k")
+    coords = [[float(x) for x in line.split()[:3]] for line in lines[pos + 1:pos + 1 + sum(counts)]]
+    if cartesian:
+        coords = (np.array(coords) * scale @ np.linalg.inv(np.array(lattice))).tolist()
+    fmt = f"%.{digits}f"
+    out = [" ".join(fmt % x for x in row) for row in lattice]
+    out.append(species)
+    out.append(" ".join(map(str, counts)))
+    for row in coords:
+        out.append(" ".join(fmt % (round(x % 1.0, digits) % 1.0) for x in row))
+    return "\n".join(out)
+
+
+def potcar_identity(path):
+    """POTCAR 的身份由各赝势的 TITEL 行决定。"""
+    with open(path, errors="replace") as file:
+        return "\n".join(" ".join(line.split()) for line in file if "TITEL" in line)
+
+
+def calc_key(directory):
+    """由 INCAR、KPOINTS、POSCAR 与 POTCAR 身份计算计算任务的哈希键。"""
+    digest = hashlib.sha256()
+    for name, normalize in [("INCAR", normalize_incar), ("KPOINTS", normalize_kpoints),
+                            ("POSCAR", normalize_poscar), ("POTCAR", potcar_identity)]:
+        path = os.path.join(directory, name)
+        digest.update(name.encode() + b"\0")
+        if os.path.isfile(path):
+            digest.update(normalize(path).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _connect(cache_dir):
+    os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+    db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=60)
+    db.execute("CREATE TABLE IF NOT EXISTS files (key TEXT, name TEXT, size INTEGER, mtime_ns INTEGER, "
+               "last_used REAL, PRIMARY KEY (key, name))")
+    return db
+
+
+def _place(src, dst):
+    """
+    LINKABLE_FILES 可与缓存共享硬链接；其余文件会被重算原地改写，硬链接会让改写同时破坏缓存与
+    其他恢复出的目录，因此按 writable 放置（只用 reflink 或复制）。
+    """
+    return fsutil.place(src, dst, writable=os.path.basename(dst) not in LINKABLE_FILES)
+
+
+def _stored(src, blob, row):
+    """
+    src 是否已在缓存中：缓存文件完好，且 src 与其大小、修改时间一致，
+    或是本进程中由 restore 放入后未改动的文件。
+    """
+    if row is None:
+        return False
+    try:
+        src_st, blob_st = os.stat(src), os.stat(blob)
+    except OSError:
+        return False
+    if (blob_st.st_size, blob_st.st_mtime_ns) != row:
+        return False
+    signature = (src_st.st_size, src_st.st_mtime_ns)
+    return signature == row or _restored.get(os.path.abspath(src)) == signature
+
+
+def store(directory, cache_dir=CACHE_DIR):
+    """
+    将已完成计算的输出文件存入缓存（见 _place）并设为只读，返回键。缓存文件的修改时间设为源文件的，
+    已存入且未改动的文件（见 _stored）直接跳过，全部跳过时也不触发淘汰。
+    与缓存共享硬链接的 LINKABLE_FILES 在计算目录中也随之只读，其写出函数整体替换文件，不受影响。
+    """
+    key = calc_key(directory)
+    blob_dir = os.path.join(cache_dir, "blobs", key[:2], key)
+    os.makedirs(blob_dir, exist_ok=True)
+    db = _connect(cache_dir)
+    placed = 0
+    try:
+        now = time.time()
+        rows = {name: (size, mtime_ns) for name, size, mtime_ns in
+                db.execute("SELECT name, size, mtime_ns FROM files WHERE key = ?", (key,))}
+        for name in OUTPUT_FILES:
+            src = os.path.join(directory, name)
+            if not os.path.isfile(src):
+                continue
+            dst = os.path.join(blob_dir, name)
+            if _stored(src, dst, rows.get(name)):
+                continue
+            _place(src, dst)
+            os.chmod(dst, stat.S_IMODE(os.stat(dst).st_mode) & ~0o222)
+            os.utime(dst, ns=(time.time_ns(), os.stat(src).st_mtime_ns))
+            st = os.stat(dst)
+            db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", (key, name, st.st_size, st.st_mtime_ns, now))
+            placed += 1
+        db.execute("UPDATE files SET last_used = ? WHERE key = ?", (now, key))
+        db.commit()
+    finally:
+        db.close()
+    if placed:
+        evict(cache_dir=cache_dir)
+    return key
+
+
+def restore(directory, required=("OUTCAR",), cache_dir=CACHE_DIR):
+    """
+    若缓存中存在相同输入的计算且 required 中的文件齐全，
+    将缓存的输出文件放到 directory（见 _place）并返回 True，否则返回 False。
+    """
+    if not os.path.isdir(cache_dir) or not os.path.isdir(directory):
+        return False
+    key = calc_key(directory)
+    blob_dir = os.path.join(cache_dir, "blobs", key[:2], key)
+    db = _connect(cache_dir)
+    try:
+        rows = db.execute("SELECT name, size, mtime_ns FROM files WHERE key = ?", (key,)).fetchall()
+        available = []
+        for name, size, mtime_ns in rows:
+            path = os.path.join(blob_dir, name)
+            try:
+                st = os.stat(path)
+                intact = st.st_size == size and st.st_mtime_ns == mtime_ns
+            except OSError:
+                intact = False
+            if intact:
+                available.append(name)
+            else:
+                # 缓存文件丢失或被改写，删除记录
+                db.execute("DELETE FROM files WHERE key = ? AND name = ?", (key, name))
+        if not set(required) <= set(available):
+            db.commit()
+            return False
+        for name in available:
+            dst = os.path.join(directory, name)
+            _place(os.path.join(blob_dir, name), dst)
+            st = os.stat(dst)
+            _restored[os.path.abspath(dst)] = (st.st_size, st.st_mtime_ns)
+        db.execute("UPDATE files SET last_used = ? WHERE key = ?", (time.time(), key))
+        db.commit()
+    finally:
+        db.close()
+    log_info(f"Reused cached calculation {key[:12]} for {directory}.")
+    return True
+
+
+def evict(max_bytes=MAX_VOLUMETRIC_BYTES, cache_dir=CACHE_DIR):
+    """体数据文件总量超过 max_bytes 时，按最近最少使用顺序删除体数据文件，小文件保留。"""
+    db = _connect(cache_dir)
+    try:
+        placeholders = ",".join("?" * len(VOLUMETRIC_FILES))
+        rows = db.execute(f"SELECT key, name, size FROM files WHERE name IN ({placeholders}) ORDER BY last_used",
+                          tuple(VOLUMETRIC_FILES)).fetchall()
+        total = sum(size for _, _, size in rows)
+        removed = 0
+        for key, name, size in rows:
+            if total <= max_bytes:
+                break
+            path = os.path.join(cache_dir, "blobs", key[:2], key, name)
+            if os.path.exists(path):
+                os.remove(path)
+            db.execute("DELETE FROM files WHERE key = ? AND name = ?", (key, name))
+            total -= size
+            removed += 1
+        db.commit()
+    finally:
+        db.close()
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VASP 计算结果缓存")
+    parser.add_argument('action', choices=["key", "store", "restore", "evict"], help="操作")
+    parser.add_argument('directories', nargs='*', help="计算目录")
+    parser.add_argument('--max-gb', type=float, default=MAX_VOLUMETRIC_BYTES / 1024 ** 3, help="体数据容量上限（GB）")
+    args = parser.parse_args()
+    if args.action == "evict":
+        print(f"Removed {evict(int(args.max_gb * 1024 ** 3))} volumetric files.")
+        sys.exit(0)
+    for directory in args.directories:
+        if args.action == "key":
+            print(f"{calc_key(directory)}  {directory}")
+        elif args.action == "store":
+            print(f"{store(directory)}  {directory}")
+        elif not restore(directory):
+            print(f"No cached result for {directory}.")
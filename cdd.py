@@ -0,0 +1,241 @@
+import os
+import sys
+import csv
+import datetime
+import argparse
+import threading
+import concurrent.futures
+import numpy as np
+from chgcar import index_chgcar, iter_slabs, write_chgcar, check_compatible
+import throttle
+
+CDD_OUTPUT = "CHGCAR_diff"
+FRAGMENTS = ("support", "adsorbate")
+# 每个目录的 Δρ(z)、ΔQ(z) 曲线与所有目录的描述符汇总表
+PROFILE_OUTPUT = "cdd_profile.csv"
+CDD_TABLE = "cdd_descriptors.csv"
+TABLE_FIELDS = ["mat", "adsorbate", "directory", "z_iso", "charge_transfer", "charge_transfer_up",
+                "charge_transfer_down", "max_accumulation", "z_max_accumulation", "max_depletion", "z_max_depletion"]
+# 同一进程中多个分析任务（如 TaskGraph 的各吸附物）共同更新汇总表
+_table_lock = threading.Lock()
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+class PlanarProfile:
+    """
+    流式累计每个 z 层的面内求和：Δρ 的各自旋数据块，以及各片段的总密度（用于确定电荷转移边界）。
+    只保存长度为 NGZ 的数组，格点数据逐层（块）处理后即丢弃。
+    """
+
+    def __init__(self, index, nparts):
+        nx, ny, nz = index["grid"]
+        lattice = index["lattice"]
+        self.npoints = nx * ny * nz
+        self.area = np.linalg.norm(np.cross(lattice[0], lattice[1]))
+        self.height = abs(np.linalg.det(lattice)) / self.area
+        self.dz = self.height / nz
+        self.diff = {}
+        self.parts = np.zeros((nparts, nz))
+
+    def add(self, spin, z, diff, parts=()):
+        k = diff.shape[2]
+        self.diff.setdefault(spin, np.zeros(len(self.parts[0])))[z:z + k] = diff.sum(axis=(0, 1))
+        if spin == 0:
+            for i, slab in enumerate(parts):
+                self.parts[i, z:z + k] = slab.sum(axis=(0, 1))
+
+    def channels(self):
+        """各 z 层的电荷（e）：total，含磁化密度时另有 up = (total + mag) / 2 与 down = (total − mag) / 2。"""
+        q = {spin: values / self.npoints for spin, values in self.diff.items()}
+        channels = {"": q[0]}
+        if 1 in q:
+            channels["_up"] = (q[0] + q[1]) / 2
+            channels["_down"] = (q[0] - q[1]) / 2
+        return channels
+
+    def describe(self):
+        """
+        返回 (曲线, 描述符)。z 从真空中片段密度最小的层起算并连续展开，使 slab 不被周期边界截断；
+        ΔQ(z) 为 z 以下 Δρ 的累计电荷。电荷转移边界 z_iso 取载体与吸附物（孤立片段）面平均密度相等处，
+        charge_transfer 为边界吸附物一侧获得的电子数（正值表示电子流向吸附物）。
+        """
+        nz = len(self.parts[0])
+        start = int(np.argmin(self.parts.sum(axis=0)))
+        order = np.roll(np.arange(nz), -start)
+        z = (start + np.arange(nz)) * self.dz
+        curves = {"z": z}
+        for suffix, q in self.channels().items():
+            curves["drho" + suffix] = q[order] / (self.dz * self.area)
+            curves["dq" + suffix] = np.cumsum(q[order])
+        z_iso = self._boundary(order, z)
+        descriptors = {"z_iso": z_iso % self.height if z_iso is not None else ""}
+        above = self.parts.shape[0] > 1 and np.argmax(self.parts[1][order]) > np.argmax(self.parts[0][order])
+        for suffix in ("", "_up", "_down"):
+            if "dq" + suffix not in curves or z_iso is None:
+                descriptors["charge_transfer" + suffix] = ""
+                continue
+            dq = curves["dq" + suffix]
+            at_boundary = np.interp(z_iso, z, dq)
+            descriptors["charge_transfer" + suffix] = dq[-1] - at_boundary if above else at_boundary
+        line = curves["drho"] * self.area
+        descriptors.update({"max_accumulation": float(line.max()), "z_max_accumulation": z[np.argmax(line)] % self.height,
+                            "max_depletion": float(line.min()), "z_max_depletion": z[np.argmin(line)] % self.height})
+        return curves, descriptors
+
+    def _boundary(self, order, z):
+        # 在两片段密度峰之间寻找 ρ(support) − ρ(adsorbate) 的变号点并线性插值
+        if self.parts.shape[0] < 2:
+            return None
+        support, adsorbate = self.parts[0][order], self.parts[1][order]
+        i, j = int(np.argmax(support)), int(np.argmax(adsorbate))
+        step = 1 if j > i else -1
+        d = support - adsorbate
+        for k in range(i + step, j + step, step):
+            if d[k] <= 0:
+                prev = k - step
+                t = d[prev] / (d[prev] - d[k]) if d[prev] != d[k] else 0.0
+                return z[prev] + t * (z[k] - z[prev])
+        return None
+
+
+def _difference_slabs(whole, parts, spin, profile=None):
+    streams = [iter_slabs(index, spin) for index in [whole] + list(parts)]
+    z = 0
+    for slabs in zip(*streams):
+        diff = slabs[0].copy()
+        for slab in slabs[1:]:
+            diff -= slab
+        if profile is not None:
+            profile.add(spin, z, diff, slabs[1:])
+        z += diff.shape[2]
+        yield diff
+
+
+def charge_density_difference(whole_path, part_paths, output=CDD_OUTPUT, magnetization=True, profile=False):
+    """
+    计算 Δρ = ρ(AB) − Σρ(片段)，三个格点沿 z 方向逐层流式相减并写出 output。
+    若所有文件均含磁化密度块且 magnetization 为 True，同时写出磁化密度差。
+    profile 为 True 时在同一次流式读取中累计面平均曲线，返回 (output, PlanarProfile)。
+    """
+    whole = index_chgcar(whole_path)
+    parts = [index_chgcar(path) for path in part_paths]
+    check_compatible(whole, *parts)
+    spins = [0]
+    if magnetization and all(len(index["blocks"]) > 1 for index in [whole] + parts):
+        spins.append(1)
+    planar = PlanarProfile(whole, len(parts)) if profile else None
+    write_chgcar(output, whole["header"], *[_difference_slabs(whole, parts, spin, planar) for spin in spins])
+    return (output, planar) if profile else output
+
+
+def planar_profile(diff_path, part_paths=()):
+    """只读取已有的差分电荷密度（及片段密度，用于确定边界），流式计算面平均曲线。"""
+    diff = index_chgcar(diff_path)
+    parts = [index_chgcar(path) for path in part_paths]
+    check_compatible(diff, *parts)
+    planar = PlanarProfile(diff, len(parts))
+    for spin in range(min(len(diff["blocks"]), 2)):
+        z = 0
+        streams = [iter_slabs(diff, spin)] + ([iter_slabs(index, 0) for index in parts] if spin == 0 else [])
+        for slabs in zip(*streams):
+            planar.add(spin, z, slabs[0], slabs[1:])
+            z += slabs[0].shape[2]
+    return planar
+
+
+def write_profile(path, curves):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(list(curves))
+        for row in zip(*curves.values()):
+            writer.writerow([f"{value:.6e}" for value in row])
+    os.replace(tmp_path, path)
+
+
+def _describe(directory, planar):
+    curves, descriptors = planar.describe()
+    write_profile(os.path.join(directory, PROFILE_OUTPUT), curves)
+    mat = os.path.basename(os.path.normpath(directory))
+    adsorbate = os.path.basename(os.path.dirname(os.path.dirname(os.path.normpath(directory))))
+    return dict({"mat": mat, "adsorbate": adsorbate, "directory": directory}, **descriptors)
+
+
+def cdd_directory(directory, output=CDD_OUTPUT):
+    """
+    在 3-bader/MAT 目录下由 CHGCAR、support/CHGCAR 与 adsorbate/CHGCAR 计算差分电荷密度，
+    同时写出面平均曲线 cdd_profile.csv，返回 (输出文件, 描述符行)。
+    """
+    whole_path = os.path.join(directory, "CHGCAR")
+    part_paths = [os.path.join(directory, fragment, "CHGCAR") for fragment in FRAGMENTS]
+    written, planar = charge_density_difference(whole_path, part_paths, os.path.join(directory, output), profile=True)
+    return written, _describe(directory, planar)
+
+
+def profile_directory(directory, output=CDD_OUTPUT):
+    """由已有的 CHGCAR_diff 与片段 CHGCAR 只计算面平均曲线与描述符，返回 (CHGCAR_diff, 描述符行)。"""
+    diff_path = os.path.join(directory, output)
+    part_paths = [os.path.join(directory, fragment, "CHGCAR") for fragment in FRAGMENTS]
+    return diff_path, _describe(directory, planar_profile(diff_path, part_paths))
+
+
+def update_table(rows, output=CDD_TABLE):
+    """按目录增量更新描述符汇总表：本次分析的目录替换原有行，其余行保留。"""
+    with _table_lock:
+        existing = []
+        if os.path.isfile(output):
+            with open(output, newline='') as file:
+                existing = list(csv.DictReader(file))
+        directories = {row["directory"] for row in rows}
+        rows = [row for row in existing if row["directory"] not in directories] + list(rows)
+        rows.sort(key=lambda row: (row["mat"], row["adsorbate"], row["directory"]))
+        tmp_path = f"{output}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=TABLE_FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({key: f"{value:.6f}" if isinstance(value, float) else value for key, value in row.items()})
+        os.replace(tmp_path, output)
+
+
+def run_batch(directories, table=CDD_TABLE, profile_only=False):
+    """
+    在全局节流器的共享进程池中并行计算多个吸附物的差分电荷密度与面平均曲线，
+    描述符写入汇总表 table，返回成功写出的文件列表。profile_only 为 True 时只由已有的 CHGCAR_diff 计算曲线。
+    """
+    written, rows = [], []
+    worker = profile_directory if profile_only else cdd_directory
+    futures = {throttle.submit_local(worker, directory): directory for directory in directories}
+    for future in concurrent.futures.as_completed(futures):
+        directory = futures[future]
+        try:
+            output, row = future.result()
+            written.append(output)
+            rows.append(row)
+            log_info(f"Charge displacement profile written to {os.path.join(directory, PROFILE_OUTPUT)}." if profile_only
+                     else f"Charge density difference written to {output}.")
+        except (OSError, ValueError) as e:
+            log_error(f"Failed to compute charge density difference in {directory}. Details: {e}")
+    if rows and table:
+        update_table(rows, table)
+        log_info(f"Charge displacement descriptors of {len(rows)} directories written to {table}.")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="计算差分电荷密度 CHGCAR_diff（替代 vaspkit 314）及面平均 Δρ(z)、ΔQ(z)")
+    parser.add_argument('directories', nargs='+', help="一个或多个 3-bader/MAT 目录")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="并行进程数")
+    parser.add_argument('-o', '--output', default=CDD_TABLE, help="Δρ(z)/ΔQ(z) 描述符汇总表")
+    parser.add_argument('--profile-only', action='store_true', help="只由已有的 CHGCAR_diff 计算面平均曲线与描述符")
+    args = parser.parse_args()
+    throttle.configure(max_workers=args.jobs)
+    if len(run_batch(args.directories, args.output, args.profile_only)) != len(args.directories):
+        sys.exit(1)
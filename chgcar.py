@@ -0,0 +1,297 @@
+import os
+import sys
+import mmap
+import argparse
+import numpy as np
+
+# 每次解析的最大数据量（数值个数），用于限制峰值内存
+CHUNK_VALUES = 4 * 1024 * 1024
+VALUES_PER_LINE = 5
+VALUE_FORMAT = " %17.11E"
+
+
+def _open_mmap(path):
+    with open(path, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _is_int_line(line):
+    try:
+        [int(x) for x in line.split()]
+        return bool(line.split())
+    except ValueError:
+        return False
+
+
+def _next_line(mm, pos):
+    """返回从 pos 开始的一行（不含换行符）以及下一行的起始位置。"""
+    end = mm.find(b"\n", pos)
+    if end == -1:
+        end = len(mm)
+    return mm[pos:end], end + 1
+
+
+def _find_block_end(mm, start, nvalues):
+    """
+    估算数据块末尾位置。VASP 输出为定宽行，先按首行宽度直接计算，
+    校验失败时返回 None，由调用方退回到逐块搜索。
+    """
+    first_line, next_pos = _next_line(mm, start)
+    per_line = len(first_line.split())
+    if per_line == 0:
+        return None
+    line_len = next_pos - start
+    full_end = start + (nvalues // per_line) * line_len
+    if full_end > len(mm) or mm[full_end - 1:full_end] != b"\n":
+        return None
+    return full_end
+
+
+def index_chgcar(path):
+    """
+    为 CHGCAR/AECCAR 文件建立索引：解析头部与原子块，
+    并记录每个自旋数据块的起始字节位置，不读取格点数据本身。
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"文件不存在：{path}")
+    mm = _open_mmap(path)
+    try:
+        pos = 0
+        lines = []
+        for _ in range(5):
+            line, pos = _next_line(mm, pos)
+            lines.append(line)
+        scale = float(lines[1].split()[0])
+        lattice = np.array([[float(x) for x in line.split()[:3]] for line in lines[2:5]])
+        if scale < 0:
+            scale = (-scale / abs(np.linalg.det(lattice))) ** (1.0 / 3.0)
+        lattice *= scale
+
+        line, pos = _next_line(mm, pos)
+        if _is_int_line(line):
+            species = []
+            counts = [int(x) for x in line.split()]
+        else:
+            species = line.decode().split()
+            line, pos = _next_line(mm, pos)
+            counts = [int(x) for x in line.split()]
+        natoms = sum(counts)
+
+        line, pos = _next_line(mm, pos)
+        if line.strip()[:1] in (b"S", b"s"):
+            line, pos = _next_line(mm, pos)
+        cartesian = line.strip()[:1] in (b"C", b"c", b"K", b"k")
+        atoms_start = pos
+        for _ in range(natoms):
+            line, pos = _next_line(mm, pos)
+        atoms_end = pos
+
+        # 跳过空行后读取格点维度
+        line, pos = _next_line(mm, pos)
+        while not line.strip():
+            line, pos = _next_line(mm, pos)
+        grid_line = line
+        grid = tuple(int(x) for x in grid_line.split()[:3])
+        header = mm[:pos]
+
+        nvalues = grid[0] * grid[1] * grid[2]
+        marker = b"\n" + grid_line + b"\n"
+        blocks = [pos]
+        while True:
+            start = blocks[-1]
+            search_from = (_find_block_end(mm, start, nvalues) or start + 1) - 1
+            found = mm.find(marker, search_from)
+            if found == -1:
+                break
+            blocks.append(found + len(marker))
+    finally:
+        mm.close()
+
+    return {
+        "path": path,
+        "header": header,
+        "lattice": lattice,
+        "scale": scale,
+        "cartesian": cartesian,
+        "species": species,
+        "counts": counts,
+        "natoms": natoms,
+        "atoms": (atoms_start, atoms_end),
+        "grid": grid,
+        "blocks": blocks,
+    }
+
+
+def read_positions(index):
+    """读取原子块中的坐标，统一返回分数坐标。"""
+    start, end = index["atoms"]
+    with open(index["path"], 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start)
+    coords = np.array([[float(x) for x in line.split()[:3]] for line in text.splitlines()])
+    if index["cartesian"]:
+        coords = coords * index["scale"] @ np.linalg.inv(index["lattice"])
+    return coords
+
+
+def _parse_lines(mm, pos, nlines):
+    """从 pos 开始解析 nlines 行数值，返回数组与下一行起始位置。"""
+    first_line, next_pos = _next_line(mm, pos)
+    guess = pos + nlines * (next_pos - pos)
+    if guess <= len(mm) and mm[guess - 1:guess] == b"\n":
+        end = guess
+    else:
+        # 非定宽行：向量化定位第 nlines 个换行符
+        span = max(guess - pos, 1)
+        while True:
+            region = np.frombuffer(mm, dtype=np.uint8, count=min(span, len(mm) - pos), offset=pos)
+            newlines = np.flatnonzero(region == 10)
+            if len(newlines) >= nlines or pos + span >= len(mm):
+                break
+            span *= 2
+        if len(newlines) >= nlines:
+            end = pos + int(newlines[nlines - 1]) + 1
+        else:
+            end = len(mm)
+        del region
+    values = np.fromstring(mm[pos:end], dtype=float, sep=" ")
+    return values, end
+
+
+def iter_slabs(index, spin=0, nz_chunk=None):
+    """
+    沿 z 方向按层流式读取第 spin 个数据块（0 为总密度，1 为磁化密度），
+    每次产出形状为 (NGX, NGY, k) 的数组，其余数据块不会被读取。
+    """
+    if spin >= len(index["blocks"]):
+        raise ValueError(f"{index['path']} 中不存在第 {spin} 个数据块")
+    nx, ny, nz = index["grid"]
+    plane = nx * ny
+    if nz_chunk is None:
+        nz_chunk = max(1, CHUNK_VALUES // plane)
+    mm = _open_mmap(index["path"])
+    try:
+        pos = index["blocks"][spin]
+        _, next_pos = _next_line(mm, pos)
+        per_line = len(mm[pos:next_pos].split())
+        buffer = np.empty(0)
+        z = 0
+        while z < nz:
+            k = min(nz_chunk, nz - z)
+            need = k * plane - len(buffer)
+            if need > 0:
+                nlines = -(-need // per_line)
+                values, pos = _parse_lines(mm, pos, nlines)
+                buffer = np.concatenate([buffer, values])
+            if len(buffer) < k * plane:
+                raise ValueError(f"{index['path']} 中的数据块不完整")
+            yield buffer[:k * plane].reshape((nx, ny, k), order='F')
+            buffer = buffer[k * plane:]
+            z += k
+    finally:
+        mm.close()
+
+
+def read_grid(index, spin=0):
+    """读取完整的数据块，返回 (NGX, NGY, NGZ) 数组。"""
+    nx, ny, nz = index["grid"]
+    grid = np.empty((nx, ny, nz))
+    z = 0
+    for slab in iter_slabs(index, spin):
+        grid[:, :, z:z + slab.shape[2]] = slab
+        z += slab.shape[2]
+    return grid
+
+
+def block_end(index, spin=0):
+    """返回第 spin 个数据块最后一行数值之后的字节位置（其后为增广占据数等附加数据）。"""
+    nx, ny, nz = index["grid"]
+    nvalues = nx * ny * nz
+    mm = _open_mmap(index["path"])
+    try:
+        start = index["blocks"][spin]
+        end = _find_block_end(mm, start, nvalues)
+        first_line, next_pos = _next_line(mm, start)
+        per_line = len(first_line.split())
+        if end is None:
+            _, end = _parse_lines(mm, start, -(-nvalues // per_line))
+        elif nvalues % per_line:
+            _, end = _next_line(mm, end)
+        return min(end, len(mm))
+    finally:
+        mm.close()
+
+
+def _format_values(values):
+    nlines = len(values) // VALUES_PER_LINE
+    fmt = (VALUE_FORMAT * VALUES_PER_LINE + "\n") * nlines
+    return fmt % tuple(values[:nlines * VALUES_PER_LINE])
+
+
+def write_chgcar(path, header, *blocks, tails=None):
+    """
+    将头部与按层产出的数据写为 CHGCAR 格式文件，每行 5 个数值。
+    每个数据块可以是生成器，写入过程中只保留当前层的数据；
+    多个数据块（如总密度与磁化密度）之间重复写出格点维度行。
+    给出 tails 时，每个数据块之后原样写出对应的附加文本（增广占据数与下一块的格点维度行），
+    不再自动写格点维度行。
+    """
+    header = header.decode() if isinstance(header, bytes) else header
+    grid_line = header.rstrip("\n").rsplit("\n", 1)[-1] + "\n"
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        file.write(header)
+        for i, slabs in enumerate(blocks):
+            if i > 0 and tails is None:
+                file.write(grid_line)
+            carry = np.empty(0)
+            # 每次格式化的数值个数须为整行，否则 _format_values 会丢弃不满一行的部分
+            step = max(VALUES_PER_LINE, CHUNK_VALUES // 4 // VALUES_PER_LINE * VALUES_PER_LINE)
+            for slab in slabs:
+                values = np.concatenate([carry, np.ravel(slab, order='F')])
+                nfull = len(values) - len(values) % VALUES_PER_LINE
+                for start in range(0, nfull, step):
+                    file.write(_format_values(values[start:min(start + step, nfull)]))
+                carry = values[nfull:]
+            if len(carry):
+                file.write("".join(VALUE_FORMAT % v for v in carry) + "\n")
+            if tails is not None and i < len(tails):
+                file.write(tails[i].decode() if isinstance(tails[i], bytes) else tails[i])
+    os.replace(tmp_path, path)
+
+
+def check_compatible(*indexes, tol=1e-4):
+    """检查多个体数据文件的格点维度与晶格是否一致。"""
+    ref = indexes[0]
+    for index in indexes[1:]:
+        if index["grid"] != ref["grid"]:
+            raise ValueError(f"格点维度不一致：{ref['path']} {ref['grid']} vs {index['path']} {index['grid']}")
+        if not np.allclose(index["lattice"], ref["lattice"], atol=tol):
+            raise ValueError(f"晶格不一致：{ref['path']} vs {index['path']}")
+
+
+def chgsum(aeccar0="AECCAR0", aeccar2="AECCAR2", output="CHGCAR_sum"):
+    """
+    替代 chgsum.pl：逐层相加 AECCAR0 与 AECCAR2 的总密度并写出 CHGCAR_sum，
+    峰值内存与单个 z 层块成正比。
+    """
+    index0 = index_chgcar(aeccar0)
+    index2 = index_chgcar(aeccar2)
+    check_compatible(index0, index2)
+    slabs = (a + b for a, b in zip(iter_slabs(index0), iter_slabs(index2)))
+    write_chgcar(output, index0["header"], slabs)
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将 AECCAR0 与 AECCAR2 相加得到 CHGCAR_sum（替代 chgsum.pl）")
+    parser.add_argument('aeccar0', nargs='?', default="AECCAR0", help="AECCAR0 文件路径")
+    parser.add_argument('aeccar2', nargs='?', default="AECCAR2", help="AECCAR2 文件路径")
+    parser.add_argument('-o', '--output', default="CHGCAR_sum", help="输出文件路径")
+    args = parser.parse_args()
+    try:
+        chgsum(args.aeccar0, args.aeccar2, args.output)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{args.output} has been written.")
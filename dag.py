@@ -0,0 +1,192 @@
+import sys
+import time
+import queue
+import datetime
+import concurrent.futures
+import journal as run_journal
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+WAITING = "waiting"
+SUCCESS = "success"
+FAILED = "failed"
+SKIPPED = "skipped"
+RESUMED = "resumed"
+# 视为已成功、可启动后继任务的状态
+DONE_STATES = (SUCCESS, RESUMED)
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+class Task:
+    def __init__(self, name, func, args, deps, files=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.deps = list(deps)
+        self.files = list(files)
+        self.dependents = []
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.start = None
+        self.end = None
+        self.inputs = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class TaskGraph:
+    """
+    任务依赖图执行器：每个任务在其全部前置任务成功后立即启动，
+    同时运行的任务数不超过 max_workers。任务函数若返回 Future（例如作业监视器的 watch），
+    则任务进入等待状态并释放工作线程，直到 Future 完成。
+    前置任务失败时，其所有后继任务被跳过。
+    给出运行日志（journal.Journal）时记录每个任务的开始、等待、完成与失败；
+    续算时以相同输入（参数、files 中输入文件的内容与前置任务的结果，见 journal.inputs_hash）
+    完成且前置任务也均已完成的任务直接沿用记录的结果，
+    等待中的作业由后继的等待任务按记录的作业号重新接管。
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, func, *args, deps=(), files=()):
+        if name in self.tasks:
+            raise ValueError(f"任务重复：{name}")
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"任务 {name} 的前置任务不存在：{dep}")
+        task = Task(name, func, args, deps, files)
+        self.tasks[name] = task
+        for dep in deps:
+            self.tasks[dep].dependents.append(task)
+        return name
+
+    def result(self, name):
+        """返回已完成任务的结果，供后继任务读取（如作业号）。"""
+        return self.tasks[name].result
+
+    def _inputs(self, task):
+        return run_journal.inputs_hash(task.func, task.args, task.files,
+                                       [self.tasks[dep].result for dep in task.deps])
+
+    def _resume(self, journal):
+        """按添加顺序（即依赖顺序）标记可沿用的任务，返回其数目。"""
+        resumed = 0
+        for task in self.tasks.values():
+            task.inputs = self._inputs(task)
+            if (journal.resume and journal.completed(task.name, task.inputs)
+                    and all(self.tasks[dep].status == RESUMED for dep in task.deps)):
+                task.status = RESUMED
+                task.result = journal.result(task.name)
+                resumed += 1
+        if resumed:
+            log_info(f"Resumed {resumed} of {len(self.tasks)} tasks from {journal.path}.")
+        return resumed
+
+    def run(self, max_workers=4, journal=None):
+        """执行全部任务，返回是否全部成功。"""
+        events = queue.Queue()
+        remaining = len(self.tasks)
+        if journal is not None:
+            remaining -= self._resume(journal)
+
+        def record(task, event, **fields):
+            if journal is not None:
+                journal.record(task.name, event, task.inputs, **fields)
+
+        def finish(task, future):
+            events.put((task, future))
+
+        def launch(task, executor):
+            task.status = RUNNING
+            task.start = time.time()
+            if journal is not None:
+                # 前置任务的结果与输入文件此时才确定
+                task.inputs = self._inputs(task)
+            record(task, run_journal.START)
+            executor.submit(task.func, *task.args).add_done_callback(lambda f: finish(task, f))
+
+        def skip(task):
+            nonlocal remaining
+            for child in task.dependents:
+                if child.status == PENDING:
+                    child.status = SKIPPED
+                    remaining -= 1
+                    log_error(f"Task {child.name} skipped because {task.name} did not succeed.")
+                    skip(child)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for task in self.tasks.values():
+                if task.status == PENDING and all(self.tasks[dep].status in DONE_STATES for dep in task.deps):
+                    launch(task, executor)
+            while remaining:
+                task, future = events.get()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if task.status == WAITING and journal is not None:
+                        # 等待的作业失败：续算时需要重新执行发起作业的前置任务
+                        for dep in task.deps:
+                            journal.invalidate(dep)
+                    task.end = time.time()
+                    task.status = FAILED
+                    task.error = e
+                    remaining -= 1
+                    record(task, run_journal.FAILED, error=repr(e))
+                    log_error(f"Task {task.name} failed: {e!r}")
+                    skip(task)
+                    continue
+                if isinstance(result, concurrent.futures.Future):
+                    # 异步等待（如 Slurm 作业），不占用工作线程
+                    task.status = WAITING
+                    record(task, run_journal.WAITING)
+                    result.add_done_callback(lambda f, task=task: finish(task, f))
+                    continue
+                task.end = time.time()
+                task.status = SUCCESS
+                task.result = result
+                remaining -= 1
+                record(task, run_journal.DONE, result=result)
+                for child in task.dependents:
+                    if child.status == PENDING and all(self.tasks[dep].status in DONE_STATES for dep in child.deps):
+                        launch(child, executor)
+        return all(task.status in DONE_STATES for task in self.tasks.values())
+
+    def critical_path(self):
+        """按实际耗时回溯关键路径：从最晚结束的任务出发，每步选择最晚结束的前置任务。"""
+        finished = [task for task in self.tasks.values() if task.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda task: task.end)]
+        while path[-1].deps:
+            deps = [self.tasks[dep] for dep in path[-1].deps if self.tasks[dep].end is not None]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda task: task.end))
+        return path[::-1]
+
+    def report(self):
+        """输出每个任务的状态与耗时，以及关键路径。"""
+        starts = [task.start for task in self.tasks.values() if task.start is not None]
+        ends = [task.end for task in self.tasks.values() if task.end is not None]
+        wall = max(ends) - min(starts) if starts and ends else 0.0
+        lines = [f"{'TASK':<40}{'STATUS':<10}{'SECONDS':>10}"]
+        for task in self.tasks.values():
+            lines.append(f"{task.name:<40}{task.status:<10}{task.duration:>10.1f}")
+        path = self.critical_path()
+        lines.append(f"Wall time: {wall:.1f} s")
+        lines.append("Critical path: " + " -> ".join(f"{task.name} ({task.duration:.1f} s)" for task in path))
+        return "\n".join(lines)
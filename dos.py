@@ -0,0 +1,149 @@
+import os
+import csv
+import sys
+import datetime
+import argparse
+import concurrent.futures
+import numpy as np
+import throttle
+
+DBAND_TABLE = "dband.csv"
+# 各投影列数对应的 d 轨道列（不含能量列，单自旋）
+D_COLUMNS = {
+    3: [2],                  # s p d
+    4: [2],                  # s p d f
+    9: [4, 5, 6, 7, 8],      # s py pz px dxy dyz dz2 dxz dx2
+    16: [4, 5, 6, 7, 8],     # 同上，加 f 轨道
+}
+TABLE_FIELDS = ["directory", "atom", "element", "spin", "d_center", "d_width", "d_filling",
+                "d_states_at_ef", "total_dos_at_ef"]
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def read_doscar(path):
+    """
+    一次读取 DOSCAR，返回：
+    energies (NEDOS,) 已减去费米能级；total (ISPIN, NEDOS)；
+    pdos (NATOMS, ISPIN, NPROJ, NEDOS)，无投影态密度时为 None；efermi。
+    """
+    with open(path) as file:
+        lines = file.read().splitlines()
+    natoms = int(lines[0].split()[0])
+    emax, emin, nedos, efermi = lines[5].split()[:4]
+    nedos, efermi = int(nedos), float(efermi)
+
+    block = np.fromstring(" ".join(lines[6:6 + nedos]), sep=" ").reshape(nedos, -1)
+    energies = block[:, 0] - efermi
+    ispin = 2 if block.shape[1] == 5 else 1
+    total = block[:, 1:1 + ispin].T
+
+    pdos = None
+    rest = lines[6 + nedos:]
+    if len(rest) >= natoms * (nedos + 1):
+        # 去掉每个原子块前的头部行后整体解析
+        body = [line for i, line in enumerate(rest[:natoms * (nedos + 1)]) if i % (nedos + 1)]
+        values = np.fromstring(" ".join(body), sep=" ")
+        ncol = values.size // (natoms * nedos)
+        values = values.reshape(natoms, nedos, ncol)[:, :, 1:]
+        # 自旋分辨时列按 up/down 交替排列
+        pdos = values.reshape(natoms, nedos, -1, ispin).transpose(0, 3, 2, 1)
+    return energies, total, pdos, efermi
+
+
+def read_elements(directory):
+    """从 CONTCAR（或 POSCAR）头部读出每个原子的元素符号。"""
+    for name in ("CONTCAR", "POSCAR"):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path) as file:
+                lines = [next(file) for _ in range(7)]
+            species, counts = lines[5].split(), lines[6].split()
+            if all(x.isdigit() for x in species):
+                return []
+            return [el for el, n in zip(species, counts) for _ in range(int(n))]
+    return []
+
+
+def d_band_descriptors(energies, pdos, window=(-np.inf, np.inf)):
+    """
+    对所有原子向量化计算 d 带中心、宽度（二阶矩的平方根）、填充率与费米能级处态密度。
+    返回的数组形状均为 (NATOMS, ISPIN)。
+    """
+    columns = D_COLUMNS.get(pdos.shape[2])
+    if columns is None:
+        raise ValueError(f"无法识别的投影列数：{pdos.shape[2]}")
+    rho = np.abs(pdos[:, :, columns, :].sum(axis=2))
+    mask = (energies >= window[0]) & (energies <= window[1])
+    e = energies[mask]
+    rho_w = rho[..., mask]
+    norm = rho_w.sum(axis=-1)
+    safe = np.where(norm > 0, norm, 1.0)
+    center = (rho_w * e).sum(axis=-1) / safe
+    width = np.sqrt(np.maximum((rho_w * (e - center[..., None]) ** 2).sum(axis=-1) / safe, 0.0))
+    filling = (rho_w * (e <= 0)).sum(axis=-1) / safe
+    at_ef = np.apply_along_axis(lambda y: np.interp(0.0, energies, y), -1, rho)
+    invalid = norm <= 0
+    center[invalid] = width[invalid] = filling[invalid] = np.nan
+    return {"d_center": center, "d_width": width, "d_filling": filling, "d_states_at_ef": at_ef}
+
+
+def analyze_directory(directory, atoms=None, window=(-np.inf, np.inf)):
+    """
+    分析目录中的 DOSCAR，返回表格行列表。atoms 为从 1 开始的原子序号；
+    为 None 时输出所有含 d 态的原子。
+    """
+    energies, total, pdos, _ = read_doscar(os.path.join(directory, "DOSCAR"))
+    if pdos is None:
+        raise ValueError(f"{directory}/DOSCAR 中没有投影态密度（需设置 LORBIT）")
+    descriptors = d_band_descriptors(energies, pdos, window)
+    total_at_ef = [np.interp(0.0, energies, channel) for channel in total]
+    elements = read_elements(directory)
+    if atoms is None:
+        atoms = [i + 1 for i in range(pdos.shape[0]) if not np.isnan(descriptors["d_center"][i]).all()]
+    spins = ["up", "down"] if pdos.shape[1] == 2 else ["total"]
+    rows = []
+    for atom in atoms:
+        for s, spin in enumerate(spins):
+            row = {"directory": directory, "atom": atom,
+                   "element": elements[atom - 1] if atom <= len(elements) else "",
+                   "spin": spin, "total_dos_at_ef": total_at_ef[s]}
+            row.update({name: values[atom - 1, s] for name, values in descriptors.items()})
+            rows.append(row)
+    return rows
+
+
+def run_batch(directories, output=DBAND_TABLE, atoms=None):
+    """在全局节流器的共享进程池中并行分析多个 DOS 目录，结果写入同一个 CSV 表格，返回行数。"""
+    rows = []
+    futures = {throttle.submit_local(analyze_directory, directory, atoms): directory for directory in directories}
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            rows.extend(future.result())
+        except (OSError, ValueError, IndexError) as e:
+            log_error(f"DOS analysis failed in {futures[future]}. Details: {e}")
+    rows.sort(key=lambda row: (row["directory"], row["atom"], row["spin"]))
+    with open(output, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=TABLE_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: f"{value:.6f}" if isinstance(value, float) else value for key, value in row.items()})
+    log_info(f"d-band descriptors of {len(directories)} directories written to {output}.")
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="解析 DOSCAR 并计算 d 带描述符")
+    parser.add_argument('directories', nargs='+', help="一个或多个含 DOSCAR 的目录")
+    parser.add_argument('-o', '--output', default=DBAND_TABLE, help="输出 CSV 文件")
+    parser.add_argument('-a', '--atoms', type=int, nargs='+', default=None, help="原子序号（从 1 开始）")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="并行进程数")
+    args = parser.parse_args()
+    throttle.configure(max_workers=args.jobs)
+    run_batch(args.directories, args.output, args.atoms)
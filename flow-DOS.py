@@ -2,53 +2,66 @@ import os
 import sys
 import subprocess
 import re
-import time
+import argparse
 import concurrent.futures
+from slurm import wait_for_job_completion, failed_jobs
+import dos
+import NELECT
+import upik0
+import upik
+import throttle
+import journal
+import tracing
 
 
-def run_command(command, cwd=None):
-    """
-    同步执行命令（适用于 NELECT.py、upik0.py、upik.py 等）。
-    如果返回码非 0，则退出整个脚本。
-    """
-    result = subprocess.run(command, cwd=cwd)
-    if result.returncode != 0:
-        print(f"Command {' '.join(command)} failed with return code {result.returncode}.")
-        sys.exit(result.returncode)
+def submit(command, cwd=None):
+    """提交作业并返回输出中形如 "job <jobid>" 的作业号，无法解析时返回 None。"""
+    output = subprocess.check_output(command, cwd=cwd, universal_newlines=True)
+    job_match = re.search(r'job\s+(\d+)', output, re.IGNORECASE)
+    return job_match.group(1) if job_match else None
 
 
-def submit_and_wait(command, cwd=None):
+def submit_checked(command, cwd=None):
     """
-    提交作业并等待作业完成。用于调用 gam-subvasp.sh 和 std-subvasp.sh，
-    要求输出中包含形如 "job <jobid>" 的作业号。
+    提交作业并返回作业号。用于调用 gam-subvasp.sh 和 std-subvasp.sh，
+    提交受全局节流器的排队上限约束。
     """
     try:
-        output = subprocess.check_output(command, cwd=cwd, universal_newlines=True)
+        job_id = throttle.submit_job(submit, command, cwd)
     except subprocess.CalledProcessError as e:
-        print(f"Command {' '.join(command)} failed with error: {e}")
-        sys.exit(e.returncode)
-    job_match = re.search(r'job\s+(\d+)', output, re.IGNORECASE)
-    if job_match:
-        job_id = job_match.group(1)
-        wait_for_job_completion(job_id)
-    else:
-        print("Could not parse job id from output.")
-        sys.exit(1)
+        raise RuntimeError(f"Command {' '.join(command)} failed with error: {e}") from e
+    if not job_id:
+        raise RuntimeError(f"Could not parse job id from the output of {' '.join(command)}.")
+    return job_id
+
+
+def wait_checked(job_id, directory):
+    """
+    等待作业结束，非正常结束时退出。续算时对仍在运行的作业同样适用。
+    sacct 无记录（UNKNOWN）时由 directory 中的计算结果确认作业是否正常结束。
+    """
+    state = wait_for_job_completion(job_id)
+    if failed_jobs({job_id: state}, [directory]):
+        raise RuntimeError(f"Job {job_id} finished with state {state}.")
+    return state
 
 
-def wait_for_job_completion(job_id):
+def submit_and_wait(run_journal, stage, command, cwd, directory, files=()):
     """
-    循环检查 squeue 中是否还有该作业，直到作业完成。
-    仅输出最少信息。
+    提交作业并等待作业完成，两步分别记入运行日志：续算时已提交的作业不再重复提交，
+    而是按记录的作业号继续等待；作业失败时撤销提交记录，以便续算时重新提交。
+    directory 为作业的计算目录，用于确认 sacct 无记录的作业；files 为提交步骤的输入文件。
     """
-    while True:
-        try:
-            job_status = subprocess.check_output(['squeue', '-j', job_id], universal_newlines=True)
-        except subprocess.CalledProcessError:
-            break
-        if job_id not in job_status:
-            break
-        time.sleep(60)
+    track, name = tracing.split_name(stage)
+    with tracing.span(f"{name}-submit", track):
+        job_id = run_journal.step(f"{stage}-submit", submit_checked, command, cwd, files=files)
+    tracing.get_tracer().add_jobs(job_id, name, track)
+    try:
+        with tracing.span(f"{name}-wait", track):
+            run_journal.step(f"{stage}-wait", wait_checked, job_id, directory)
+    except RuntimeError:
+        run_journal.invalidate(f"{stage}-submit")
+        raise
 
 
 def get_four_dos_dir(adsorbate):
@@ -64,43 +77,66 @@ def get_four_dos_dir(adsorbate):
     return four_dos_dir
 
 
-def process_adsorbate(MAT, net_charge, adsorbate):
+def process_adsorbate(MAT, net_charge, adsorbate, run_journal):
     """
-    针对单个 adsorbate 执行全部流程：
-    1. 调用 NELECT.py
-    2. 调用 upik0.py
+    针对单个 adsorbate 执行全部流程（NELECT、upik0、upik 均在本进程内调用）：
+    1. 计算 NELECT
+    2. 调用 upik0 生成 4-dos 输入
     3. 在对应的 4-dos 目录下提交 gam-subvasp.sh MAT，并等待作业完成
-    4. 调用 upik.py
+    4. 调用 upik 修改 INCAR 与 KPOINTS
     5. 在对应的 4-dos 目录下提交 std-subvasp.sh MAT，并等待作业完成
+    每一步都记入运行日志，续算时跳过已完成的步骤。
     """
     print(f"Processing adsorbate: {adsorbate}")
-    run_command(["python", "NELECT.py", MAT, adsorbate, net_charge])
-    run_command(["python", "upik0.py", MAT, adsorbate])
+    step = lambda name: f"dos:{adsorbate}:{name}"
+    # 各步骤均以结构优化得到的结构为输入文件，结构改变时续算会重新执行全部步骤
+    files = [os.path.join("..", adsorbate, MAT, "CONTCAR")]
+    with tracing.span("dos:nelect", adsorbate):
+        run_journal.step(step("nelect"), NELECT.update_nelect, MAT, net_charge, [adsorbate], files=files)
+    with tracing.span("dos:upik0", adsorbate):
+        run_journal.step(step("upik0"), upik0.main, MAT, [adsorbate], files=files)
     four_dos_dir = get_four_dos_dir(adsorbate)
-    submit_and_wait([os.path.expanduser("~/bin/gam-subvasp.sh"), MAT], cwd=four_dos_dir)
-    run_command(["python", "upik.py", MAT, adsorbate])
-    submit_and_wait([os.path.expanduser("~/bin/std-subvasp.sh"), MAT], cwd=four_dos_dir)
+    dos_dir = os.path.join(four_dos_dir, MAT)
+    submit_and_wait(run_journal, step("gam"), [os.path.expanduser("~/bin/gam-subvasp.sh"), MAT], four_dos_dir, dos_dir,
+                    files)
+    with tracing.span("dos:upik", adsorbate):
+        run_journal.step(step("upik"), upik.main, MAT, [adsorbate], files=files)
+    submit_and_wait(run_journal, step("std"), [os.path.expanduser("~/bin/std-subvasp.sh"), MAT], four_dos_dir, dos_dir,
+                    files)
     print(f"Finished processing adsorbate: {adsorbate}")
 
 
 def main():
     # 参数顺序：MAT net_charge adsorbate1 [adsorbate2 ...]
-    if len(sys.argv) < 4:
-        print("Usage: python script4.py MAT net_charge adsorbate1 [adsorbate2 ...]")
-        sys.exit(1)
-    MAT = sys.argv[1]
-    net_charge = sys.argv[2]
-    adsorbates = sys.argv[3:]
-
-    # 使用并行执行各 adsorbate 的流程
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        futures = [executor.submit(process_adsorbate, MAT, net_charge, ads) for ads in adsorbates]
+    parser = argparse.ArgumentParser(description="DOS 计算流程")
+    parser.add_argument('MAT', help="MAT 目录名称")
+    parser.add_argument('net_charge', help="体系净电荷")
+    parser.add_argument('adsorbates', nargs='+', help="一个或多个 adsorbate")
+    parser.add_argument('--resume', action='store_true', help="按运行日志跳过已完成的步骤，并接管仍在运行的作业")
+    parser.add_argument('--trace', default=None, help="各步骤与作业排队/运行时间的 Chrome trace 输出文件（默认 trace_MAT.json）")
+    args = parser.parse_args()
+    MAT = args.MAT
+    net_charge = args.net_charge
+    adsorbates = args.adsorbates
+    run_journal = journal.Journal(journal.journal_path(MAT, "dos"), resume=args.resume)
+    tracing.get_tracer().name = MAT
+    trace_file = args.trace or tracing.trace_path(MAT)
+
+    # 使用线程并行执行各 adsorbate 的流程，所有作业共用同一个作业监视器
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(adsorbates)) as executor:
+        futures = [executor.submit(process_adsorbate, MAT, net_charge, ads, run_journal) for ads in adsorbates]
         for future in concurrent.futures.as_completed(futures):
             try:
                 future.result()
             except Exception as exc:
                 print("An error occurred during processing:", exc)
+                tracing.finish(trace_file)
                 sys.exit(1)
+    # 汇总所有 adsorbate 的 d 带描述符
+    dos_dirs = [os.path.join(get_four_dos_dir(ads), MAT) for ads in adsorbates]
+    with tracing.span("dos:table"):
+        dos.run_batch(dos_dirs, output=f"dband_{MAT}.csv")
+    tracing.finish(trace_file)
     print("All tasks have been successfully completed.")
 
 
@@ -1,50 +1,129 @@
 import sys
 import subprocess
 import os
-import concurrent.futures
+import re
+import argparse
+import ORRbader
+import ORRcdd
+from dag import TaskGraph
+from slurm import watch_jobs
+import dos
+import badertable
+import NELECT
+import upik0
+import upik
+import throttle
+import journal
+import tracing
 
 
-def run_command(command, cwd=None):
-    """同步执行命令，若返回码非0则退出。"""
-    print(f"Running: {' '.join(command)} (cwd: {cwd if cwd else os.getcwd()})")
-    result = subprocess.run(command, cwd=cwd)
-    if result.returncode != 0:
-        print(f"Command {' '.join(command)} failed with return code {result.returncode}.")
-        sys.exit(result.returncode)
+def submit(command, cwd=None):
+    """提交作业并返回作业号，要求输出中包含形如 "job <jobid>" 的作业号。"""
+    output = subprocess.check_output(command, cwd=cwd, universal_newlines=True)
+    job_match = re.search(r'job\s+(\d+)', output, re.IGNORECASE)
+    if not job_match:
+        raise RuntimeError(f"Could not parse job id from output: {output}")
+    return job_match.group(1)
 
 
-def main():
-    # 参数格式：MAT net_charge adsorbate1 [adsorbate2 ...]
-    if len(sys.argv) < 4:
-        print("Usage: python flow-Electronic.py MAT net_charge adsorbate1 [adsorbate2 ...]")
-        sys.exit(1)
+def get_four_dos_dir(adsorbate):
+    """parent/adsorbate/4-dos 目录，parent 为当前目录的父目录。"""
+    four_dos_dir = os.path.join(os.path.dirname(os.getcwd()), adsorbate, "4-dos")
+    os.makedirs(four_dos_dir, exist_ok=True)
+    return four_dos_dir
+
 
-    MAT = sys.argv[1]
-    net_charge = sys.argv[2]
-    adsorbates = sys.argv[3:]
+def build_graph(MAT, net_charge, adsorbates, pack=None, graph=None, prefix="", bader_table=True):
+    """
+    为每个 adsorbate 建立独立的任务链，各链之间互不等待：
+    Bader：生成输入 -> 提交 -> 等待 -> 分析
+    CDD：（等待 Bader 作业结束后）生成输入 -> 提交 -> 等待 -> 分析
+    DOS：NELECT -> upik0 -> gam 作业 -> 等待 -> upik -> std 作业 -> 等待
+    各步骤均在本进程内以函数调用执行，不再为每一步启动新的 Python 解释器。
+    所有 DOS 作业结束后汇总 d 带描述符；Bader 分析与位点标签就绪后汇总 Bader 电荷。
+    给出 pack 时，每个吸附物的 support 与 adsorbate 片段合并为一个打包作业提交。
+    所有作业提交都经过全局节流器，队列中的作业数超过上限时提交步骤等待已有作业结束。
+    给出 graph 时将任务加入已有的任务图（任务名前加 prefix，如 "MAT/"），用于多个 MAT 的批量筛选；
+    bader_table 为 False 时不加入 Bader 汇总任务，由调用方统一汇总。
+    """
+    graph = graph if graph is not None else TaskGraph()
+    for ads in adsorbates:
+        step = lambda stage, name: f"{prefix}{stage}:{ads}:{name}"
 
-    # --- 第一步：调用脚本（Bader 分析） ---
-    print("=== Running Bader Analysis (script8: ORRbader.py) ===")
-    run_command(["python", "ORRbader.py", MAT] + adsorbates)
+        # 各任务链的起点以结构优化得到的结构为输入文件，结构改变时续算会重新执行整条链
+        contcar = os.path.join("..", ads, MAT, "CONTCAR")
+        graph.add(step("bader", "generate"), ORRbader.generate_bader, ads, MAT, files=[contcar])
+        graph.add(step("bader", "submit"), ORRbader.submit_bader, ads, MAT, deps=[step("bader", "generate")])
+        bader_dir = os.path.join("..", ads, '3-bader', MAT)
+        graph.add(step("bader", "wait"),
+                  lambda name=step("bader", "submit"), d=bader_dir: watch_jobs([graph.result(name)], [d]),
+                  deps=[step("bader", "submit")])
+        graph.add(step("bader", "analyze"), ORRbader.analyze_bader, [ads], MAT, deps=[step("bader", "wait")])
 
-    # --- 第二步：调用脚本（差分电荷密度计算） ---
-    print("=== Running Charge Density Difference Analysis (script9: ORRcdd.py) ===")
-    run_command(["python", "ORRcdd.py", MAT] + adsorbates)
+        graph.add(step("cdd", "generate"), ORRcdd.generate_cdd, ads, MAT, deps=[step("bader", "wait")],
+                  files=[os.path.join("..", "Support", MAT, "CONTCAR"), os.path.join("..", "Support", ads + ".xyz")])
+        graph.add(step("cdd", "submit"), ORRcdd.submit_cdd, ads, MAT, pack, deps=[step("cdd", "generate")])
+        fragment_dirs = [os.path.join(bader_dir, dir) for dir in ORRcdd.FRAGMENT_DIRS]
+        graph.add(step("cdd", "wait"),
+                  lambda name=step("cdd", "submit"), d=fragment_dirs: watch_jobs(graph.result(name), d),
+                  deps=[step("cdd", "submit")])
+        graph.add(step("cdd", "analyze"), ORRcdd.analyze_cdd, [ads], MAT, deps=[step("cdd", "wait")])
 
-    # --- 第三步：电子结构流程（脚本4） ---
-    # 对每个 adsorbate并行执行电子结构流程任务
-    print("=== Running Electronic Structure Flow (script4) for each adsorbate in parallel ===")
+        four_dos_dir = get_four_dos_dir(ads)
+        dos_dir = os.path.join(four_dos_dir, MAT)
+        graph.add(step("dos", "nelect"), NELECT.update_nelect, MAT, net_charge, [ads], files=[contcar])
+        graph.add(step("dos", "upik0"), upik0.main, MAT, [ads], deps=[step("dos", "nelect")])
+        graph.add(step("dos", "gam-submit"), throttle.submit_job, submit,
+                  [os.path.expanduser("~/bin/gam-subvasp.sh"), MAT], four_dos_dir, deps=[step("dos", "upik0")])
+        graph.add(step("dos", "gam-wait"),
+                  lambda name=step("dos", "gam-submit"), d=dos_dir: watch_jobs([graph.result(name)], [d]),
+                  deps=[step("dos", "gam-submit")])
+        graph.add(step("dos", "upik"), upik.main, MAT, [ads], deps=[step("dos", "gam-wait")])
+        graph.add(step("dos", "std-submit"), throttle.submit_job, submit,
+                  [os.path.expanduser("~/bin/std-subvasp.sh"), MAT], four_dos_dir, deps=[step("dos", "upik")])
+        graph.add(step("dos", "std-wait"),
+                  lambda name=step("dos", "std-submit"), d=dos_dir: watch_jobs([graph.result(name)], [d]),
+                  deps=[step("dos", "std-submit")])
+    if bader_table:
+        bader_dirs = [os.path.join("..", ads, '3-bader', MAT) for ads in adsorbates]
+        graph.add(f"{prefix}bader:table", badertable.update, bader_dirs,
+                  deps=[f"{prefix}{stage}:{ads}:{name}" for ads in adsorbates
+                        for stage, name in (("bader", "analyze"), ("cdd", "generate"))])
+    dos_dirs = [os.path.join(get_four_dos_dir(ads), MAT) for ads in adsorbates]
+    graph.add(f"{prefix}dos:table", dos.run_batch, dos_dirs, f"dband_{MAT}.csv",
+              deps=[f"{prefix}dos:{ads}:std-wait" for ads in adsorbates])
+    return graph
 
-    def process_ads(ads):
-        print(f"Processing electronic structure for adsorbate: {ads}")
-        # 脚本4（电子结构流程）要求参数顺序：MAT net_charge adsorbate
-        run_command(["python", "script4.py", MAT, net_charge, ads])
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        futures = [executor.submit(process_ads, ads) for ads in adsorbates]
-        for future in concurrent.futures.as_completed(futures):
-            future.result()
+def main():
+    # 参数格式：MAT net_charge adsorbate1 [adsorbate2 ...]
+    parser = argparse.ArgumentParser(description="Bader、差分电荷密度与 DOS 电子结构流程")
+    parser.add_argument('MAT', help="MAT 目录名称")
+    parser.add_argument('net_charge', help="体系净电荷")
+    parser.add_argument('adsorbates', nargs='+', help="一个或多个 adsorbate")
+    parser.add_argument('-j', '--max-workers', type=int, default=4, help="同时执行的任务数上限")
+    parser.add_argument('--pack', choices=["array", "serial"], default=None, help="将 CDD 片段单点计算打包为一个 Slurm 作业")
+    parser.add_argument('--max-queued', type=int, default=None, help="本流程在队列中的作业数上限")
+    parser.add_argument('--max-running', type=int, default=None, help="本流程同时运行的作业数上限")
+    parser.add_argument('--max-local-workers', type=int, default=None, help="本地分析进程数上限")
+    parser.add_argument('--min-free-memory', type=float, default=None, help="启动本地分析前要求的最小可用内存（GB）")
+    parser.add_argument('--resume', action='store_true', help="按运行日志跳过已完成的步骤，并接管仍在运行的作业")
+    parser.add_argument('--trace', default=None, help="各步骤与作业排队/运行时间的 Chrome trace 输出文件（默认 trace_MAT.json）")
+    args = parser.parse_args()
 
+    throttle.configure(args.max_queued, args.max_running, args.max_local_workers, args.min_free_memory)
+
+    graph = build_graph(args.MAT, args.net_charge, args.adsorbates, args.pack)
+    run_journal = journal.Journal(journal.journal_path(args.MAT, "electronic"), resume=args.resume)
+    success = graph.run(max_workers=args.max_workers, journal=run_journal)
+    print(graph.report())
+    tracer = tracing.get_tracer()
+    tracer.name = args.MAT
+    tracer.add_graph(graph)
+    tracing.finish(args.trace or tracing.trace_path(args.MAT))
+    if not success:
+        print("Some tasks failed. Rerun with --resume to continue from the failed tasks.")
+        sys.exit(1)
     print("All tasks have been successfully completed.")
 
 
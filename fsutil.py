@@ -0,0 +1,47 @@
+import os
+import fcntl
+import shutil
+
+# Linux 的 FICLONE ioctl：在支持写时复制的文件系统（btrfs、xfs 等）上共享数据块
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409)
+
+
+def reflink(src, dst):
+    """写时复制克隆：不复制数据，之后任一方被改写都不影响另一方。"""
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+
+def _symlink(src, dst):
+    os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+
+
+def place(src, dst, writable=False, symlink=False):
+    """
+    将 src 放到 dst（先写临时文件再 os.replace），返回所用方式。
+    依次尝试 reflink、硬链接、（symlink 为 True 时）相对路径的符号链接，最后复制。
+    dst 之后会被原地改写时（writable，如 VASP 的输出文件），改写会透过硬链接或符号链接
+    破坏 src 及共享它的其他文件，因此只用 reflink，不支持时退回到复制；
+    此时 dst 已是 src 的硬链接也会被替换为独立的文件。
+    复制不沿用 src 的权限，只读的缓存或备份对象放出后仍可写。
+    """
+    if not writable and os.path.lexists(dst) and os.path.exists(dst) and os.path.samefile(src, dst):
+        # 已是同一文件时 rename 不做任何事，会留下临时文件
+        return "same"
+    tmp = dst + ".tmp"
+    attempts = [("reflink", reflink)]
+    if not writable:
+        attempts.append(("hardlink", os.link))
+        if symlink:
+            attempts.append(("symlink", _symlink))
+    attempts.append(("copy", shutil.copyfile))
+    for method, func in attempts:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            func(src, tmp)
+        except OSError:
+            continue
+        os.replace(tmp, dst)
+        return method
+    raise OSError(f"无法将 {src} 放到 {dst}")
@@ -0,0 +1,166 @@
+import os
+import sys
+import datetime
+import argparse
+import numpy as np
+import incar
+import chgcar
+import calccache
+import fsutil
+from status import is_completed
+
+# 可交接的文件：文件名 -> (读取该文件的 INCAR 参数与取值, 控制下一步是否改写该文件的参数)
+HANDOFF_FILES = {
+    "CHGCAR": ("ICHARG", "1", "LCHARG"),
+    "WAVECAR": ("ISTART", "1", "LWAVE"),
+}
+# 决定 FFT 格点与波函数基组的参数，两步之间必须一致
+GRID_KEYS = ("ENCUT", "PREC", "ISPIN", "NGX", "NGY", "NGZ", "NGXF", "NGYF", "NGZF", "ENAUG")
+INCAR_DEFAULTS = {"PREC": "NORMAL", "ISPIN": "1", "LCHARG": "T", "LWAVE": "T"}
+# 结构比较的容差（Å）
+POSITION_TOL = 1e-2
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def _value(params, key):
+    value = params.get(key, INCAR_DEFAULTS.get(key))
+    return calccache._normalize_value(value) if value is not None else None
+
+
+def _flag(params, key):
+    return _value(params, key) == "T"
+
+
+def read_structure(path):
+    """读取 POSCAR/CONTCAR 的 (晶格, 各元素原子数, 分数坐标)。"""
+    with open(path) as file:
+        lines = file.read().splitlines()
+    scale = float(lines[1].split()[0])
+    lattice = np.array([[float(x) for x in line.split()[:3]] for line in lines[2:5]]) * scale
+    pos = 5 if lines[5].split()[0].isdigit() else 6
+    counts = [int(x) for x in lines[pos].split()]
+    pos += 1
+    if lines[pos].strip()[:1] in ("S", "s"):
+        pos += 1
+    coords = np.array([[float(x) for x in line.split()[:3]] for line in lines[pos + 1:pos + 1 + sum(counts)]])
+    if lines[pos].strip()[:1] in ("C", "c", "K", "k"):
+        coords = coords * scale @ np.linalg.inv(lattice)
+    return lattice, counts, coords
+
+
+def chgcar_structure(path):
+    index = chgcar.index_chgcar(path)
+    return index["lattice"], index["counts"], chgcar.read_positions(index)
+
+
+def structure_mismatch(reference, poscar_path, tol=POSITION_TOL):
+    """比较 (晶格, 原子数, 分数坐标) 与 POSCAR 的结构（坐标考虑周期性），一致时返回 None。"""
+    lattice, counts, coords = read_structure(poscar_path)
+    ref_lattice, ref_counts, ref_coords = reference
+    if list(counts) != list(ref_counts):
+        return f"原子数不一致 {list(ref_counts)} vs {counts}"
+    if not np.allclose(lattice, ref_lattice, atol=tol):
+        return "晶格不一致"
+    delta = coords - ref_coords
+    delta -= np.round(delta)
+    if np.max(np.linalg.norm(delta @ lattice, axis=1), initial=0.0) > tol:
+        return "原子坐标不一致"
+    return None
+
+
+def check(name, src_dir, dst_dir):
+    """
+    检查 src_dir 中的 name（CHGCAR 或 WAVECAR）能否作为 dst_dir 的初始密度/波函数，返回不兼容的原因，兼容时返回 None。
+    两步的赝势与决定格点的参数（ENCUT、PREC、ISPIN、NG*）必须一致，CHGCAR 的结构须与 dst_dir 的 POSCAR 一致；
+    WAVECAR 另外要求 KPOINTS 一致（gam 与 std 版本的 WAVECAR 不能互读，由调用方决定是否交接）。
+    """
+    src = os.path.join(src_dir, name)
+    if not os.path.isfile(src) or os.path.getsize(src) == 0:
+        return f"{src} 不存在"
+    if not is_completed(src_dir):
+        return f"{src_dir} 的计算未完成"
+    src_incar, dst_incar = (incar.Incar.from_file(os.path.join(d, "INCAR")) for d in (src_dir, dst_dir))
+    for key in GRID_KEYS:
+        if _value(src_incar, key) != _value(dst_incar, key):
+            return f"{key} 不一致"
+    if calccache.potcar_identity(os.path.join(src_dir, "POTCAR")) != \
+            calccache.potcar_identity(os.path.join(dst_dir, "POTCAR")):
+        return "POTCAR 不一致"
+    poscar = os.path.join(dst_dir, "POSCAR")
+    if name == "CHGCAR":
+        return structure_mismatch(chgcar_structure(src), poscar)
+    if calccache.normalize_kpoints(os.path.join(src_dir, "KPOINTS")) != \
+            calccache.normalize_kpoints(os.path.join(dst_dir, "KPOINTS")):
+        return "KPOINTS 不一致"
+    # WAVECAR 不含可直接比较的结构，以上一步输出的 CONTCAR 与 POSCAR 比较
+    return structure_mismatch(read_structure(os.path.join(src_dir, "CONTCAR")), poscar)
+
+
+def handoff(src_dir, dst_dir, files=tuple(HANDOFF_FILES), backup=False):
+    """
+    将上一步（src_dir）的 CHGCAR/WAVECAR 交接到下一步（dst_dir），并将 ICHARG/ISTART 设为读取这些文件。
+    只交接检查通过的文件；已设为非自洽计算（ICHARG = 11）的 INCAR 不改动 ICHARG。
+    dst_dir 的计算已完成时不做任何事，以免覆盖其输出。返回 {文件名: 放置方式}。
+    """
+    if is_completed(dst_dir):
+        return {}
+    dst_incar = incar.Incar.from_file(os.path.join(dst_dir, "INCAR"))
+    placed, mutations = {}, []
+    for name in files:
+        key, value, write_flag = HANDOFF_FILES[name]
+        try:
+            reason = check(name, src_dir, dst_dir)
+        except (OSError, ValueError, IndexError) as e:
+            reason = str(e)
+        if reason:
+            log_info(f"{name} from {src_dir} not handed off to {dst_dir}: {reason}.")
+            continue
+        # 下一步会改写该文件时（LCHARG/LWAVE），VASP 原地写入不能透过链接破坏上一步的文件
+        placed[name] = fsutil.place(os.path.join(src_dir, name), os.path.join(dst_dir, name),
+                                    writable=_flag(dst_incar, write_flag), symlink=True)
+        if not (key == "ICHARG" and _value(dst_incar, key) == "11.0"):
+            mutations.append((incar.SET, key, value))
+        log_info(f"Handed off {name} from {src_dir} to {dst_dir} ({placed[name]}).")
+    if mutations:
+        incar.edit(dst_dir, mutations, backup=backup)
+    return placed
+
+
+def prepare_nscf(directory, backup=False):
+    """
+    在同一目录中由自洽计算接续非自洽计算（如 gam 步骤之后的 DOS 计算）：检查 CHGCAR 存在且
+    与 POSCAR 一致，设置 ICHARG = 11；目录中已有的 WAVECAR 来自上一步（k 点或 VASP 版本不同），
+    设置 ISTART = 0 使其不被读取。CHGCAR 不可用时返回 False。
+    """
+    mutations = [(incar.SET, "ISTART", "0")] if os.path.isfile(os.path.join(directory, "WAVECAR")) else []
+    path = os.path.join(directory, "CHGCAR")
+    try:
+        reason = structure_mismatch(chgcar_structure(path), os.path.join(directory, "POSCAR"))
+    except (OSError, ValueError, IndexError) as e:
+        reason = str(e)
+    if reason is None:
+        mutations.append((incar.SET, "ICHARG", "11"))
+    else:
+        log_error(f"{path} cannot be used for the non-SCF run: {reason}.")
+    if mutations:
+        incar.edit(directory, mutations, backup=backup)
+    return reason is None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将上一步计算的 CHGCAR/WAVECAR 交接到下一步计算目录")
+    parser.add_argument('source', help="上一步的计算目录")
+    parser.add_argument('targets', nargs='+', help="下一步的计算目录（INCAR、POSCAR、POTCAR 已写好）")
+    parser.add_argument('--files', nargs='+', choices=list(HANDOFF_FILES), default=list(HANDOFF_FILES),
+                        help="交接的文件")
+    parser.add_argument('--backup', action='store_true', help="首次修改 INCAR 前保存 .bak")
+    args = parser.parse_args()
+    for target in args.targets:
+        handoff(args.source, target, args.files, args.backup)
@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import shutil
+import datetime
+import argparse
+
+# 修改操作
+SET = "set"            # 存在则替换，不存在则追加
+REPLACE = "replace"    # 仅替换已存在的参数
+DEFAULT = "default"    # 仅在参数不存在时追加
+REMOVE = "remove"      # 删除参数
+
+COMMENT_RE = re.compile(r"[#!]")
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+class Incar:
+    """
+    INCAR 的内存模型：保留原有行、注释与顺序，参数名不区分大小写，
+    一行中以分号分隔的多个参数分别处理。未修改的行原样写回。
+    """
+
+    def __init__(self, text=""):
+        self.lines = []
+        for raw in text.splitlines():
+            m = COMMENT_RE.search(raw)
+            body, comment = (raw[:m.start()], raw[m.start():]) if m else (raw, "")
+            statements = []
+            for statement in body.split(";"):
+                if "=" in statement:
+                    key, value = statement.split("=", 1)
+                    if key.strip():
+                        statements.append([key.strip().upper(), value.strip()])
+            # [参数列表, 注释, 原始行, 是否已修改]
+            self.lines.append([statements, comment, raw, False])
+        self.changed = False
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as file:
+            return cls(file.read())
+
+    def _find(self, key):
+        key = key.upper()
+        for line in self.lines:
+            for statement in line[0]:
+                if statement[0] == key:
+                    return line, statement
+        return None, None
+
+    def __contains__(self, key):
+        return self._find(key)[0] is not None
+
+    def get(self, key, default=None):
+        statement = self._find(key)[1]
+        return statement[1] if statement else default
+
+    def set(self, key, value):
+        key, value = key.strip().upper(), str(value)
+        line, statement = self._find(key)
+        if line is None:
+            self.lines.append([[[key, value]], "", "", True])
+            self.changed = True
+        elif statement[1] != value:
+            statement[1] = value
+            line[3] = True
+            self.changed = True
+
+    def remove(self, key):
+        line, statement = self._find(key)
+        if line is not None:
+            line[0].remove(statement)
+            line[3] = True
+            self.changed = True
+
+    def text(self):
+        out = []
+        for statements, comment, raw, modified in self.lines:
+            if not modified:
+                out.append(raw)
+            elif statements or comment:
+                body = "; ".join(f"{key} = {value}" for key, value in statements)
+                out.append(f"{body}  {comment}" if body and comment else body or comment)
+        return "\n".join(out) + "\n"
+
+
+def apply_mutations(incar, mutations):
+    """
+    依次应用声明式修改列表 [(操作, 参数名, 值), ...]。值可以是可调用对象，
+    以当前 Incar 为参数计算（例如由 NELECT 计算 NBANDS），返回 None 时跳过该修改。
+    """
+    for mutation in mutations:
+        op, key = mutation[0], mutation[1]
+        if op == REMOVE:
+            incar.remove(key)
+            continue
+        if (op == REPLACE and key not in incar) or (op == DEFAULT and key in incar):
+            continue
+        value = mutation[2](incar) if callable(mutation[2]) else mutation[2]
+        if value is not None:
+            incar.set(key, value)
+    return incar
+
+
+def atomic_write(path, text):
+    """先写临时文件再原子替换，中断时不会留下写了一半的文件。"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        file.write(text)
+    if os.path.exists(path):
+        shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _backup(path):
+    # 只保留第一次修改前的原始文件，重复运行不覆盖
+    backup_path = path + ".bak"
+    if not os.path.exists(backup_path):
+        shutil.copy(path, backup_path)
+
+
+def edit(directory, mutations=(), kpoints_mesh=None, backup=False):
+    """
+    对一个计算目录中的 INCAR 与 KPOINTS 各解析一次、写入一次。
+    kpoints_mesh 为 (n1, n2, n3) 时替换 KPOINTS 第 4 行。两个文件都检查通过后才写入，
+    返回实际被修改的文件名列表。
+    """
+    updates = []
+    if mutations:
+        incar_path = os.path.join(directory, "INCAR")
+        incar = apply_mutations(Incar.from_file(incar_path), mutations)
+        if incar.changed:
+            updates.append(("INCAR", incar_path, incar.text()))
+    if kpoints_mesh is not None:
+        kpoints_path = os.path.join(directory, "KPOINTS")
+        with open(kpoints_path) as file:
+            lines = file.readlines()
+        if len(lines) < 4:
+            raise ValueError(f"KPOINTS 文件 ({kpoints_path}) 行数不足")
+        mesh_line = " ".join(str(n) for n in kpoints_mesh) + "\n"
+        if lines[3].split() != mesh_line.split():
+            lines[3] = mesh_line
+            updates.append(("KPOINTS", kpoints_path, "".join(lines)))
+    for _, path, text in updates:
+        if backup:
+            _backup(path)
+        atomic_write(path, text)
+    return [name for name, _, _ in updates]
+
+
+def edit_batch(directories, mutations=(), kpoints_mesh=None, backup=False):
+    """对多个目录应用同一组修改，返回 {目录: 被修改的文件名列表}；单个目录出错不影响其他目录。"""
+    results = {}
+    for directory in directories:
+        try:
+            results[directory] = edit(directory, mutations, kpoints_mesh, backup)
+        except (OSError, ValueError) as e:
+            log_error(f"Failed to edit inputs in {directory}. Details: {e}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量修改 INCAR 参数与 KPOINTS 网格")
+    parser.add_argument('directories', nargs='+', help="一个或多个计算目录")
+    parser.add_argument('-s', '--set', nargs='+', default=[], metavar="KEY=VALUE", help="设置参数（不存在时追加）")
+    parser.add_argument('-d', '--default', nargs='+', default=[], metavar="KEY=VALUE", help="仅在参数不存在时追加")
+    parser.add_argument('-r', '--remove', nargs='+', default=[], metavar="KEY", help="删除参数")
+    parser.add_argument('-k', '--kpoints', type=int, nargs=3, default=None, help="KPOINTS 网格")
+    parser.add_argument('--backup', action='store_true', help="首次修改前保存 .bak")
+    args = parser.parse_args()
+    mutations = [(SET, *map(str.strip, item.split("=", 1))) for item in args.set]
+    mutations += [(DEFAULT, *map(str.strip, item.split("=", 1))) for item in args.default]
+    mutations += [(REMOVE, key) for key in args.remove]
+    for directory, files in edit_batch(args.directories, mutations, args.kpoints, args.backup).items():
+        log_info(f"{directory}: {', '.join(files) if files else 'unchanged'}")
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import datetime
+import argparse
+import threading
+
+# 事件类型
+START = "start"
+WAITING = "waiting"
+DONE = "done"
+FAILED = "failed"
+INVALIDATED = "invalidated"
+RUN = "run"
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def journal_path(MAT, flow=None):
+    """运行日志文件名；不同流程（如 flow-DOS 与 flow-Electronic）的步骤名可能相同，以 flow 区分各自的日志。"""
+    return f"journal_{MAT}_{flow}.jsonl" if flow else f"journal_{MAT}.jsonl"
+
+
+def _stable(obj):
+    # 函数以模块名与限定名表示，避免对象地址使哈希在每次运行时变化
+    if callable(obj):
+        return f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', repr(obj))}"
+    return str(obj)
+
+
+def _jsonable(value):
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return None
+
+
+def file_digest(path):
+    """输入文件内容的哈希，文件不存在时返回 None。"""
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def inputs_hash(func, args, files=(), upstream=()):
+    """
+    步骤输入的哈希，输入改变时已完成的步骤不再被跳过。输入包括函数与参数、
+    files 中各文件的内容（如结构优化得到的 CONTCAR），以及 upstream 中前置步骤的结果
+    （如提交步骤的作业号：重新提交后，等待步骤的输入随之改变）。
+    前置步骤的结果按写入日志的形式参与哈希，续算时由日志读出的结果得到相同的哈希。
+    """
+    text = json.dumps([_stable(func), list(args), {path: file_digest(path) for path in files},
+                       [_jsonable(result) for result in upstream]], default=_stable, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def load_stages(path):
+    """读取日志，返回 {步骤: 最后一条记录}；非续算的 run 记录之前的内容不再生效。"""
+    stages = {}
+    with open(path) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 中断时可能留下写了一半的最后一行
+                continue
+            if record.get("event") == RUN and not record.get("resume"):
+                stages.clear()
+            elif "stage" in record:
+                stages[record["stage"]] = record
+    return stages
+
+
+class Journal:
+    """
+    只追加的运行日志（JSONL）：每行记录一个步骤事件
+    {"time", "stage", "event", "inputs", "result", "error"}，写入后立即落盘。
+    resume 为 True 时读取已有记录，每个步骤以最后一条事件为准；
+    否则只追加一条 run 记录，此前的记录在之后的续算中也不再生效。
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.resume = resume
+        self.stages = {}
+        self._lock = threading.Lock()
+        if resume and os.path.isfile(path):
+            self.stages = load_stages(path)
+        self._write({"event": RUN, "resume": resume, "pid": os.getpid()})
+
+    def _write(self, record):
+        record = dict(record, time=time.time())
+        with self._lock:
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(record) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            if "stage" in record:
+                self.stages[record["stage"]] = record
+
+    def record(self, stage, event, inputs=None, result=None, error=None):
+        entry = {"stage": stage, "event": event}
+        if inputs is not None:
+            entry["inputs"] = inputs
+        if result is not None:
+            entry["result"] = _jsonable(result)
+        if error is not None:
+            entry["error"] = str(error)
+        self._write(entry)
+
+    def completed(self, stage, inputs):
+        """步骤已以相同输入完成时返回 True。"""
+        record = self.stages.get(stage)
+        return record is not None and record["event"] == DONE and record.get("inputs") == inputs
+
+    def result(self, stage):
+        record = self.stages.get(stage)
+        return record.get("result") if record else None
+
+    def invalidate(self, stage):
+        """使已完成的步骤在续算时重新执行（例如作业失败后需要重新提交）。"""
+        if stage in self.stages:
+            self.record(stage, INVALIDATED)
+
+    def step(self, stage, func, *args, files=()):
+        """
+        执行一个步骤并记录结果；续算时若该步骤已以相同输入（见 inputs_hash）完成，直接返回记录的结果。
+        用于不经过 TaskGraph 的线性流程（如 flow-DOS.py）。
+        """
+        inputs = inputs_hash(func, args, files)
+        if self.completed(stage, inputs):
+            log_info(f"Stage {stage} already completed, skipped.")
+            return self.result(stage)
+        self.record(stage, START, inputs)
+        try:
+            result = func(*args)
+        except (Exception, SystemExit) as e:
+            self.record(stage, FAILED, inputs, error=repr(e))
+            raise
+        self.record(stage, DONE, inputs, result=result)
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="显示流程运行日志中各步骤的最新状态")
+    parser.add_argument('path', help="日志文件，例如 journal_MAT.jsonl")
+    args = parser.parse_args()
+    for stage, record in load_stages(args.path).items():
+        stamp = datetime.datetime.fromtimestamp(record["time"]).strftime('%Y-%m-%d %H:%M:%S')
+        detail = record.get("error") or (json.dumps(record["result"]) if record.get("result") is not None else "")
+        print(f"{stage:<40}{record['event']:<13}{stamp}  {detail}")
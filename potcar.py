@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import json
+import mmap
+import sqlite3
+import hashlib
+import datetime
+import argparse
+import concurrent.futures
+import throttle
+import fsutil
+
+POTCAR_CACHE_DIR = os.environ.get("ELECTRONICFLOW_POTCAR_CACHE", os.path.expanduser("~/.electronicflow/potcars"))
+TITEL_RE = re.compile(rb"TITEL\s*=\s*([^\r\n]*)")
+ZVAL_RE = re.compile(rb"ZVAL\s*=\s*([-+.\dEe]+)")
+# 每个赝势头部（TITEL 之后到 ZVAL 所在行）的最大长度，正则只在这一范围内匹配
+HEADER_WINDOW = 16 * 1024
+DATASET_END = b"End of Dataset"
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def signature(functional, symbols):
+    """拼接 POTCAR 的身份：泛函与按顺序排列的赝势符号。"""
+    return hashlib.sha256(f"{functional}:{' '.join(symbols)}".encode()).hexdigest()
+
+
+def assemble(input_set, cache_dir=POTCAR_CACHE_DIR):
+    """
+    返回 input_set 对应的拼接 POTCAR 在缓存中的路径。
+    相同泛函与元素序列只由 pymatgen 拼接一次，之后直接复用缓存文件。
+    """
+    functional, symbols = input_set.user_potcar_functional, input_set.potcar_symbols
+    key = signature(functional, symbols)
+    path = os.path.join(cache_dir, key[:2], f"{key}.POTCAR")
+    if not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 多个进程同时未命中时各自写临时文件，原子替换保证缓存文件完整
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        input_set.potcar.write_file(tmp_path)
+        os.replace(tmp_path, path)
+        log_info(f"Cached POTCAR {functional} {' '.join(symbols)}.")
+    return path
+
+
+def scan_headers(path):
+    """
+    读取拼接 POTCAR 中各赝势的 TITEL 与 ZVAL，返回 [(TITEL, ZVAL), ...]。
+    正则只作用于每个 TITEL 之后 HEADER_WINDOW 字节内的头部，之后直接查找该赝势的 "End of Dataset"
+    跳过投影子等数据本身。
+    """
+    headers = []
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pos = 0
+            while True:
+                start = data.find(b"TITEL", pos)
+                if start == -1:
+                    break
+                # 头部不越过下一个赝势的 TITEL
+                limit = data.find(b"TITEL", start + 5, start + HEADER_WINDOW)
+                window = data[start:limit if limit != -1 else start + HEADER_WINDOW]
+                title, zval = TITEL_RE.match(window), ZVAL_RE.search(window)
+                if title is None or zval is None:
+                    raise ValueError(f"{path} 中第 {len(headers) + 1} 个赝势的头部缺少 TITEL 或 ZVAL")
+                headers.append((" ".join(title.group(1).decode(errors="replace").split()), float(zval.group(1))))
+                end = data.find(DATASET_END, start)
+                pos = end + len(DATASET_END) if end != -1 else start + len(window)
+    return headers
+
+
+def read_headers(path, cache_dir=POTCAR_CACHE_DIR):
+    """
+    返回 POTCAR 各赝势的 (TITEL, ZVAL)。结果保存在缓存目录的 headers.sqlite 中，
+    以文件的 (设备, inode) 为键、(大小, 修改时间) 校验，同一文件（包括硬链接出的副本）只扫描一次。
+    """
+    st = os.stat(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    db = sqlite3.connect(os.path.join(cache_dir, "headers.sqlite"), timeout=60)
+    try:
+        db.execute("CREATE TABLE IF NOT EXISTS files (dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+                   "headers TEXT, PRIMARY KEY (dev, ino))")
+        row = db.execute("SELECT headers FROM files WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+                         (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)).fetchone()
+        if row:
+            return [tuple(entry) for entry in json.loads(row[0])]
+        headers = scan_headers(path)
+        db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                   (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, json.dumps(headers)))
+        db.commit()
+        return headers
+    finally:
+        db.close()
+
+
+def read_zvals(path, cache_dir=POTCAR_CACHE_DIR):
+    return [zval for _, zval in read_headers(path, cache_dir)]
+
+
+def read_species_counts(path):
+    """直接从 POSCAR 头部读取元素与原子数（VASP 4 格式没有元素行，返回的元素为空列表）。"""
+    with open(path) as file:
+        lines = [next(file) for _ in range(7)]
+    if all(x.isdigit() for x in lines[5].split()):
+        return [], [int(x) for x in lines[5].split()]
+    return lines[5].split(), [int(x) for x in lines[6].split()]
+
+
+def write_input(structure, output_path, incar_set, kpoints_set, cache_dir=POTCAR_CACHE_DIR):
+    """写出 MITRelaxSet 输入文件；POTCAR 取自缓存并以硬链接（或复制）放入 output_path。"""
+    from pymatgen.io.vasp.sets import MITRelaxSet
+    input_set = MITRelaxSet(structure, user_incar_settings=incar_set, user_kpoints_settings=kpoints_set)
+    input_set.write_input(output_path, potcar_spec=True)
+    os.remove(os.path.join(output_path, "POTCAR.spec"))
+    fsutil.place(assemble(input_set, cache_dir), os.path.join(output_path, "POTCAR"))
+    return output_path
+
+
+def write_inputs(targets, cache_dir=POTCAR_CACHE_DIR):
+    """
+    在全局节流器的共享进程池中并行写出多组输入文件。targets 为
+    (structure, output_path, incar_set, kpoints_set) 列表，只有一组时在本进程内执行。返回成功写出的目录列表。
+    """
+    targets = list(targets)
+    if len(targets) <= 1:
+        return [write_input(*target, cache_dir=cache_dir) for target in targets]
+    written = []
+    futures = {throttle.submit_local(write_input, *target, cache_dir=cache_dir): target[1] for target in targets}
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            written.append(future.result())
+        except Exception as e:
+            log_error(f"Failed to write input files to {futures[future]}. Details: {e}")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="POTCAR 拼接缓存与头部索引")
+    parser.add_argument('action', choices=["list", "clear", "headers"], help="列出或清空拼接缓存，或显示 POTCAR 的 TITEL/ZVAL")
+    parser.add_argument('paths', nargs='*', help="headers 操作的 POTCAR 文件")
+    args = parser.parse_args()
+    if args.action == "headers":
+        for path in args.paths:
+            for title, zval in read_headers(path):
+                print(f"{path}  {title:<30}ZVAL = {zval:g}")
+        sys.exit(0)
+    paths = []
+    for root, _, files in os.walk(POTCAR_CACHE_DIR):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith(".POTCAR"))
+    for path in sorted(paths):
+        if args.action == "list":
+            print(f"{os.path.basename(path)[:12]}  {'; '.join(title for title, _ in scan_headers(path))}")
+        else:
+            os.remove(path)
+    if args.action == "clear":
+        log_info(f"Removed {len(paths)} cached POTCAR files.")
@@ -0,0 +1,219 @@
+import os
+import sys
+import csv
+import time
+import datetime
+import argparse
+import importlib
+import threading
+import badertable
+import throttle
+import journal
+import tracing
+from dag import TaskGraph, PENDING, RUNNING, WAITING, SUCCESS, FAILED, SKIPPED, RESUMED
+
+DEFAULT_ADS = ["OOH", "OH", "O", "Support"]
+# 进度矩阵中每个任务链（列）的顺序与各任务状态的标记
+CHAINS = ("bader", "cdd", "dos")
+STATUS_MARKS = {PENDING: ".", RUNNING: "run", WAITING: "job", SUCCESS: "ok", RESUMED: "ok",
+                FAILED: "FAILED", SKIPPED: "skipped"}
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def _split(value):
+    return [item for item in str(value or "").replace(";", " ").replace(",", " ").split() if item]
+
+
+def _entry(MAT, net_charge, adsorbates):
+    return {"MAT": str(MAT), "net_charge": str(net_charge if net_charge is not None else 0),
+            "adsorbates": list(adsorbates)}
+
+
+def read_csv(path):
+    """
+    CSV 清单：列 MAT、net_charge（可省略，默认 0）与 adsorbates（以空格或分号分隔，可省略）。
+    同一 MAT 可分多行列出，吸附物合并。
+    """
+    entries = {}
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+            MAT = row.get("mat")
+            if not MAT or MAT.startswith("#"):
+                continue
+            entry = entries.setdefault(MAT, _entry(MAT, row.get("net_charge") or None, []))
+            entry["adsorbates"] += [ads for ads in _split(row.get("adsorbates") or row.get("adsorbate"))
+                                    if ads not in entry["adsorbates"]]
+    for entry in entries.values():
+        entry["adsorbates"] = entry["adsorbates"] or list(DEFAULT_ADS)
+    return list(entries.values())
+
+
+def read_yaml(path):
+    """
+    YAML 清单（需要 PyYAML）：
+        defaults: {net_charge: 0, adsorbates: [OOH, OH, O]}
+        materials:
+          - Fe
+          - {MAT: Co, net_charge: 1, adsorbates: [OOH, OH]}
+    """
+    try:
+        import yaml
+    except ImportError:
+        raise RuntimeError("读取 YAML 清单需要 PyYAML（pip install pyyaml），或改用 CSV 清单")
+    with open(path) as file:
+        data = yaml.safe_load(file) or {}
+    if isinstance(data, list):
+        data = {"materials": data}
+    # 与 CSV 清单一样，键名不区分大小写
+    defaults = {str(key).strip().lower(): value for key, value in (data.get("defaults") or {}).items()}
+    entries = []
+    for item in data.get("materials") or []:
+        item = {"mat": item} if not isinstance(item, dict) else item
+        item = {str(key).strip().lower(): value for key, value in item.items()}
+        if item.get("mat") is None:
+            raise ValueError(f"清单 {path} 中的条目缺少 MAT：{item}")
+        adsorbates = item.get("adsorbates", defaults.get("adsorbates"))
+        adsorbates = adsorbates if isinstance(adsorbates, list) else _split(adsorbates)
+        entries.append(_entry(item["mat"], item.get("net_charge", defaults.get("net_charge")),
+                              adsorbates or DEFAULT_ADS))
+    return entries
+
+
+def read_manifest(path):
+    entries = read_yaml(path) if path.endswith((".yaml", ".yml")) else read_csv(path)
+    mats = [entry["MAT"] for entry in entries]
+    duplicates = sorted({MAT for MAT in mats if mats.count(MAT) > 1})
+    if duplicates:
+        raise ValueError(f"清单中 MAT 重复：{', '.join(duplicates)}")
+    if not entries:
+        raise ValueError(f"清单 {path} 中没有 MAT")
+    return entries
+
+
+def build_screen(entries, pack=None):
+    """
+    将 MAT × 吸附物矩阵展开为一个任务图：每个 MAT 的任务链与 flow-Electronic.py 相同（任务名前加 "MAT/"），
+    所有作业共用作业监视器与全局节流器，输入缓存（POTCAR、计算缓存、载体结构）在同一进程内共享。
+    Bader 数据集是同一个文件，最后统一汇总一次。
+    """
+    flow = importlib.import_module("flow-Electronic")
+    graph = TaskGraph()
+    for entry in entries:
+        flow.build_graph(entry["MAT"], entry["net_charge"], entry["adsorbates"], pack, graph=graph,
+                         prefix=f"{entry['MAT']}/", bader_table=False)
+    bader_dirs = [os.path.join("..", ads, '3-bader', entry["MAT"]) for entry in entries for ads in entry["adsorbates"]]
+    graph.add("bader:table", badertable.update, bader_dirs,
+              deps=[f"{entry['MAT']}/{stage}:{ads}:{name}" for entry in entries for ads in entry["adsorbates"]
+                    for stage, name in (("bader", "analyze"), ("cdd", "generate"))])
+    return graph
+
+
+def _chain_state(tasks):
+    """任务链的当前状态：全部完成为 ok，否则为第一个未完成任务的名称与状态。"""
+    for task in tasks:
+        if task.status not in (SUCCESS, RESUMED):
+            step = task.name.rsplit(":", 1)[-1]
+            return step if task.status == PENDING else f"{step} {STATUS_MARKS[task.status]}"
+    return "ok"
+
+
+def render_matrix(graph, entries):
+    """每行一个 MAT/吸附物，每列一个任务链（bader、cdd、dos），末行为各状态的任务数。"""
+    width = max(len(f"{entry['MAT']}/{ads}") for entry in entries for ads in entry["adsorbates"]) + 2
+    lines = [f"{'MAT/ADS':<{width}}" + "".join(f"{chain:<20}" for chain in CHAINS)]
+    for entry in entries:
+        for ads in entry["adsorbates"]:
+            cells = []
+            for chain in CHAINS:
+                prefix = f"{entry['MAT']}/{chain}:{ads}:"
+                cells.append(_chain_state([task for name, task in graph.tasks.items() if name.startswith(prefix)]))
+            lines.append(f"{entry['MAT'] + '/' + ads:<{width}}" + "".join(f"{cell:<20}" for cell in cells))
+    counts = {}
+    for task in graph.tasks.values():
+        counts[task.status] = counts.get(task.status, 0) + 1
+    lines.append(", ".join(f"{status} {count}" for status, count in counts.items()))
+    return "\n".join(lines)
+
+
+class ProgressMatrix:
+    """后台线程每隔 interval 秒在矩阵有变化时重绘；终端中原地刷新，否则追加输出。"""
+
+    def __init__(self, graph, entries, interval=10.0, stream=sys.stdout):
+        self.graph = graph
+        self.entries = entries
+        self.interval = interval
+        self.stream = stream
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._last = None
+
+    def _draw(self):
+        text = render_matrix(self.graph, self.entries)
+        if text == self._last:
+            return
+        self._last = text
+        if self.stream.isatty():
+            self.stream.write("\033[H\033[J")
+        self.stream.write(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]\n{text}\n")
+        self.stream.flush()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._draw()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._draw()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按清单批量筛选多个 MAT × 吸附物（共用作业监视器、并发上限与输入缓存）")
+    parser.add_argument('manifest', help="清单文件（.csv 或 .yaml/.yml）")
+    parser.add_argument('-j', '--max-workers', type=int, default=8, help="同时执行的任务数上限")
+    parser.add_argument('--pack', choices=["array", "serial"], default=None, help="将 CDD 片段单点计算打包为一个 Slurm 作业")
+    parser.add_argument('--max-queued', type=int, default=None, help="队列中的作业数上限")
+    parser.add_argument('--max-running', type=int, default=None, help="同时运行的作业数上限")
+    parser.add_argument('--max-local-workers', type=int, default=None, help="本地分析进程数上限")
+    parser.add_argument('--min-free-memory', type=float, default=None, help="启动本地分析前要求的最小可用内存（GB）")
+    parser.add_argument('--resume', action='store_true', help="按运行日志跳过已完成的步骤，并接管仍在运行的作业")
+    parser.add_argument('--progress-interval', type=float, default=10.0, help="进度矩阵的刷新间隔（秒）")
+    parser.add_argument('--trace', default=None, help="Chrome trace 输出文件（默认 trace_screen_清单名.json）")
+    args = parser.parse_args()
+
+    entries = read_manifest(args.manifest)
+    name = "screen_" + os.path.splitext(os.path.basename(args.manifest))[0]
+    log_info(f"Screening {len(entries)} MATs, {sum(len(entry['adsorbates']) for entry in entries)} MAT/adsorbate pairs.")
+    throttle.configure(args.max_queued, args.max_running, args.max_local_workers, args.min_free_memory)
+
+    graph = build_screen(entries, args.pack)
+    run_journal = journal.Journal(journal.journal_path(name), resume=args.resume)
+    start = time.time()
+    with ProgressMatrix(graph, entries, args.progress_interval):
+        success = graph.run(max_workers=args.max_workers, journal=run_journal)
+    print(graph.report())
+    tracer = tracing.get_tracer()
+    tracer.name = name
+    tracer.add_graph(graph)
+    tracing.finish(args.trace or tracing.trace_path(name))
+    log_info(f"Screening finished in {time.time() - start:.1f} s.")
+    if not success:
+        print("Some tasks failed. Rerun with --resume to continue from the failed tasks.")
+        sys.exit(1)
+    print("All tasks have been successfully completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import os
+import re
+import sys
+import time
+import shlex
+import datetime
+import threading
+import subprocess
+import concurrent.futures
+import status
+
+# 作业结束后的终止状态（sacct 中的 State 字段）
+TERMINAL_STATES = {
+    "COMPLETED", "FAILED", "TIMEOUT", "CANCELLED", "NODE_FAIL",
+    "OUT_OF_MEMORY", "PREEMPTED", "BOOT_FAIL", "DEADLINE", "UNKNOWN"
+}
+# 各计算目录中的作业脚本（std-subvasp.sh 用 sbatch 提交的脚本）
+RUN_SCRIPT = "std-vasp.slurm"
+# 打包作业不沿用目录脚本中的这些 #SBATCH 选项
+PACK_OVERRIDES = ("--job-name", "-J", "--array", "-a", "--output", "-o", "--error", "-e")
+# 用于判断 OUTCAR 是否为最近一次计算所写的输入文件
+INPUT_FILES = ("INCAR", "KPOINTS", "POSCAR")
+# 作业监视器的最短轮询间隔（秒）
+POLL_INTERVAL = float(os.environ.get("ELECTRONICFLOW_POLL_INTERVAL", 5))
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def _parse_time(value):
+    """将 sacct 的时间（如 2024-01-01T12:00:00）转换为时间戳，Unknown/None 等返回 None。"""
+    try:
+        return time.mktime(datetime.datetime.strptime(value.strip(), "%Y-%m-%dT%H:%M:%S").timetuple())
+    except ValueError:
+        return None
+
+
+def _run(command):
+    try:
+        return subprocess.check_output(command, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+class JobMonitor:
+    """
+    统一的 Slurm 作业监视器：后台线程每个周期只调用一次批量 squeue，
+    对离开队列的作业再用一次批量 sacct 查询终止状态，并通过 Future 通知等待方。
+    队列无变化时轮询间隔按 backoff 倍数增长，直至 max_interval。
+    squeue/sacct 命令可替换为本地的假调度器以便测试。
+    """
+
+    def __init__(self, min_interval=POLL_INTERVAL, max_interval=60, backoff=2.0, squeue="squeue", sacct="sacct"):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.squeue = squeue
+        self.sacct = sacct
+        self.max_query_failures = 3
+        self._query_failures = 0
+        self._futures = {}
+        self._states = {}
+        self._finished_at = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def watch(self, job_id, callback=None):
+        """登记作业并返回 Future，结果为作业的终止状态；callback 在作业结束时以状态为参数调用。"""
+        job_id = str(job_id)
+        with self._lock:
+            future = self._futures.get(job_id)
+            if future is None:
+                future = concurrent.futures.Future()
+                self._futures[job_id] = future
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(job_id, f.result()))
+        self._wakeup.set()
+        return future
+
+    def state(self, job_id):
+        """最近一次查询得到的作业状态（PENDING、RUNNING 或终止状态），尚未查询时返回 None。"""
+        return self._states.get(str(job_id))
+
+    def finished_at(self, job_id):
+        """监视器发现作业结束的时间戳；尚未结束时返回 None。"""
+        return self._finished_at.get(str(job_id))
+
+    def wait(self, job_ids):
+        """阻塞直到所有作业结束，返回 {job_id: 状态}。"""
+        futures = {str(job_id): self.watch(job_id) for job_id in job_ids}
+        return {job_id: future.result() for job_id, future in futures.items()}
+
+    def query_queue(self, job_ids):
+        """一次 squeue 查询多个作业，返回仍在队列中的 {job_id: 状态}；查询失败返回 None。"""
+        # -r 将数组作业的每个任务单独列出（形如 123_4）
+        output = _run([self.squeue, "-h", "-r", "-o", "%i %T", "-j", ",".join(job_ids)])
+        if output is None:
+            return None
+        states = {}
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) >= 2:
+                states[fields[0]] = fields[1]
+        return states
+
+    def query_accounting(self, job_ids):
+        """一次 sacct 查询多个作业的状态；sacct 不可用时返回空字典。"""
+        output = _run([self.sacct, "-n", "-P", "-X", "-o", "JobID,State", "-j", ",".join(job_ids)])
+        states = {}
+        for line in (output or "").splitlines():
+            fields = line.split("|")
+            if len(fields) >= 2 and fields[1].strip():
+                states[fields[0].strip()] = fields[1].split()[0]
+        return states
+
+    def query_times(self, job_ids):
+        """
+        一次 sacct 查询多个作业的提交、开始与结束时间，返回
+        {job_id: {"state", "submit", "start", "end"}}，时间为时间戳（未知时为 None）。
+        """
+        output = _run([self.sacct, "-n", "-P", "-X", "-o", "JobID,State,Submit,Start,End", "-j", ",".join(job_ids)])
+        times = {}
+        for line in (output or "").splitlines():
+            fields = line.split("|")
+            if len(fields) >= 5:
+                times[fields[0].strip()] = {"state": fields[1].split()[0] if fields[1].strip() else None,
+                                            "submit": _parse_time(fields[2]), "start": _parse_time(fields[3]),
+                                            "end": _parse_time(fields[4])}
+        return times
+
+    def _poll(self, pending):
+        queued = self.query_queue(pending)
+        if queued is None:
+            # squeue 对已全部清除的作业会报错，但也可能是控制器暂时无响应；
+            # 连续失败 max_query_failures 次后才认为作业均已离开队列
+            self._query_failures += 1
+            trust_absence = self._query_failures >= self.max_query_failures
+            queued = {}
+        else:
+            self._query_failures = 0
+            trust_absence = True
+        finished = {}
+        gone = [job_id for job_id in pending if job_id not in queued]
+        if gone:
+            accounting = self.query_accounting(gone)
+            for job_id in gone:
+                state = accounting.get(job_id)
+                if state is None and trust_absence:
+                    state = "UNKNOWN"
+                if state in TERMINAL_STATES:
+                    finished[job_id] = state
+                elif state is not None:
+                    queued[job_id] = state
+        return queued, finished
+
+    def _loop(self):
+        interval = self.min_interval
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                pending = [job_id for job_id, future in self._futures.items() if not future.done()]
+            if not pending:
+                with self._lock:
+                    if all(future.done() for future in self._futures.values()):
+                        self._thread = None
+                        return
+                continue
+            queued, finished = self._poll(pending)
+            changed = bool(finished) or any(self._states.get(job_id) != state for job_id, state in queued.items())
+            self._states.update(queued)
+            for job_id, state in finished.items():
+                self._states[job_id] = state
+                self._finished_at[job_id] = time.time()
+                with self._lock:
+                    future = self._futures[job_id]
+                if state == "COMPLETED":
+                    log_info(f"Job {job_id} has completed.")
+                else:
+                    log_error(f"Job {job_id} finished with state {state}.")
+                future.set_result(state)
+            if finished and len(finished) == len(pending):
+                continue
+            interval = self.min_interval if changed else min(interval * self.backoff, self.max_interval)
+            if self._wakeup.wait(interval):
+                # 有新作业登记，立即重新查询
+                interval = self.min_interval
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor():
+    """返回进程内共享的作业监视器。"""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = JobMonitor()
+        return _monitor
+
+
+def wait_for_jobs(job_ids):
+    """等待一批作业结束，返回 {job_id: 状态}。"""
+    job_ids = [str(job_id) for job_id in job_ids if job_id]
+    if not job_ids:
+        return {}
+    log_info(f"Waiting for jobs {', '.join(job_ids)} to complete...")
+    return get_monitor().wait(job_ids)
+
+
+def wait_for_job_completion(job_id):
+    """等待单个作业结束并返回其终止状态。"""
+    return wait_for_jobs([job_id]).get(str(job_id))
+
+
+def confirm_finished(directories):
+    """
+    作业状态为 UNKNOWN（已离开队列而 sacct 无记录）时，以计算目录确认结果：
+    每个目录中的 VASP 计算均已正常结束，且 OUTCAR 晚于输入文件（不是上一次计算留下的）。
+    """
+    if not directories:
+        return False
+    for directory in directories:
+        if status.check_calculation(directory)["status"] != status.COMPLETED:
+            return False
+        inputs = [os.path.join(directory, name) for name in INPUT_FILES]
+        newest_input = max((os.path.getmtime(path) for path in inputs if os.path.isfile(path)), default=0.0)
+        if os.path.getmtime(os.path.join(directory, "OUTCAR")) < newest_input:
+            return False
+    return True
+
+
+def failed_jobs(states, directories=None):
+    """
+    返回未正常完成的 {job_id: 状态}。状态为 UNKNOWN 的作业只有在 directories（这些作业的计算目录）
+    经 confirm_finished 确认后才视为完成。
+    """
+    failed = {job: s for job, s in states.items() if s != "COMPLETED"}
+    if failed and set(failed.values()) == {"UNKNOWN"} and confirm_finished(directories):
+        log_info(f"Jobs {', '.join(failed)} have no accounting record; outputs in {', '.join(directories)} "
+                 f"are complete.")
+        return {}
+    return failed
+
+
+def watch_jobs(job_ids, directories=None):
+    """
+    返回一个 Future：所有作业结束后完成，结果为 {job_id: 状态}；
+    任一作业以 FAILED、TIMEOUT 等非正常状态结束时 Future 抛出 RuntimeError。
+    状态为 UNKNOWN 的作业按 failed_jobs 以 directories 确认。
+    """
+    job_ids = list(dict.fromkeys(str(job_id) for job_id in job_ids if job_id))
+    done = concurrent.futures.Future()
+    states = {}
+    if not job_ids:
+        done.set_result(states)
+        return done
+    lock = threading.Lock()
+
+    def collect(job_id, state):
+        with lock:
+            states[job_id] = state
+            if len(states) < len(job_ids):
+                return
+        failed = failed_jobs(states, directories)
+        if failed:
+            done.set_exception(RuntimeError(f"Jobs did not complete: {failed}"))
+        else:
+            done.set_result(states)
+
+    monitor = get_monitor()
+    for job_id in job_ids:
+        monitor.watch(job_id, callback=collect)
+    return done
+
+
+def _sbatch_headers(script_path):
+    """读取目录作业脚本中的资源设置（#SBATCH 行），去掉作业名、数组与输出文件选项。"""
+    headers = []
+    with open(script_path) as file:
+        for line in file:
+            if line.startswith("#SBATCH"):
+                option = line.split()[1] if len(line.split()) > 1 else ""
+                if option.split("=")[0] not in PACK_OVERRIDES:
+                    headers.append(line.rstrip("\n"))
+    return headers
+
+
+def write_pack_script(directories, path, mode="array", run_script=RUN_SCRIPT, max_parallel=None, job_name="efpack"):
+    """
+    生成打包作业脚本。资源设置取自第一个目录的作业脚本，每个目录仍在自身目录下
+    执行自己的作业脚本，标准输出写入该目录的 slurm-*.out，便于逐目录判断状态。
+    mode 为 "array" 时每个目录是数组作业的一个任务；为 "serial" 时在同一次分配中依次运行。
+    """
+    directories = [os.path.abspath(directory) for directory in directories]
+    for directory in directories:
+        if not os.path.isfile(os.path.join(directory, run_script)):
+            raise FileNotFoundError(f"作业脚本不存在：{os.path.join(directory, run_script)}")
+    lines = ["#!/bin/bash", f"#SBATCH --job-name={job_name}"]
+    lines += _sbatch_headers(os.path.join(directories[0], run_script))
+    dirs = " ".join(shlex.quote(directory) for directory in directories)
+    if mode == "array":
+        limit = f"%{max_parallel}" if max_parallel else ""
+        lines += [f"#SBATCH --array=0-{len(directories) - 1}{limit}", "#SBATCH --output=/dev/null",
+                  f"DIRS=({dirs})",
+                  'cd "${DIRS[$SLURM_ARRAY_TASK_ID]}" || exit 1',
+                  f'bash {shlex.quote(run_script)} > "slurm-${{SLURM_ARRAY_JOB_ID}}_${{SLURM_ARRAY_TASK_ID}}.out" 2>&1']
+    elif mode == "serial":
+        lines += ["#SBATCH --output=/dev/null", f"DIRS=({dirs})", "status=0",
+                  'for dir in "${DIRS[@]}"; do',
+                  f'    (cd "$dir" && bash {shlex.quote(run_script)} > "slurm-${{SLURM_JOB_ID}}.out" 2>&1) || status=1',
+                  "done", "exit $status"]
+    else:
+        raise ValueError(f"未知的打包方式：{mode}")
+    with open(path, 'w') as file:
+        file.write("\n".join(lines) + "\n")
+    return path
+
+
+def submit_packed(directories, mode="array", run_script=RUN_SCRIPT, max_parallel=None, sbatch="sbatch",
+                  script_dir=None):
+    """
+    将一批已准备好的计算目录打包为一个 Slurm 作业提交，返回 {目录: 作业号}。
+    数组作业中每个目录对应独立的任务号（如 123_4），可分别监视；
+    serial 模式下所有目录共用同一作业号，各目录的完成状态由 OUTCAR 判断。
+    """
+    directories = list(directories)
+    if not directories:
+        return {}
+    script_dir = script_dir or os.path.commonpath([os.path.abspath(directory) for directory in directories])
+    if not os.path.isdir(script_dir):
+        script_dir = os.path.dirname(script_dir)
+    name = f"efpack-{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}.slurm"
+    script = write_pack_script(directories, os.path.join(script_dir, name), mode, run_script, max_parallel)
+    output = subprocess.check_output([sbatch, script], cwd=script_dir, universal_newlines=True)
+    match = re.search(r"job\s+(\d+)", output, re.IGNORECASE)
+    if not match:
+        raise RuntimeError(f"Could not parse job id from output: {output}")
+    job_id = match.group(1)
+    log_info(f"Submitted {mode} job {job_id} for {len(directories)} directories.")
+    if mode == "array":
+        return {directory: f"{job_id}_{i}" for i, directory in enumerate(directories)}
+    return {directory: job_id for directory in directories}
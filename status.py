@@ -0,0 +1,161 @@
+import os
+import re
+import sys
+import glob
+import json
+import argparse
+
+# 与 ORRbader.py/ORRcdd.py 中 TASK_STATUS 的取值一致
+NOT_EXIST = "not_exist"
+NOT_EXECUTED = "not_executed"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+FAILED = "failed"
+
+MANIFEST = ".efstatus.json"
+TAIL_BYTES = 64 * 1024
+# 向前搜索 SCF 迭代信息的最大字节数
+SEARCH_LIMIT = 16 * 1024 * 1024
+
+# 标准输出（vasp.out、slurm-*.out）中的错误特征
+STDOUT_ERRORS = {
+    "zbrent": b"ZBRENT: fatal error",
+    "walltime": b"DUE TO TIME LIMIT",
+    "cancelled": b"CANCELLED AT",
+    "out_of_memory": b"oom-kill",
+    "bad_termination": b"BAD TERMINATION",
+}
+ITERATION_RE = re.compile(rb"Iteration\s+(\d+)\(\s*(\d+)\)")
+
+
+def _read_tail(path, nbytes=TAIL_BYTES):
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(max(0, size - nbytes))
+        return file.read()
+
+
+def _last_scf_info(path):
+    """从文件末尾向前分块搜索最后一个离子步的 SCF 信息，返回 (是否收敛, 迭代次数)。"""
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        end = file.tell()
+        window = TAIL_BYTES
+        while True:
+            start = max(0, end - window)
+            file.seek(start)
+            data = file.read(end - start)
+            aborting = data.rfind(b"aborting loop")
+            iterations = list(ITERATION_RE.finditer(data))
+            if aborting != -1 or iterations or start == 0 or window >= SEARCH_LIMIT:
+                break
+            window *= 4
+    converged = None
+    if aborting != -1:
+        line_end = data.find(b"\n", aborting)
+        converged = b"unconverged" not in data[aborting:line_end if line_end != -1 else None]
+    iteration = int(iterations[-1].group(2)) if iterations else None
+    return converged, iteration
+
+
+def _read_nelm(directory):
+    incar_path = os.path.join(directory, "INCAR")
+    try:
+        with open(incar_path) as file:
+            for line in file:
+                m = re.match(r"\s*NELM\s*=\s*(\d+)", line, re.IGNORECASE)
+                if m:
+                    return int(m.group(1))
+    except OSError:
+        pass
+    return 60
+
+
+def _stdout_files(directory):
+    files = glob.glob(os.path.join(directory, "slurm-*.out")) + glob.glob(os.path.join(directory, "vasp.out"))
+    return sorted(files, key=os.path.getmtime)[-1:]
+
+
+def _signature(paths):
+    signature = {}
+    for path in paths:
+        st = os.stat(path)
+        signature[os.path.basename(path)] = [st.st_size, st.st_mtime_ns]
+    return signature
+
+
+def _inspect(directory, outcar_path, stdout_paths):
+    errors = []
+    for path in stdout_paths:
+        tail = _read_tail(path)
+        errors.extend(name for name, pattern in STDOUT_ERRORS.items() if pattern in tail)
+    if "walltime" in errors and "cancelled" in errors:
+        errors.remove("cancelled")
+    finished = b"Total CPU time" in _read_tail(outcar_path)
+    converged, iteration = _last_scf_info(outcar_path)
+    if converged is False or (converged is None and finished and iteration is not None
+                              and iteration >= _read_nelm(directory)):
+        errors.append("scf_not_converged")
+    if finished:
+        status = FAILED if errors else COMPLETED
+    else:
+        status = FAILED if errors else IN_PROGRESS
+    return {"status": status, "finished": finished, "errors": errors}
+
+
+def check_calculation(directory, use_cache=True):
+    """
+    判断目录中 VASP 计算的状态：只读取 OUTCAR 与标准输出文件的末尾，
+    识别 SCF 未收敛、ZBRENT、超时被杀等错误。结果缓存在目录下的 .efstatus.json 中，
+    以相关文件的大小与修改时间为键，文件未变化时直接返回缓存。
+    返回 {"status": ..., "finished": bool, "errors": [...]}。
+    """
+    outcar_path = os.path.join(directory, "OUTCAR")
+    if not os.path.isdir(directory):
+        return {"status": NOT_EXIST, "finished": False, "errors": []}
+    if not os.path.isfile(outcar_path):
+        return {"status": NOT_EXECUTED, "finished": False, "errors": []}
+    stdout_paths = _stdout_files(directory)
+    signature = _signature([outcar_path] + stdout_paths)
+    manifest_path = os.path.join(directory, MANIFEST)
+    if use_cache:
+        try:
+            with open(manifest_path) as file:
+                manifest = json.load(file)
+            if manifest.get("signature") == signature:
+                return manifest["result"]
+        except (OSError, ValueError, KeyError):
+            pass
+    result = _inspect(directory, outcar_path, stdout_paths)
+    try:
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({"signature": signature, "result": result}, file)
+        os.replace(tmp_path, manifest_path)
+    except OSError:
+        pass
+    return result
+
+
+def is_completed(directory):
+    """OUTCAR 中出现 "Total CPU time" 即视为计算已结束（与原 grep 判据一致）。"""
+    return check_calculation(directory)["finished"]
+
+
+def scan(directories):
+    """批量检查多个目录，返回 {目录: 结果}。"""
+    return {directory: check_calculation(directory) for directory in directories}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查 VASP 计算目录的完成状态")
+    parser.add_argument('directories', nargs='+', help="一个或多个计算目录")
+    parser.add_argument('--no-cache', action='store_true', help="忽略 .efstatus.json 缓存")
+    args = parser.parse_args()
+    failed = False
+    for directory in args.directories:
+        result = check_calculation(directory, use_cache=not args.no_cache)
+        failed |= result["status"] != COMPLETED
+        print(f"{directory:<50}{result['status']:<14}{','.join(result['errors'])}")
+    sys.exit(1 if failed else 0)
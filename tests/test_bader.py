@@ -0,0 +1,76 @@
+import math
+import itertools
+import numpy as np
+import pytest
+import bader
+import badertable
+
+# 正交晶胞与斜晶胞（γ = 60°，c 轴倾斜）的晶格（Å）
+CELLS = {
+    "orthogonal": np.array([[10.0, 0.0, 0.0], [0.0, 10.0, 0.0], [0.0, 0.0, 10.0]]),
+    "skewed": np.array([[10.0, 0.0, 0.0], [5.0, 8.660254, 0.0], [1.5, 1.0, 9.5]]),
+}
+SHAPE = (56, 56, 56)
+# 两中心关于 (0.5, 0.5, 0.5) 反演对称，任意晶格下两个 Bader 区域都互为镜像
+PAIR = np.array([[0.25, 0.25, 0.25], [0.75, 0.75, 0.75]])
+
+
+def gaussian_density(lattice, centers, charges, sigma, shape=SHAPE):
+    """
+    周期性高斯电荷团在格点上的密度，按 CHGCAR 的约定返回 ρ·V。
+    每个高斯函数对全空间的积分等于对应的 charges，周期像取相邻 27 个晶胞。
+    """
+    frac = np.stack(np.meshgrid(*[np.arange(n) / n for n in shape], indexing='ij'), axis=-1)
+    rho = np.zeros(shape)
+    norm = (2 * math.pi * sigma ** 2) ** 1.5
+    for center, charge in zip(centers, charges):
+        for image in itertools.product((-1, 0, 1), repeat=3):
+            r = (frac - np.asarray(center) - image) @ lattice
+            rho += charge / norm * np.exp(-np.sum(r * r, axis=-1) / (2 * sigma ** 2))
+    return rho * abs(np.linalg.det(lattice))
+
+
+@pytest.mark.parametrize("cell", CELLS)
+def test_symmetric_pair_splits_charge_and_volume(cell):
+    lattice = CELLS[cell]
+    chg = gaussian_density(lattice, PAIR, [4.0, 4.0], sigma=1.2)
+    result = bader.bader_partition(chg, chg, lattice, PAIR, vacuum_tol=0.0)
+    volume = abs(np.linalg.det(lattice))
+    assert result["charges"] == pytest.approx([4.0, 4.0], rel=1e-2)
+    assert result["volumes"] == pytest.approx([volume / 2, volume / 2], rel=3e-2)
+    assert result["nelect"] == pytest.approx(8.0, rel=1e-6)
+
+
+@pytest.mark.parametrize("cell", CELLS)
+def test_separated_blobs_keep_their_charge(cell):
+    lattice = CELLS[cell]
+    chg = gaussian_density(lattice, PAIR, [6.0, 1.0], sigma=0.6)
+    result = bader.bader_partition(chg, chg, lattice, PAIR, vacuum_tol=0.0)
+    assert result["charges"] == pytest.approx([6.0, 1.0], rel=1e-2)
+
+
+@pytest.mark.parametrize("cell", CELLS)
+def test_vacuum_cutoff_matches_sphere_integral(cell):
+    """密度高于真空判据的区域是球体，其电荷与体积有解析解。"""
+    lattice, charge, sigma = CELLS[cell], 8.0, 0.8
+    center = np.array([[0.5, 0.5, 0.5]])
+    chg = gaussian_density(lattice, center, [charge], sigma)
+    result = bader.bader_partition(chg, chg, lattice, center)
+    radius = sigma * math.sqrt(2 * math.log(charge / ((2 * math.pi * sigma ** 2) ** 1.5 * bader.VACUUM_TOL)))
+    x = radius / sigma
+    inside = charge * (math.erf(x / math.sqrt(2)) - math.sqrt(2 / math.pi) * x * math.exp(-x * x / 2))
+    assert result["charges"][0] == pytest.approx(inside, rel=1e-2)
+    assert result["volumes"][0] == pytest.approx(4 / 3 * math.pi * radius ** 3, rel=3e-2)
+    assert result["charges"][0] + result["vacuum_charge"] == pytest.approx(charge, rel=1e-6)
+
+
+def test_write_acf_round_trip(tmp_path):
+    lattice = CELLS["orthogonal"]
+    chg = gaussian_density(lattice, PAIR, [4.0, 4.0], sigma=1.2, shape=(24, 24, 24))
+    result = bader.bader_partition(chg, chg, lattice, PAIR)
+    path = str(tmp_path / bader.ACF_FILE)
+    bader.write_acf(path, result)
+    atoms = badertable.read_acf(path)
+    assert [charge for charge, _, _ in atoms] == pytest.approx(result["charges"], abs=1e-6)
+    assert [volume for _, _, volume in atoms] == pytest.approx(result["volumes"], abs=1e-6)
+    assert not (tmp_path / (bader.ACF_FILE + ".tmp")).exists()
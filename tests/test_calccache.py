@@ -0,0 +1,60 @@
+import os
+import pytest
+import calccache
+
+
+@pytest.fixture
+def calc(tmp_path):
+    """一个已完成的计算目录与一个输入相同、尚未计算的目录。"""
+    done, fresh = tmp_path / "done", tmp_path / "fresh"
+    for directory in (done, fresh):
+        directory.mkdir()
+        (directory / "INCAR").write_text("ENCUT = 400\nISPIN = 2\n")
+        (directory / "KPOINTS").write_text("auto\n0\nGamma\n3 3 1\n")
+    (done / "OUTCAR").write_text("energy\n")
+    (done / "CHGCAR").write_text("density\n")
+    (done / "ACF.dat").write_text("charges\n")
+    return done, fresh, str(tmp_path / "cache")
+
+
+def test_restore_does_not_share_rewritable_files(calc):
+    done, fresh, cache = calc
+    calccache.store(str(done), cache_dir=cache)
+    assert calccache.restore(str(fresh), required=("OUTCAR", "CHGCAR"), cache_dir=cache)
+    assert os.stat(fresh / "OUTCAR").st_nlink == 1
+    # VASP 重算时原地改写 OUTCAR，缓存与其他目录不受影响
+    with open(fresh / "OUTCAR", 'w') as file:
+        file.write("rewritten\n")
+    assert (done / "OUTCAR").read_text() == "energy\n"
+    other = fresh.parent / "other"
+    other.mkdir()
+    for name in ("INCAR", "KPOINTS"):
+        (other / name).write_text((fresh / name).read_text())
+    assert calccache.restore(str(other), cache_dir=cache)
+    assert (other / "OUTCAR").read_text() == "energy\n"
+
+
+def test_blobs_are_read_only(calc):
+    done, _, cache = calc
+    key = calccache.store(str(done), cache_dir=cache)
+    blob_dir = os.path.join(cache, "blobs", key[:2], key)
+    for name in os.listdir(blob_dir):
+        assert not os.stat(os.path.join(blob_dir, name)).st_mode & 0o222
+
+
+def test_store_skips_files_already_cached(calc, monkeypatch):
+    done, fresh, cache = calc
+    calccache.store(str(done), cache_dir=cache)
+    assert calccache.restore(str(fresh), cache_dir=cache)
+    placed = []
+    monkeypatch.setattr(calccache, "_place", lambda src, dst: placed.append(os.path.basename(src)))
+    # 未改动的源目录与本进程中刚恢复的目录都不再复制
+    calccache.store(str(done), cache_dir=cache)
+    calccache.store(str(fresh), cache_dir=cache)
+    assert placed == []
+    monkeypatch.undo()
+    (fresh / "ACF.dat").unlink()
+    (fresh / "ACF.dat").write_text("new charges\n")
+    key = calccache.store(str(fresh), cache_dir=cache)
+    with open(os.path.join(cache, "blobs", key[:2], key, "ACF.dat")) as file:
+        assert file.read() == "new charges\n"
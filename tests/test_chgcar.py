@@ -0,0 +1,101 @@
+import re
+import numpy as np
+import pytest
+import chgcar
+
+GRID = (4, 3, 7)
+HEADER = ("synthetic\n1.0\n5.0 0.0 0.0\n0.0 5.0 0.0\n0.0 0.0 9.0\nFe O\n1 1\nDirect\n"
+          "0.0 0.0 0.0\n0.5 0.5 0.5\n\n   4   3   7\n")
+GRID_LINE = "   4   3   7\n"
+LINE_RE = re.compile(r"^(?: -?\d\.\d{11}E[-+]\d{2}){1,5}$")
+
+
+def _augmentation(seed):
+    return (f"augmentation occupancies   1   2\n  0.{seed}1234567E+00  0.{seed}7654321E-01\n"
+            f"augmentation occupancies   2   2\n  0.{seed}2222222E+00 -0.{seed}3333333E-01\n")
+
+
+def _block_text(values):
+    """按 VASP 的方式每行 5 个数写出一个数据块（最后一行可不满 5 个）。"""
+    flat = np.ravel(values, order='F')
+    return "".join("".join(" %17.11E" % v for v in flat[i:i + 5]) + "\n" for i in range(0, len(flat), 5))
+
+
+def write_synthetic(path, total, magnetization, seed):
+    """写出自旋极化的合成 CHGCAR，返回每个数据块之后的附加文本。"""
+    tails = [_augmentation(seed) + GRID_LINE, _augmentation(seed + 1)]
+    with open(path, 'w') as file:
+        file.write(HEADER + _block_text(total) + tails[0] + _block_text(magnetization) + tails[1])
+    return tails
+
+
+def parse_blocks(path, tails):
+    """不经过 chgcar 模块，直接按文本解析输出文件：返回 [(数据块数组, 数据行)] 与全文。"""
+    with open(path) as file:
+        text = file.read()
+    nlines = -(-int(np.prod(GRID)) // 5)
+    body = text[len(HEADER):]
+    blocks = []
+    for tail in tails:
+        lines = body.splitlines(keepends=True)
+        data, body = lines[:nlines], "".join(lines[nlines:])
+        blocks.append((np.array(" ".join(data).split(), dtype=float).reshape(GRID, order='F'), data))
+        assert body.startswith(tail)
+        body = body[len(tail):]
+    assert body == ""
+    return blocks, text
+
+
+def _rounded(values):
+    return np.array([float("%17.11E" % v) for v in np.ravel(values)]).reshape(values.shape)
+
+
+@pytest.fixture
+def pair(tmp_path, monkeypatch):
+    # 每次只解析两层、每次写出 3 个数值，NGZ = 7 不是分块的整数倍，总数 84 也不是 5 的整数倍
+    monkeypatch.setattr(chgcar, "CHUNK_VALUES", 2 * GRID[0] * GRID[1])
+    rng = np.random.default_rng(0)
+    grids = [_rounded(rng.normal(size=GRID) * 10.0 ** rng.integers(-3, 3, size=GRID)) for _ in range(4)]
+    tails = write_synthetic(tmp_path / "AECCAR0", grids[0], grids[1], 1)
+    write_synthetic(tmp_path / "AECCAR2", grids[2], grids[3], 3)
+    return tmp_path, grids, tails
+
+
+def test_index_finds_both_spin_blocks(pair):
+    tmp_path, grids, _ = pair
+    index = chgcar.index_chgcar(str(tmp_path / "AECCAR0"))
+    assert index["grid"] == GRID
+    assert len(index["blocks"]) == 2
+    for spin in range(2):
+        assert np.array_equal(chgcar.read_grid(index, spin), grids[spin])
+        assert len(list(chgcar.iter_slabs(index, spin))) == 4
+
+
+def test_streaming_sum_matches_dense_sum(pair):
+    tmp_path, grids, tails = pair
+    index0, index2 = (chgcar.index_chgcar(str(tmp_path / name)) for name in ("AECCAR0", "AECCAR2"))
+    output = str(tmp_path / "CHGCAR_sum")
+    blocks = [(a + b for a, b in zip(chgcar.iter_slabs(index0, spin), chgcar.iter_slabs(index2, spin)))
+              for spin in range(2)]
+    chgcar.write_chgcar(output, index0["header"], *blocks, tails=tails)
+
+    # 增广占据数与第二块的格点维度行在 parse_blocks 中按原文逐段比对
+    parsed, text = parse_blocks(output, tails)
+    assert text.startswith(HEADER)
+    for spin, (values, lines) in enumerate(parsed):
+        expected = grids[spin] + grids[spin + 2]
+        assert np.allclose(values, expected, rtol=1e-10, atol=0)
+        assert all(LINE_RE.match(line.rstrip("\n")) for line in lines)
+        assert [len(line.split()) for line in lines] == [5] * 16 + [4]
+    assert not (tmp_path / "CHGCAR_sum.tmp").exists()
+
+
+def test_chgsum_matches_dense_sum(pair):
+    tmp_path, grids, _ = pair
+    output = chgcar.chgsum(str(tmp_path / "AECCAR0"), str(tmp_path / "AECCAR2"), str(tmp_path / "CHGCAR_sum"))
+    index = chgcar.index_chgcar(output)
+    assert len(index["blocks"]) == 1
+    assert np.allclose(chgcar.read_grid(index), grids[0] + grids[2], rtol=1e-10, atol=0)
+    with open(output) as file:
+        lines = file.read()[len(HEADER):].splitlines()
+    assert all(LINE_RE.match(line) for line in lines)
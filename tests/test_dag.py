@@ -0,0 +1,76 @@
+import concurrent.futures
+import journal
+from dag import TaskGraph, SUCCESS, FAILED, SKIPPED, RESUMED
+
+
+def _fail():
+    raise RuntimeError("analysis failed")
+
+
+def test_failed_task_skips_dependents_only():
+    graph = TaskGraph()
+    graph.add("a:analyze", _fail)
+    graph.add("a:table", lambda: None, deps=["a:analyze"])
+    graph.add("b:analyze", lambda: 1)
+    assert graph.run(max_workers=2) is False
+    assert graph.tasks["a:analyze"].status == FAILED
+    assert isinstance(graph.tasks["a:analyze"].error, RuntimeError)
+    assert graph.tasks["a:table"].status == SKIPPED
+    assert graph.tasks["b:analyze"].status == SUCCESS
+
+
+def test_waiting_task_fails_with_its_future():
+    future = concurrent.futures.Future()
+    graph = TaskGraph()
+    graph.add("wait", lambda: future)
+    graph.add("next", lambda: None, deps=["wait"])
+    future.set_exception(RuntimeError("Jobs did not complete"))
+    assert graph.run() is False
+    assert graph.tasks["wait"].status == FAILED
+    assert graph.tasks["next"].status == SKIPPED
+
+
+def _graph(contcar, job_ids):
+    graph = TaskGraph()
+    graph.add("generate", lambda: None, files=[str(contcar)])
+    graph.add("submit", lambda: job_ids.pop(0), deps=["generate"])
+    graph.add("wait", lambda: graph.result("submit"), deps=["submit"])
+    return graph
+
+
+def test_resume_follows_input_files_and_upstream_results(tmp_path):
+    path = str(tmp_path / journal.journal_path("Fe", "electronic"))
+    contcar = tmp_path / "CONTCAR"
+    contcar.write_text("Fe\n")
+    assert _graph(contcar, ["101"]).run(journal=journal.Journal(path))
+    first = journal.load_stages(path)
+
+    graph = _graph(contcar, ["102"])
+    assert graph.run(journal=journal.Journal(path, resume=True))
+    assert all(task.status == RESUMED for task in graph.tasks.values())
+    assert graph.result("wait") == "101"
+
+    # 结构改变后整条链重新执行，等待任务的输入随新的作业号改变
+    contcar.write_text("Fe\nO\n")
+    graph = _graph(contcar, ["103"])
+    assert graph.run(journal=journal.Journal(path, resume=True))
+    assert all(task.status == SUCCESS for task in graph.tasks.values())
+    stages = journal.load_stages(path)
+    assert stages["wait"]["result"] == "103"
+    assert stages["wait"]["inputs"] != first["wait"]["inputs"]
+
+
+def test_journal_step_reruns_when_input_file_changes(tmp_path):
+    path = str(tmp_path / journal.journal_path("Fe", "dos"))
+    contcar = tmp_path / "CONTCAR"
+    contcar.write_text("Fe\n")
+    calls = []
+    run = lambda: calls.append(1) or len(calls)
+    assert journal.Journal(path).step("nelect", run, files=[str(contcar)]) == 1
+    assert journal.Journal(path, resume=True).step("nelect", run, files=[str(contcar)]) == 1
+    contcar.write_text("Fe\nO\n")
+    assert journal.Journal(path, resume=True).step("nelect", run, files=[str(contcar)]) == 2
+
+
+def test_flows_write_separate_journals():
+    assert journal.journal_path("Fe", "dos") != journal.journal_path("Fe", "electronic")
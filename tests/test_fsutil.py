@@ -0,0 +1,24 @@
+import os
+import fsutil
+
+
+def test_writable_target_never_shares_the_inode(tmp_path):
+    src, dst = tmp_path / "CHGCAR", tmp_path / "next" / "CHGCAR"
+    dst.parent.mkdir()
+    src.write_text("density\n")
+    os.link(src, dst)
+    assert fsutil.place(str(src), str(dst), writable=True) in ("reflink", "copy")
+    with open(dst, 'w') as file:
+        file.write("rewritten\n")
+    assert src.read_text() == "density\n"
+    assert not (tmp_path / "next" / "CHGCAR.tmp").exists()
+
+
+def test_read_only_target_is_linked_once(tmp_path):
+    src, dst = tmp_path / "POTCAR", tmp_path / "calc" / "POTCAR"
+    dst.parent.mkdir()
+    src.write_text("potential\n")
+    assert fsutil.place(str(src), str(dst)) in ("reflink", "hardlink")
+    if os.path.samefile(src, dst):
+        assert fsutil.place(str(src), str(dst)) == "same"
+    assert dst.read_text() == "potential\n"
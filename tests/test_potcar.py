@@ -0,0 +1,43 @@
+import os
+import sqlite3
+import pytest
+import potcar
+import synthetic
+
+
+@pytest.fixture
+def potcar_file(tmp_path):
+    path = tmp_path / "POTCAR"
+    path.write_text(synthetic.potcar_text(["Fe_pv", "N", "C"], body_lines=500))
+    return str(path)
+
+
+def test_scan_headers(potcar_file):
+    assert potcar.scan_headers(potcar_file) == [
+        ("PAW_PBE Fe_pv 06Sep2000", 8.0), ("PAW_PBE N 06Sep2000", 5.0), ("PAW_PBE C 06Sep2000", 4.0)]
+
+
+def test_scan_rejects_header_without_zval(tmp_path):
+    path = tmp_path / "POTCAR"
+    path.write_text("  PAW_PBE O 08Apr2002\n   TITEL  = PAW_PBE O 08Apr2002\n End of Dataset\n")
+    with pytest.raises(ValueError):
+        potcar.scan_headers(str(path))
+
+
+def test_index_keyed_on_file_stat(potcar_file, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    scans = []
+    scan = potcar.scan_headers
+    monkeypatch.setattr(potcar, "scan_headers", lambda path: scans.append(path) or scan(path))
+    assert potcar.read_zvals(potcar_file, cache_dir) == [8.0, 5.0, 4.0]
+    linked = str(tmp_path / "linked")
+    os.link(potcar_file, linked)
+    assert potcar.read_zvals(linked, cache_dir) == [8.0, 5.0, 4.0]
+    assert len(scans) == 1
+    # 改写后大小与修改时间变化，重新扫描
+    with open(potcar_file, 'w') as file:
+        file.write(synthetic.potcar_text(["O"], body_lines=10))
+    assert potcar.read_zvals(potcar_file, cache_dir) == [6.0]
+    assert len(scans) == 2
+    with sqlite3.connect(os.path.join(cache_dir, "headers.sqlite")) as db:
+        assert db.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 1
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import subprocess
+import pytest
+import slurm
+
+FAKESLURM = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fakeslurm.py")
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    """安装假调度器，返回 (提交函数, 使用假 squeue/sacct 的作业监视器)。"""
+    monkeypatch.setenv("FAKE_SLURM_DIR", str(tmp_path / "state"))
+    bin_dir = tmp_path / "bin"
+    subprocess.run([sys.executable, FAKESLURM, "install", str(bin_dir)], check=True, stdout=subprocess.DEVNULL)
+    monitor = slurm.JobMonitor(min_interval=0.05, max_interval=0.2, squeue=str(bin_dir / "squeue"),
+                               sacct=str(bin_dir / "sacct"))
+
+    def submit(body):
+        script = tmp_path / f"job{time.monotonic_ns()}.sh"
+        script.write_text(f"#!/bin/bash\n{body}\n")
+        output = subprocess.check_output([str(bin_dir / "sbatch"), str(script)], cwd=tmp_path, text=True)
+        return output.split()[-1]
+
+    return submit, monitor
+
+
+def _wait_for(predicate, timeout=20):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_running_job_completes(scheduler):
+    submit, monitor = scheduler
+    job_id = submit("sleep 1")
+    future = monitor.watch(job_id)
+    _wait_for(lambda: monitor.state(job_id) == "RUNNING")
+    assert future.result(timeout=20) == "COMPLETED"
+    assert monitor.state(job_id) == "COMPLETED"
+    assert monitor.finished_at(job_id) is not None
+
+
+def test_failed_job(scheduler):
+    submit, monitor = scheduler
+    job_id = submit("sleep 0.5; exit 3")
+    assert monitor.watch(job_id).result(timeout=20) == "FAILED"
+
+
+def test_job_gone_from_squeue_resolved_by_sacct(scheduler, tmp_path):
+    submit, monitor = scheduler
+    done, failed = submit("exit 0"), submit("exit 1")
+    # 作业在登记前已离开队列，监视器从未在 squeue 中见到它们，终止状态只能来自 sacct
+    state_dir = tmp_path / "state" / "jobs"
+    _wait_for(lambda: all('"RUNNING"' not in (state_dir / f"{job}.json").read_text()
+                          and '"PENDING"' not in (state_dir / f"{job}.json").read_text() for job in (done, failed)))
+    assert monitor.query_queue([done, failed]) == {}
+    assert monitor.wait([done, failed]) == {done: "COMPLETED", failed: "FAILED"}
+
+
+def test_job_unknown_to_sacct_is_not_completed(scheduler, monkeypatch, tmp_path):
+    _, monitor = scheduler
+    monkeypatch.setattr(slurm, "get_monitor", lambda: monitor)
+    assert monitor.watch("999999").result(timeout=20) == "UNKNOWN"
+    with pytest.raises(RuntimeError):
+        slurm.watch_jobs(["999999"]).result(timeout=20)
+    # 计算目录中没有完整的 OUTCAR 时不能以目录确认
+    with pytest.raises(RuntimeError):
+        slurm.watch_jobs(["999999"], [str(tmp_path)]).result(timeout=20)
+    (tmp_path / "INCAR").write_text("ENCUT = 400\n")
+    (tmp_path / "OUTCAR").write_text(" General timing and accounting informations for this job:\n"
+                                     " Total CPU time used (sec):        1.000\n")
+    assert slurm.watch_jobs(["999999"], [str(tmp_path)]).result(timeout=20) == {"999999": "UNKNOWN"}
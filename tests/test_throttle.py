@@ -0,0 +1,51 @@
+import threading
+import throttle
+
+
+class FakeMonitor:
+    """记录被监视的作业，由测试调用 finish 结束作业。"""
+
+    def __init__(self):
+        self.callbacks = {}
+
+    def state(self, job_id):
+        return "PENDING"
+
+    def watch(self, job_id, callback=None):
+        self.callbacks[job_id] = callback
+
+    def finish(self, job_id):
+        self.callbacks.pop(job_id)(job_id, "COMPLETED")
+
+
+def _array(directories, job_id):
+    return {directory: f"{job_id}_{i}" for i, directory in enumerate(directories)}
+
+
+def test_array_submission_reserves_one_slot_per_task(monkeypatch):
+    monitor = FakeMonitor()
+    monkeypatch.setattr(throttle, "get_monitor", lambda: monitor)
+    monkeypatch.setattr(throttle, "RECHECK_INTERVAL", 0.05)
+    gate = throttle.Throttle(max_queued=4, max_running=4, max_workers=1)
+
+    gate.submit_job(_array, ["a", "b", "c"], "1", slots=3)
+    assert len(gate._active) == 3
+
+    # 只剩一个名额，两个任务的数组作业须等到有任务结束
+    submitted = threading.Event()
+    thread = threading.Thread(target=lambda: (gate.submit_job(_array, ["d", "e"], "2", slots=2), submitted.set()))
+    thread.start()
+    assert not submitted.wait(0.3)
+    monitor.finish("1_0")
+    assert submitted.wait(5)
+    thread.join()
+    assert gate._active == {"1_1", "1_2", "2_0", "2_1"}
+    assert gate._reserved == 0
+
+
+def test_oversized_array_submits_when_queue_is_empty(monkeypatch):
+    monitor = FakeMonitor()
+    monkeypatch.setattr(throttle, "get_monitor", lambda: monitor)
+    gate = throttle.Throttle(max_queued=2, max_running=2, max_workers=1)
+    result = gate.submit_job(_array, ["a", "b", "c"], "7", slots=3)
+    assert sorted(result.values()) == ["7_0", "7_1", "7_2"]
@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+import datetime
+import threading
+import concurrent.futures
+from slurm import get_monitor
+
+# 缺省上限，可由环境变量或 configure() 修改
+MAX_QUEUED_JOBS = int(os.environ.get("ELECTRONICFLOW_MAX_QUEUED", 100))
+MAX_RUNNING_JOBS = int(os.environ.get("ELECTRONICFLOW_MAX_RUNNING", 50))
+MAX_LOCAL_WORKERS = int(os.environ.get("ELECTRONICFLOW_MAX_WORKERS", min(8, os.cpu_count() or 1)))
+# 本地任务启动前要求的最小可用内存（GB），0 表示不检查
+MIN_FREE_MEMORY_GB = float(os.environ.get("ELECTRONICFLOW_MIN_FREE_MEMORY", 0))
+# 等待条件时重新检查的间隔（秒）
+RECHECK_INTERVAL = 5
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def available_memory_gb():
+    """读取 /proc/meminfo 中的 MemAvailable；无法读取时返回 None。"""
+    try:
+        with open("/proc/meminfo") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024 ** 2
+    except OSError:
+        pass
+    return None
+
+
+def job_ids(result):
+    """从提交函数的返回值（作业号、作业号列表或 {目录: 作业号}）中取出作业号。"""
+    if not result:
+        return []
+    if isinstance(result, dict):
+        result = result.values()
+    elif isinstance(result, (str, int)):
+        result = [result]
+    return list(dict.fromkeys(str(job_id) for job_id in result if job_id))
+
+
+class Throttle:
+    """
+    全局资源节流：所有作业提交与本地重计算都经由同一个实例。
+    - 作业：本流程在队列中的作业数不超过 max_queued，正在运行的不超过 max_running 时才提交新作业，
+      作业结束（由共享的作业监视器通知）后释放名额；
+    - 本地任务：共用一个进程池，同时运行的任务不超过 max_workers，
+      并可要求启动前可用内存不少于 min_free_memory_gb。
+    """
+
+    def __init__(self, max_queued=MAX_QUEUED_JOBS, max_running=MAX_RUNNING_JOBS, max_workers=MAX_LOCAL_WORKERS,
+                 min_free_memory_gb=MIN_FREE_MEMORY_GB):
+        self.max_queued = max_queued
+        self.max_running = max_running
+        self.max_workers = max_workers
+        self.min_free_memory_gb = min_free_memory_gb
+        self._cond = threading.Condition()
+        self._active = set()
+        self._reserved = 0
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = None
+
+    def _running(self):
+        monitor = get_monitor()
+        return sum(1 for job_id in self._active if monitor.state(job_id) == "RUNNING")
+
+    def _release_job(self, job_id, state=None):
+        with self._cond:
+            self._active.discard(job_id)
+            self._cond.notify_all()
+
+    def _queue_full(self, slots):
+        queued = len(self._active) + self._reserved
+        # 超过上限的单次提交（大数组作业）只在队列为空时放行，否则永远等不到名额
+        return queued > 0 and queued + slots > self.max_queued
+
+    def submit_job(self, func, *args, slots=1, **kwargs):
+        """
+        在名额允许时调用提交函数 func，并登记其返回的作业号；
+        返回 func 的返回值。作业结束后自动释放名额。
+        slots 为这次提交将进入队列的作业数，数组作业（submit_packed 的 array 模式）应为任务数，
+        提交前按此预留名额，提交后每个任务号各占一个名额、分别释放。
+        """
+        with self._cond:
+            waited = False
+            while self._queue_full(slots) or self._running() >= self.max_running:
+                if not waited:
+                    log_info(f"Throttling submission of {slots} jobs: {len(self._active) + self._reserved} queued "
+                             f"(limit {self.max_queued}), {self._running()} running (limit {self.max_running}).")
+                    waited = True
+                self._cond.wait(RECHECK_INTERVAL)
+            self._reserved += slots
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            with self._cond:
+                self._reserved -= slots
+                self._cond.notify_all()
+        submitted = job_ids(result)
+        monitor = get_monitor()
+        with self._cond:
+            self._active.update(submitted)
+        for job_id in submitted:
+            monitor.watch(job_id, callback=self._release_job)
+        return result
+
+    @property
+    def executor(self):
+        with self._cond:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _wait_for_memory(self):
+        if not self.min_free_memory_gb:
+            return
+        warned = False
+        while True:
+            free = available_memory_gb()
+            if free is None or free >= self.min_free_memory_gb:
+                return
+            if not warned:
+                log_info(f"Waiting for memory: {free:.1f} GB available, {self.min_free_memory_gb:.1f} GB required.")
+                warned = True
+            time.sleep(RECHECK_INTERVAL)
+
+    def submit_local(self, fn, *args, **kwargs):
+        """
+        在共享进程池中执行 fn，返回 Future。名额用尽时阻塞等待，
+        因此进程池中不会积压任务，内存检查发生在每个任务真正启动之前。
+        """
+        self._slots.acquire()
+        try:
+            self._wait_for_memory()
+            future = self.executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_throttle():
+    """返回进程内共享的节流器。"""
+    global _throttle
+    with _throttle_lock:
+        if _throttle is None:
+            _throttle = Throttle()
+        return _throttle
+
+
+def configure(max_queued=None, max_running=None, max_workers=None, min_free_memory_gb=None):
+    """在流程开始前设置上限（未给出的保持缺省值），返回新的共享节流器。"""
+    global _throttle
+    with _throttle_lock:
+        if _throttle is not None:
+            _throttle.shutdown()
+        _throttle = Throttle(
+            MAX_QUEUED_JOBS if max_queued is None else max_queued,
+            MAX_RUNNING_JOBS if max_running is None else max_running,
+            MAX_LOCAL_WORKERS if max_workers is None else max_workers,
+            MIN_FREE_MEMORY_GB if min_free_memory_gb is None else min_free_memory_gb,
+        )
+        return _throttle
+
+
+def submit_job(func, *args, **kwargs):
+    return get_throttle().submit_job(func, *args, **kwargs)
+
+
+def submit_local(fn, *args, **kwargs):
+    return get_throttle().submit_local(fn, *args, **kwargs)
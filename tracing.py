@@ -0,0 +1,185 @@
+import sys
+import json
+import time
+import datetime
+import argparse
+import threading
+from contextlib import contextmanager
+import throttle
+from slurm import get_monitor
+
+# 事件类别：本地步骤、作业排队、作业运行、作业结束到监视器发现之间的轮询延迟
+STAGE = "stage"
+QUEUE = "queue"
+RUN = "run"
+POLL = "poll"
+MAIN_TRACK = "main"
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def trace_path(MAT):
+    return f"trace_{MAT}.json"
+
+
+def split_name(name):
+    """
+    任务名 "stage:ads:name" 拆分为 (ads, "stage:name")；不含吸附物的任务归入 main 轨道。
+    批量筛选的任务名带 "MAT/" 前缀，轨道为 "MAT/ads"（或 "MAT"）。
+    """
+    mat, _, name = name.rpartition("/")
+    parts = name.split(":")
+    if len(parts) == 3:
+        track, name = parts[1], f"{parts[0]}:{parts[2]}"
+    else:
+        track = MAIN_TRACK
+    if mat:
+        track = mat if track == MAIN_TRACK else f"{mat}/{track}"
+    return track, name
+
+
+class Tracer:
+    """
+    记录流程各步骤的起止时间（每个吸附物一条轨道），以及作业在调度器中的排队、运行时间，
+    导出为 Chrome trace（chrome://tracing 或 Perfetto 可直接打开）并汇总为表格。
+    """
+
+    def __init__(self, name="ElectronicFlow"):
+        self.name = name
+        self.spans = []
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, start, end, track=MAIN_TRACK, cat=STAGE, **args):
+        with self._lock:
+            self.spans.append({"name": name, "start": start, "end": end, "track": track, "cat": cat, "args": args})
+
+    @contextmanager
+    def span(self, name, track=MAIN_TRACK, cat=STAGE, **args):
+        start = time.time()
+        try:
+            yield
+        except (Exception, SystemExit) as e:
+            args["error"] = repr(e)
+            raise
+        finally:
+            self.add(name, start, time.time(), track, cat, **args)
+
+    def add_jobs(self, result, name, track=MAIN_TRACK):
+        """登记提交步骤返回的作业号（字符串、列表或字典均可），collect_jobs 时查询其时间。"""
+        with self._lock:
+            for job_id in throttle.job_ids(result):
+                self.jobs[job_id] = (name, track)
+
+    def add_graph(self, graph):
+        """加入 TaskGraph 中已执行任务的起止时间；提交步骤的结果作为作业号登记。"""
+        for task in graph.tasks.values():
+            if task.start is None or task.end is None:
+                continue
+            track, name = split_name(task.name)
+            self.add(name, task.start, task.end, track, status=task.status)
+            if name.endswith("submit") and task.result:
+                self.add_jobs(task.result, name.rsplit("submit", 1)[0].rstrip("-:") or name, track)
+
+    def collect_jobs(self, monitor=None):
+        """一次 sacct 查询所有登记作业的提交、开始与结束时间，生成排队、运行与轮询延迟区间。"""
+        if not self.jobs:
+            return
+        monitor = monitor or get_monitor()
+        times = monitor.query_times(list(self.jobs))
+        for job_id, (name, track) in self.jobs.items():
+            record = times.get(job_id)
+            if not record or record["submit"] is None:
+                log_error(f"No scheduler times for job {job_id}.")
+                continue
+            start, end = record["start"], record["end"]
+            if start is not None:
+                self.add(name, record["submit"], start, track, QUEUE, job=job_id)
+            if start is not None and end is not None:
+                self.add(name, start, end, track, RUN, job=job_id, state=record["state"])
+                noticed = monitor.finished_at(job_id)
+                if noticed is not None and noticed > end:
+                    self.add(name, end, noticed, track, POLL, job=job_id)
+
+    def to_chrome(self):
+        """Chrome trace 事件格式：完整事件（ph X），时间单位为微秒，轨道以线程名标注。"""
+        with self._lock:
+            spans = list(self.spans)
+        origin = min((span["start"] for span in spans), default=0.0)
+        tracks = {MAIN_TRACK: 0}
+        for span in spans:
+            tracks.setdefault(span["track"], len(tracks))
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": self.name}}]
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track}}
+                   for track, tid in tracks.items()]
+        for span in sorted(spans, key=lambda span: span["start"]):
+            name = span["name"] if span["cat"] == STAGE else f"{span['name']} {span['cat']}"
+            events.append({"name": name, "cat": span["cat"], "ph": "X", "pid": 1, "tid": tracks[span["track"]],
+                           "ts": round((span["start"] - origin) * 1e6),
+                           "dur": round(max(span["end"] - span["start"], 0.0) * 1e6), "args": span["args"]})
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"origin": origin}}
+
+    def export(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_chrome(), file)
+        log_info(f"Trace written to {path}.")
+        return path
+
+    def summary(self):
+        """按步骤与类别汇总：次数、总耗时、平均与最大耗时（秒），以及总墙钟时间。"""
+        with self._lock:
+            spans = list(self.spans)
+        rows = {}
+        for span in spans:
+            row = rows.setdefault((span["name"], span["cat"]), [0, 0.0, 0.0])
+            duration = max(span["end"] - span["start"], 0.0)
+            row[0] += 1
+            row[1] += duration
+            row[2] = max(row[2], duration)
+        lines = [f"{'STAGE':<28}{'KIND':<8}{'COUNT':>6}{'TOTAL':>10}{'MEAN':>10}{'MAX':>10}"]
+        for (name, cat), (count, total, longest) in sorted(rows.items()):
+            lines.append(f"{name:<28}{cat:<8}{count:>6}{total:>10.1f}{total / count:>10.1f}{longest:>10.1f}")
+        if spans:
+            wall = max(span["end"] for span in spans) - min(span["start"] for span in spans)
+            lines.append(f"Wall time: {wall:.1f} s")
+        return "\n".join(lines)
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, track=MAIN_TRACK, cat=STAGE, **args):
+    return _tracer.span(name, track, cat, **args)
+
+
+def finish(path, monitor=None):
+    """查询作业时间、导出全局 tracer 的 trace 并输出汇总表。"""
+    _tracer.collect_jobs(monitor)
+    _tracer.export(path)
+    print(_tracer.summary())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="汇总已导出的 trace 文件")
+    parser.add_argument('path', help="trace 文件，例如 trace_MAT.json")
+    args = parser.parse_args()
+    with open(args.path) as file:
+        data = json.load(file)
+    tracer = Tracer()
+    origin = data.get("otherData", {}).get("origin", 0.0)
+    for event in data["traceEvents"]:
+        if event.get("ph") == "X":
+            name = event["name"] if event["cat"] == STAGE else event["name"].rsplit(" ", 1)[0]
+            start = origin + event["ts"] / 1e6
+            tracer.add(name, start, start + event["dur"] / 1e6, cat=event["cat"])
+    print(tracer.summary())
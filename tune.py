@@ -0,0 +1,279 @@
+import os
+import re
+import sys
+import math
+import datetime
+import argparse
+import numpy as np
+import incar
+import potcar
+
+# 目标 k 点间距（Å⁻¹，含 2π，与 VASP 的 KSPACING 定义相同）：DOS 需要较密的网格，
+# Bader/CDD 的自洽计算使用较稀的网格
+KSPACING_DOS = 0.1
+KSPACING_SCF = 0.25
+# 沿某晶轴的原子间最大空隙超过该值（Å）时视为真空方向，该方向只取 Γ 点
+VACUUM_GAP = 6.0
+# 核数未知时沿用原有设置
+DEFAULT_NCORE = 4
+DEFAULT_NBANDS_MULTIPLE = 4
+# 默认核数，也可由计算目录中作业脚本的 #SBATCH 行读取
+CORES = int(os.environ.get("ELECTRONICFLOW_CORES", 0)) or None
+CORES_PER_NODE = int(os.environ.get("ELECTRONICFLOW_CORES_PER_NODE", 0)) or None
+RUN_SCRIPTS = ("std-vasp.slurm", "gam-vasp.slurm")
+SBATCH_RE = re.compile(r"^#SBATCH\s+(--ntasks-per-node|--ntasks|-n|--nodes|-N)[=\s]+(\d+)", re.MULTILINE)
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def read_cell(path):
+    """从 POSCAR/CONTCAR 读取晶格（已乘缩放因子）与分数坐标。"""
+    with open(path) as file:
+        lines = file.read().splitlines()
+    scale = float(lines[1].split()[0])
+    lattice = np.array([[float(x) for x in line.split()[:3]] for line in lines[2:5]]) * scale
+    pos = 5 if lines[5].split()[0].isdigit() else 6
+    natoms = sum(int(x) for x in lines[pos].split())
+    pos += 1
+    if lines[pos].strip()[:1] in ("S", "s"):
+        pos += 1
+    coords = np.array([[float(x) for x in line.split()[:3]] for line in lines[pos + 1:pos + 1 + natoms]])
+    if lines[pos].strip()[:1] in ("C", "c", "K", "k"):
+        coords = np.linalg.solve(lattice.T, (coords * scale).T).T
+    return lattice, coords
+
+
+def plane_spacings(lattice):
+    """各晶轴方向的晶面间距 V / |a_j × a_k|（Å）。"""
+    lattice = np.asarray(lattice, dtype=float)
+    volume = abs(np.linalg.det(lattice))
+    return np.array([volume / np.linalg.norm(np.cross(lattice[(i + 1) % 3], lattice[(i + 2) % 3]))
+                     for i in range(3)])
+
+
+def vacuum_axes(lattice, frac_coords, min_gap=VACUUM_GAP):
+    """返回原子间最大空隙（考虑周期性）超过 min_gap 的晶轴序号。"""
+    heights = plane_spacings(lattice)
+    axes = []
+    for i in range(3):
+        f = np.sort(np.mod(np.asarray(frac_coords)[:, i], 1.0))
+        gap = np.max(np.diff(np.append(f, f[0] + 1.0))) if len(f) else 1.0
+        if gap * heights[i] > min_gap:
+            axes.append(i)
+    return axes
+
+
+def kmesh(lattice, frac_coords, kspacing, min_gap=VACUUM_GAP):
+    """由倒格矢长度与目标间距得到 Γ 中心网格 N_i = ceil(|b_i| / kspacing)，真空方向取 1。"""
+    reciprocal = 2 * np.pi / plane_spacings(lattice)
+    mesh = [max(1, math.ceil(b / kspacing - 1e-6)) for b in reciprocal]
+    for i in vacuum_axes(lattice, frac_coords, min_gap):
+        mesh[i] = 1
+    return tuple(mesh)
+
+
+def irreducible_kpoints(mesh):
+    """只利用时间反演对称估计 Γ 中心网格的不可约 k 点数（不考虑晶体点群，偏保守）。"""
+    total = int(np.prod(mesh))
+    self_inverse = int(np.prod([1 if n % 2 else 2 for n in mesh]))
+    return (total + self_inverse) // 2
+
+
+def script_cores(path):
+    """从作业脚本的 #SBATCH 行读取 (总核数, 每节点核数)，无法确定时返回 (None, None)。"""
+    with open(path) as file:
+        options = dict(SBATCH_RE.findall(file.read()))
+    nodes = int(options.get("--nodes") or options.get("-N") or 1)
+    per_node = options.get("--ntasks-per-node")
+    ntasks = options.get("--ntasks") or options.get("-n")
+    if per_node:
+        return nodes * int(per_node), int(per_node)
+    if ntasks:
+        return int(ntasks), int(ntasks) // nodes
+    return None, None
+
+
+def core_layout(directory=None, cores=None, cores_per_node=None):
+    """核数的来源依次为：参数、目录中的作业脚本、环境变量 ELECTRONICFLOW_CORES。"""
+    if cores is None and directory is not None:
+        for name in RUN_SCRIPTS:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                cores, script_per_node = script_cores(path)
+                cores_per_node = cores_per_node or script_per_node
+                if cores:
+                    break
+    cores = cores or CORES
+    if not cores:
+        return None, None
+    return cores, min(cores_per_node or CORES_PER_NODE or cores, cores)
+
+
+def _divisors(n):
+    return [d for d in range(1, n + 1) if n % d == 0]
+
+
+def parallel_layout(nkpts, cores=None, cores_per_node=None):
+    """
+    返回 (NCORE, KPAR)。KPAR 取节点数中不超过 k 点数的最大约数，使每个 k 点组占据整数个节点；
+    NCORE 取每组核数（不超过单节点核数）中最接近其平方根的约数。核数未知时返回 (4, 1)。
+    """
+    if not cores:
+        return DEFAULT_NCORE, 1
+    cores_per_node = cores_per_node or cores
+    nodes = max(1, cores // cores_per_node)
+    kpar = max(d for d in _divisors(nodes) if d <= max(1, nkpts))
+    group = cores // kpar
+    within_node = math.gcd(group, cores_per_node)
+    ncore = min(_divisors(within_node), key=lambda d: (abs(d - math.sqrt(group)), d))
+    return ncore, kpar
+
+
+def round_nbands(nelect, cores=None, ncore=DEFAULT_NCORE, kpar=1):
+    """
+    NBANDS 为大于 0.6 * NELECT 的最小整数，并向上取整到能带组数 cores / (NCORE * KPAR) 的倍数
+    （VASP 本身也会这样取整，预先取整使实际能带数与成本估计一致）；核数未知时取 4 的倍数。
+    """
+    multiple = max(1, cores // (ncore * kpar)) if cores else DEFAULT_NBANDS_MULTIPLE
+    base = nelect * 0.6
+    nbands = math.floor(base) + 1
+    return -(-nbands // multiple) * multiple
+
+
+def count_electrons(directory, poscar="POSCAR"):
+    """INCAR 中没有 NELECT 时，由 POTCAR 的 ZVAL 与 POSCAR 的原子数计算中性体系的电子数。"""
+    zvals = potcar.read_zvals(os.path.join(directory, "POTCAR"))
+    _, counts = potcar.read_species_counts(os.path.join(directory, poscar))
+    if len(zvals) != len(counts):
+        raise ValueError(f"{directory} 中 POTCAR 与 {poscar} 的元素数不一致")
+    return sum(z * n for z, n in zip(zvals, counts))
+
+
+def read_mesh(path):
+    """读取自动网格 KPOINTS 的第 4 行，非自动网格时返回 None。"""
+    with open(path) as file:
+        lines = file.readlines()
+    try:
+        return tuple(int(x) for x in lines[3].split()[:3])
+    except (IndexError, ValueError):
+        return None
+
+
+def estimate_cost(nkpts, nbands):
+    """相对成本：k 点数 × NBANDS²（子空间对角化与正交化的标度，平面波数不变）。"""
+    return nkpts * nbands ** 2
+
+
+def plan(directory, kspacing=KSPACING_DOS, cores=None, cores_per_node=None, gamma_only=False, nbands=True,
+         poscar="POSCAR"):
+    """
+    为一个计算目录确定 k 网格、NBANDS、NCORE 与 KPAR，并与目录中现有设置比较。
+    gamma_only 为 True 时网格固定为 1 1 1（gam 版本 VASP）；nbands 为 False 时不设置 NBANDS。
+    """
+    lattice, coords = read_cell(os.path.join(directory, poscar))
+    mesh = (1, 1, 1) if gamma_only else kmesh(lattice, coords, kspacing)
+    nkpts = irreducible_kpoints(mesh)
+    cores, cores_per_node = core_layout(directory, cores, cores_per_node)
+    ncore, kpar = parallel_layout(nkpts, cores, cores_per_node)
+    incar_path, kpoints_path = os.path.join(directory, "INCAR"), os.path.join(directory, "KPOINTS")
+    params = incar.Incar.from_file(incar_path) if os.path.isfile(incar_path) else incar.Incar()
+    old_mesh = read_mesh(kpoints_path) if os.path.isfile(kpoints_path) else None
+    result = {"directory": directory, "mesh": mesh, "nkpts": nkpts, "ncore": ncore, "kpar": kpar, "cores": cores,
+              "nbands": None, "old": {"mesh": old_mesh, "nkpts": irreducible_kpoints(old_mesh) if old_mesh else None,
+                                      "nbands": params.get("NBANDS"), "ncore": params.get("NCORE"),
+                                      "kpar": params.get("KPAR")}}
+    if nbands:
+        nelect = params.get("NELECT")
+        try:
+            nelect = float(nelect) if nelect is not None else count_electrons(directory, poscar)
+        except (OSError, ValueError) as e:
+            log_error(f"Failed to determine NELECT in {directory}. Details: {e}")
+            nelect = None
+        if nelect is not None:
+            result["nbands"] = round_nbands(nelect, cores, ncore, kpar)
+    return result
+
+
+def cost_ratio(result):
+    """调整后与调整前的相对成本之比；缺少调整前的网格或 NBANDS 时返回 None。"""
+    old = result["old"]
+    old_nbands = int(old["nbands"]) if old["nbands"] else result["nbands"]
+    if not old["nkpts"] or not old_nbands or not result["nbands"]:
+        return None
+    return estimate_cost(result["nkpts"], result["nbands"]) / estimate_cost(old["nkpts"], old_nbands)
+
+
+def mutations(result):
+    """调整结果对应的 INCAR 修改列表（供 incar.edit 使用）；核数未知时不改动 NCORE 与 KPAR。"""
+    changes = []
+    if result["cores"]:
+        changes.append((incar.SET, "NCORE", str(result["ncore"])))
+        changes.append((incar.SET, "KPAR", str(result["kpar"])) if result["kpar"] > 1 else (incar.REMOVE, "KPAR"))
+    if result["nbands"] is not None:
+        changes.append((incar.SET, "NBANDS", str(result["nbands"])))
+    return changes
+
+
+def apply(result, backup=False):
+    return incar.edit(result["directory"], mutations(result), result["mesh"], backup=backup)
+
+
+def kpoints(structure, kspacing=KSPACING_SCF):
+    """pymatgen 结构对应的 Γ 中心 Kpoints，用于 MITRelaxSet 的 user_kpoints_settings。"""
+    from pymatgen.io.vasp import Kpoints
+    mesh = kmesh(structure.lattice.matrix, structure.frac_coords, kspacing)
+    return Kpoints.gamma_automatic(mesh)
+
+
+def parallel_settings(kpoints_obj, cores=None, cores_per_node=None):
+    """给定 Kpoints 的 NCORE/KPAR 设置（字典），核数取自参数或环境变量。"""
+    cores, cores_per_node = core_layout(None, cores, cores_per_node)
+    ncore, kpar = parallel_layout(irreducible_kpoints(kpoints_obj.kpts[0]), cores, cores_per_node)
+    return {"NCORE": ncore, "KPAR": kpar} if kpar > 1 else {"NCORE": ncore}
+
+
+def report(results):
+    lines = [f"{'DIRECTORY':<40}{'KPOINTS':<18}{'NKPT':<10}{'NBANDS':<12}{'NCORE':<10}{'KPAR':<8}{'COST':>8}"]
+    for result in results:
+        old = result["old"]
+        mesh = lambda m: "x".join(map(str, m)) if m else "-"
+        ratio = cost_ratio(result)
+        lines.append(f"{result['directory']:<40}{mesh(old['mesh']) + '->' + mesh(result['mesh']):<18}"
+                     f"{str(old['nkpts']) + '->' + str(result['nkpts']):<10}"
+                     f"{str(old['nbands'] or '-') + '->' + str(result['nbands'] or '-'):<12}"
+                     f"{str(old['ncore'] or '-') + '->' + str(result['ncore']):<10}"
+                     f"{str(old['kpar'] or '-') + '->' + str(result['kpar']):<8}"
+                     f"{(f'x{ratio:.2f}' if ratio is not None else '-'):>8}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按晶格与核数调整 k 网格、NBANDS、NCORE 与 KPAR（默认只输出预估）")
+    parser.add_argument('directories', nargs='+', help="一个或多个计算目录")
+    parser.add_argument('--kspacing', type=float, default=KSPACING_DOS, help="目标 k 点间距（Å⁻¹，含 2π）")
+    parser.add_argument('--cores', type=int, default=None, help="总核数（默认取作业脚本或 ELECTRONICFLOW_CORES）")
+    parser.add_argument('--cores-per-node', type=int, default=None, help="每节点核数")
+    parser.add_argument('--gamma', action='store_true', help="只用 Γ 点（gam 版本 VASP）")
+    parser.add_argument('--no-nbands', action='store_true', help="不设置 NBANDS")
+    parser.add_argument('--poscar', default="POSCAR", help="结构文件名")
+    parser.add_argument('--apply', action='store_true', help="写入 INCAR 与 KPOINTS")
+    parser.add_argument('--backup', action='store_true', help="首次修改前保存 .bak")
+    args = parser.parse_args()
+    results = []
+    for directory in args.directories:
+        try:
+            results.append(plan(directory, args.kspacing, args.cores, args.cores_per_node, args.gamma,
+                                not args.no_nbands, args.poscar))
+        except (OSError, ValueError, IndexError) as e:
+            log_error(f"Failed to tune {directory}. Details: {e}")
+    print(report(results))
+    if args.apply:
+        for result in results:
+            files = apply(result, args.backup)
+            log_info(f"{result['directory']}: {', '.join(files) if files else 'unchanged'}")
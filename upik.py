@@ -1,9 +1,10 @@
 import os
-import re
 import sys
-import shutil
 import argparse
-import math
+import functools
+import incar
+import tune
+import handoff
 
 # 定义需要修改的参数（不包括 NBANDS）
 params_to_modify = {
@@ -18,92 +19,64 @@ params_to_add = {
     "LASPH": "True",
     "LVHAR": "False",
     "NEDOS": "2001",
+    "LORBIT": "11",
     "KPOINT_BSE": "-1 0 0 0"
 }
 
-def backup_file(file_path):
-    backup_path = file_path + ".bak"
-    shutil.copy(file_path, backup_path)
-    print(f"已备份文件到: {backup_path}")
+# 无法读取结构时使用的默认网格；能读取时由 tune 按晶格与目标 k 点间距确定
+KPOINTS_MESH = (6, 6, 1)
 
-def calculate_nbands(lines):
+def calculate_nbands(params):
     """
-    从 INCAR 内容中读取 NELECT 的值，并计算 NBANDS：
+    从 INCAR 中读取 NELECT 的值，并计算 NBANDS：
     NBANDS 为大于 (NELECT * 0.6) 且能被4整除的最小整数。
+    核数已知时改为能带组数的倍数，见 tune.round_nbands。
     """
-    for line in lines:
-        m = re.search(r'^NELECT\s*=\s*(\S+)', line, re.IGNORECASE)
-        if m:
-            try:
-                nelect = float(m.group(1))
-                base_value = nelect * 0.6
-                nbands = math.ceil(base_value)
-                while nbands % 4 != 0 or nbands <= base_value:
-                    nbands += 1
-                return nbands
-            except Exception as e:
-                print(f"计算 NBANDS 时出错: {e}")
-                return None
-    print("在 INCAR 文件中未找到 NELECT 参数。")
-    return None
-
-def edit_incar(incar_path):
-    with open(incar_path, 'r') as file:
-        lines = file.readlines()
-
-    # 修改已存在的参数
-    for i, line in enumerate(lines):
-        for param, value in params_to_modify.items():
-            if re.search(rf"^{param}\s*=", line, re.IGNORECASE):
-                lines[i] = f"{param} = {value}\n"
-                break
-
-    # 计算 NBANDS 值，并确保其为大于 NELECT×0.6 且能被4整除的最小整数
-    nbands_value = calculate_nbands(lines)
-    if nbands_value is not None:
-        nbands_str = str(nbands_value)
-    else:
-        nbands_str = "420"
-
-    nbands_found = False
-    for i, line in enumerate(lines):
-        if re.search(r"^NBANDS\s*=", line, re.IGNORECASE):
-            lines[i] = f"NBANDS = {nbands_str}\n"
-            nbands_found = True
-            break
-    if not nbands_found:
-        lines.append(f"NBANDS = {nbands_str}\n")
+    value = params.get("NELECT")
+    if value is None:
+        print("在 INCAR 文件中未找到 NELECT 参数。")
+        return None
+    try:
+        return tune.round_nbands(float(value))
+    except Exception as e:
+        print(f"计算 NBANDS 时出错: {e}")
+        return None
+
+def nbands_value(params, tuned=None):
+    # tuned 为 tune.plan 的结果（NELECT 缺失时由 POTCAR 计算）；无法计算时使用 420
+    nbands = tuned["nbands"] if tuned else calculate_nbands(params)
+    nbands_str = str(nbands) if nbands is not None else "420"
     print(f"NBANDS 参数已设置为: {nbands_str}")
+    return nbands_str
 
-    # 添加其它新参数
-    for param, value in params_to_add.items():
-        if not any(re.search(rf"^{param}\s*=", line, re.IGNORECASE) for line in lines):
-            lines.append(f"{param} = {value}\n")
+# 修改已存在的参数 -> 计算 NBANDS（-> 并行设置）-> 添加其它新参数，一次解析、一次写入
+def build_mutations(nbands, parallel=()):
+    return ([(incar.REPLACE, param, value) for param, value in params_to_modify.items()]
+            + [(incar.SET, "NBANDS", nbands)]
+            + list(parallel)
+            + [(incar.DEFAULT, param, value) for param, value in params_to_add.items()])
 
-    with open(incar_path, 'w') as file:
-        file.writelines(lines)
-    print(f"INCAR 文件已更新: {incar_path}")
+INCAR_MUTATIONS = build_mutations(nbands_value)
 
-def edit_kpoints(kpoints_path):
-    with open(kpoints_path, 'r') as file:
-        lines = file.readlines()
-
-    if len(lines) < 4:
-        print(f"错误: KPOINTS 文件 ({kpoints_path}) 行数不足，跳过处理。")
-        return
-
-    lines[3] = "6 6 1\n"
-
-    with open(kpoints_path, 'w') as file:
-        file.writelines(lines)
-    print(f"KPOINTS 文件已更新: {kpoints_path}")
+def tuned_inputs(target_dir):
+    """
+    按 4-dos 目录的结构与核数确定 k 网格、NBANDS、NCORE 与 KPAR（见 tune.plan），
+    返回 (INCAR 修改列表, k 网格)；无法读取结构时沿用默认设置。
+    """
+    try:
+        tuned = tune.plan(target_dir, tune.KSPACING_DOS)
+    except (OSError, ValueError, IndexError) as e:
+        print(f"警告: 无法按结构调整 k 网格 ({e})，使用默认设置。")
+        return INCAR_MUTATIONS, KPOINTS_MESH
+    print(tune.report([tuned]))
+    parallel = [mutation for mutation in tune.mutations(tuned) if mutation[1] != "NBANDS"]
+    return build_mutations(functools.partial(nbands_value, tuned=tuned), parallel), tuned["mesh"]
 
 def main(MAT, adsorbates):
     # 确保脚本在 Support 目录下运行
     current_dir = os.getcwd()
     if os.path.basename(current_dir) != "Support":
-        print("错误: 脚本必须在 Support 目录下运行。")
-        sys.exit(1)
+        raise RuntimeError(f"脚本必须在 Support 目录下运行（当前目录：{current_dir}）。")
 
     parent_dir = os.path.dirname(current_dir)
     for adsorbate in adsorbates:
@@ -114,22 +87,33 @@ def main(MAT, adsorbates):
             continue
 
         incar_path = os.path.join(target_dir, "INCAR")
-        if os.path.exists(incar_path):
-            backup_file(incar_path)
-            edit_incar(incar_path)
-        else:
-            print(f"警告: 未找到 INCAR 文件 ({incar_path})，跳过处理。")
-
         kpoints_path = os.path.join(target_dir, "KPOINTS")
-        if os.path.exists(kpoints_path):
-            backup_file(kpoints_path)
-            edit_kpoints(kpoints_path)
-        else:
+        has_incar, has_kpoints = os.path.exists(incar_path), os.path.exists(kpoints_path)
+        if not has_incar:
+            print(f"警告: 未找到 INCAR 文件 ({incar_path})，跳过处理。")
+        if not has_kpoints:
             print(f"警告: 未找到 KPOINTS 文件 ({kpoints_path})，跳过处理。")
+        mutations, mesh = tuned_inputs(target_dir)
+        # 首次修改前备份为 .bak，重复运行不覆盖原始备份
+        try:
+            changed = incar.edit(target_dir, mutations if has_incar else (),
+                                 mesh if has_kpoints else None, backup=True)
+        except ValueError as e:
+            print(f"错误: {e}，跳过处理。")
+            continue
+        for name in changed:
+            print(f"{name} 文件已更新: {os.path.join(target_dir, name)}")
+        # 非自洽计算读取 gam 步骤在同一目录写出的 CHGCAR，gam 版本的 WAVECAR 不再读取
+        if has_incar and not handoff.prepare_nscf(target_dir, backup=True):
+            print(f"警告: {target_dir} 中没有可用的 CHGCAR，非自洽计算将无法进行。")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="修改 INCAR 和 KPOINTS 文件并备份（支持多个 adsorbate）")
     parser.add_argument('MAT', type=str, help="MAT 目录名称（4-dos/MAT）")
     parser.add_argument('adsorbate', nargs='+', help="一个或多个 adsorbate 目录名称")
     args = parser.parse_args()
-    main(args.MAT, args.adsorbate)
+    try:
+        main(args.MAT, args.adsorbate)
+    except RuntimeError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
@@ -1,37 +1,27 @@
 import os
 import shutil
 import argparse
-import re
 import sys
+import incar
+import tune
+import handoff
 
-def edit_incar(incar_path):
-    with open(incar_path, 'r') as file:
-        lines = file.readlines()
+# 更新 INCAR 文件内容：修改已有的 IBRION、LCHARG、NSW 参数
+INCAR_MUTATIONS = [
+    (incar.REPLACE, "IBRION", "-1"),
+    (incar.REPLACE, "LCHARG", ".TRUE."),
+    (incar.REPLACE, "NSW", "2"),
+]
+# KPOINTS 第4行改为 "1 1 1"：gam 作业使用 Γ 点版本的 VASP，网格不做调整
+KPOINTS_MESH = (1, 1, 1)
 
-    # 更新 INCAR 文件内容：修改 IBRION、LCHARG、NSW 参数
-    for i, line in enumerate(lines):
-        if re.search(r"IBRION", line):
-            lines[i] = re.sub(r"IBRION\s*=\s*\S+", "IBRION = -1", line)
-        elif re.search(r"LCHARG", line):
-            lines[i] = re.sub(r"LCHARG\s*=\s*\S+", "LCHARG = .TRUE.", line)
-        elif re.search(r"NSW", line):
-            lines[i] = re.sub(r"NSW\s*=\s*\S+", "NSW = 2", line)
-
-    with open(incar_path, 'w') as file:
-        file.writelines(lines)
-    print(f"INCAR 文件已更新: {incar_path}")
-
-def edit_kpoints(kpoints_path):
-    with open(kpoints_path, 'r') as file:
-        lines = file.readlines()
-
-    # 修改第4行为 "1 1 1"
-    if len(lines) >= 4:
-        lines[3] = "1 1 1\n"
-
-    with open(kpoints_path, 'w') as file:
-        file.writelines(lines)
-    print(f"KPOINTS 文件已更新: {kpoints_path}")
+def parallel_mutations(target_dir):
+    """按作业核数设置 NCORE（Γ 点计算 KPAR 为 1）；核数未知或无法读取结构时不改动。"""
+    try:
+        return tune.mutations(tune.plan(target_dir, gamma_only=True, nbands=False))
+    except (OSError, ValueError, IndexError) as e:
+        print(f"警告: 无法确定并行设置 ({e})。")
+        return []
 
 def process_directory(mat_dir, dos_dir):
     files_to_copy = ["INCAR", "CONTCAR", "KPOINTS", "POTCAR"]
@@ -52,24 +42,32 @@ def process_directory(mat_dir, dos_dir):
         else:
             print(f"警告: {file_name} 在 {mat_dir} 中未找到")
 
-    incar_path = os.path.join(dos_dir, os.path.basename(mat_dir), "INCAR")
-    if os.path.exists(incar_path):
-        edit_incar(incar_path)
-    else:
-        print(f"错误: 在 {os.path.join(dos_dir, os.path.basename(mat_dir))} 中未找到 INCAR 文件。")
-
-    kpoints_path = os.path.join(dos_dir, os.path.basename(mat_dir), "KPOINTS")
-    if os.path.exists(kpoints_path):
-        edit_kpoints(kpoints_path)
-    else:
-        print(f"错误: 在 {os.path.join(dos_dir, os.path.basename(mat_dir))} 中未找到 KPOINTS 文件。")
+    # INCAR 与 KPOINTS 各解析、写入一次
+    target_dir = os.path.join(dos_dir, os.path.basename(mat_dir))
+    has_incar = os.path.exists(os.path.join(target_dir, "INCAR"))
+    has_kpoints = os.path.exists(os.path.join(target_dir, "KPOINTS"))
+    if not has_incar:
+        print(f"错误: 在 {target_dir} 中未找到 INCAR 文件。")
+    if not has_kpoints:
+        print(f"错误: 在 {target_dir} 中未找到 KPOINTS 文件。")
+    try:
+        mutations = INCAR_MUTATIONS + parallel_mutations(target_dir)
+        changed = incar.edit(target_dir, mutations if has_incar else (),
+                             KPOINTS_MESH if has_kpoints else None)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return
+    for name in changed:
+        print(f"{name} 文件已更新: {os.path.join(target_dir, name)}")
+    # 以结构优化的 CHGCAR 为初始密度；WAVECAR 来自 std 版本 VASP，gam 版本不能读取
+    if has_incar:
+        handoff.handoff(mat_dir, target_dir, files=("CHGCAR",))
 
 def main(MAT, adsorbates):
     # 确保脚本在 Support 目录下运行
     current_dir = os.getcwd()
     if os.path.basename(current_dir) != "Support":
-        print("错误: 脚本必须在 Support 目录下运行。")
-        sys.exit(1)
+        raise RuntimeError(f"脚本必须在 Support 目录下运行（当前目录：{current_dir}）。")
 
     parent_dir = os.path.dirname(current_dir)
     for adsorbate in adsorbates:
@@ -88,4 +86,8 @@ if __name__ == "__main__":
     parser.add_argument('MAT', type=str, help="MAT 目录名称")
     parser.add_argument('adsorbate', nargs='+', help="一个或多个 adsorbate 目录名称")
     args = parser.parse_args()
-    main(args.MAT, args.adsorbate)
+    try:
+        main(args.MAT, args.adsorbate)
+    except RuntimeError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
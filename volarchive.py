@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import zlib
+import zipfile
+import datetime
+import argparse
+import concurrent.futures
+import numpy as np
+from chgcar import index_chgcar, iter_slabs, block_end, write_chgcar
+import throttle
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_SUFFIX = ".efz"
+VOLUMETRIC_FILES = ["CHGCAR", "AECCAR0", "AECCAR1", "AECCAR2", "CHGCAR_sum", "CHGCAR_diff", "LOCPOT"]
+# 每个压缩块的目标数值个数（约 8 MB 原始数据）
+CHUNK_VALUES = 1024 * 1024
+
+
+def log_info(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: {message}")
+
+
+def log_error(message):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {message}", file=sys.stderr)
+
+
+def _compress(values, codec, level):
+    # 按字节位重排（shuffle）后压缩，浮点数的指数字节聚在一起，压缩率明显提高
+    data = np.ascontiguousarray(values, dtype='<f8').view(np.uint8).reshape(-1, 8).T.tobytes()
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return zlib.compress(data, level)
+
+
+def _decompress(data, codec, count):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("读取该归档需要 zstandard 模块")
+        data = zstandard.ZstdDecompressor().decompress(data, max_output_size=count * 8)
+    else:
+        data = zlib.decompress(data)
+    return np.frombuffer(data, dtype=np.uint8).reshape(8, count).T.copy().view('<f8').ravel()
+
+
+def _chunk_name(spin, z):
+    return f"block{spin}/{z:06d}.bin"
+
+
+def archive(path, output=None, codec=None, level=None, nz_chunk=None):
+    """
+    将 CHGCAR 类体数据文件转换为分块压缩归档（zip 容器）：
+    头部与原子信息原样保存，每个自旋数据块沿 z 方向分块压缩，
+    数据块之后的增广占据数等附加文本也原样保存，以便无损导出。返回归档路径。
+    """
+    output = output or path + ARCHIVE_SUFFIX
+    codec = codec or ("zstd" if zstandard is not None else "zlib")
+    if codec == "zstd" and zstandard is None:
+        raise ImportError("zstd 压缩需要 zstandard 模块")
+    level = level if level is not None else (10 if codec == "zstd" else 6)
+    index = index_chgcar(path)
+    nx, ny, nz = index["grid"]
+    nz_chunk = nz_chunk or max(1, CHUNK_VALUES // (nx * ny))
+    with open(path, 'rb') as file:
+        size = file.seek(0, os.SEEK_END)
+        tails = []
+        for spin in range(len(index["blocks"])):
+            start = block_end(index, spin)
+            end = index["blocks"][spin + 1] if spin + 1 < len(index["blocks"]) else size
+            file.seek(start)
+            tails.append(file.read(end - start).decode())
+    meta = {
+        "name": os.path.basename(path), "grid": [nx, ny, nz], "nblocks": len(index["blocks"]),
+        "nz_chunk": nz_chunk, "codec": codec, "dtype": "<f8", "shuffle": True,
+        "lattice": index["lattice"].tolist(), "species": index["species"], "counts": index["counts"],
+        "tails": tails,
+    }
+    tmp_path = output + ".tmp"
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        zf.writestr("header.txt", index["header"], compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("meta.json", json.dumps(meta), compress_type=zipfile.ZIP_DEFLATED)
+        for spin in range(len(index["blocks"])):
+            z = 0
+            for slab in iter_slabs(index, spin, nz_chunk):
+                zf.writestr(_chunk_name(spin, z), _compress(np.ravel(slab, order='F'), codec, level))
+                z += slab.shape[2]
+    os.replace(tmp_path, output)
+    return output
+
+
+class Archive:
+    """
+    体数据归档的惰性读取器：只解压所需的 z 分块。
+    可读取任意 z 范围、单个自旋通道或逐块计算的平面平均，也可导出回 CHGCAR 文本。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        self.meta = json.loads(self.zip.read("meta.json"))
+        self.header = self.zip.read("header.txt")
+        self.grid = tuple(self.meta["grid"])
+        self.nblocks = self.meta["nblocks"]
+        self.lattice = np.array(self.meta["lattice"])
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _chunk(self, spin, z):
+        nx, ny, nz = self.grid
+        k = min(self.meta["nz_chunk"], nz - z)
+        values = _decompress(self.zip.read(_chunk_name(spin, z)), self.meta["codec"], nx * ny * k)
+        return values.reshape((nx, ny, k), order='F')
+
+    def iter_slabs(self, spin=0):
+        """与 chgcar.iter_slabs 相同，按 z 分块依次产出 (NGX, NGY, k) 数组。"""
+        if spin >= self.nblocks:
+            raise ValueError(f"{self.path} 中不存在第 {spin} 个数据块")
+        for z in range(0, self.grid[2], self.meta["nz_chunk"]):
+            yield self._chunk(spin, z)
+
+    def read_slab(self, z0, z1, spin=0):
+        """读取 [z0, z1) 范围的层，只解压与之重叠的分块。"""
+        nx, ny, nz = self.grid
+        if not 0 <= z0 < z1 <= nz:
+            raise ValueError(f"z 范围 [{z0}, {z1}) 超出 0..{nz}")
+        step = self.meta["nz_chunk"]
+        out = np.empty((nx, ny, z1 - z0))
+        for z in range(z0 - z0 % step, z1, step):
+            chunk = self._chunk(spin, z)
+            lo, hi = max(z0, z), min(z1, z + chunk.shape[2])
+            out[:, :, lo - z0:hi - z0] = chunk[:, :, lo - z:hi - z]
+        return out
+
+    def read_block(self, spin=0):
+        """读取完整的单个自旋通道。"""
+        return self.read_slab(0, self.grid[2], spin)
+
+    def planar_average(self, spin=0):
+        """沿 z 的平面平均，逐块计算，不保留完整格点。"""
+        return np.concatenate([chunk.mean(axis=(0, 1)) for chunk in self.iter_slabs(spin)])
+
+    def export(self, output):
+        """导出回 CHGCAR 文本格式（包括增广占据数等附加数据）。"""
+        write_chgcar(output, self.header, *(self.iter_slabs(spin) for spin in range(self.nblocks)),
+                     tails=self.meta["tails"])
+        return output
+
+
+def verify(path, archive_path):
+    """逐块比较原文件与归档中的数值是否完全一致。"""
+    index = index_chgcar(path)
+    with Archive(archive_path) as arc:
+        if tuple(index["grid"]) != arc.grid or len(index["blocks"]) != arc.nblocks:
+            return False
+        for spin in range(arc.nblocks):
+            for a, b in zip(iter_slabs(index, spin, arc.meta["nz_chunk"]), arc.iter_slabs(spin)):
+                if not np.array_equal(a, b):
+                    return False
+    return True
+
+
+def archive_file(path, remove=False, codec=None):
+    """归档单个文件；remove 为 True 时校验一致后删除原文件。返回 (原大小, 归档大小)。"""
+    output = archive(path, codec=codec)
+    sizes = (os.path.getsize(path), os.path.getsize(output))
+    if remove:
+        if not verify(path, output):
+            os.remove(output)
+            raise ValueError(f"{path} 归档校验失败，已保留原文件")
+        os.remove(path)
+    return sizes
+
+
+def find_volumetric(root):
+    """查找 root 下（包括 support/adsorbate 片段目录）的所有体数据文件。"""
+    paths = []
+    for directory, _, files in os.walk(root):
+        paths.extend(os.path.join(directory, name) for name in files if name in VOLUMETRIC_FILES)
+    return sorted(paths)
+
+
+def archive_tree(root, remove=False, codec=None):
+    """在全局节流器的共享进程池中归档 root（如 <ads>/3-bader/<MAT>）下的所有体数据文件，返回成功归档的文件数。"""
+    paths = find_volumetric(root)
+    done, before, after = 0, 0, 0
+    futures = {throttle.submit_local(archive_file, path, remove, codec): path for path in paths}
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            original, compressed = future.result()
+        except (OSError, ValueError, ImportError) as e:
+            log_error(f"Failed to archive {futures[future]}. Details: {e}")
+            continue
+        done += 1
+        before += original
+        after += compressed
+    if done:
+        log_info(f"Archived {done} of {len(paths)} volumetric files under {root}: "
+                 f"{before / 1024 ** 2:.1f} MB -> {after / 1024 ** 2:.1f} MB.")
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="体数据文件的分块压缩归档")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    p = subparsers.add_parser("archive", help="归档文件或目录树中的体数据文件")
+    p.add_argument('paths', nargs='+', help="体数据文件或目录")
+    p.add_argument('--remove', action='store_true', help="校验一致后删除原文件")
+    p.add_argument('--codec', choices=["zlib", "zstd"], default=None, help="压缩方式（缺省时优先 zstd）")
+    p.add_argument('-j', '--jobs', type=int, default=None, help="并行进程数")
+    p = subparsers.add_parser("export", help="将归档导出为 CHGCAR 文本")
+    p.add_argument('archive', help="归档文件")
+    p.add_argument('output', help="输出文件")
+    p = subparsers.add_parser("average", help="输出沿 z 的平面平均")
+    p.add_argument('archive', help="归档文件")
+    p.add_argument('--spin', type=int, default=0, help="数据块序号（0 为总密度，1 为磁化密度）")
+    args = parser.parse_args()
+
+    if args.action == "archive":
+        throttle.configure(max_workers=args.jobs)
+        for path in args.paths:
+            if os.path.isdir(path):
+                archive_tree(path, args.remove, args.codec)
+            else:
+                archive_file(path, args.remove, args.codec)
+    elif args.action == "export":
+        with Archive(args.archive) as arc:
+            arc.export(args.output)
+    else:
+        with Archive(args.archive) as arc:
+            c = arc.lattice[2]
+            dz = np.linalg.norm(c) / arc.grid[2]
+            for k, value in enumerate(arc.planar_average(args.spin)):
+                print(f"{k * dz:12.6f}{value:20.10E}")